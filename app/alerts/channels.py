@@ -0,0 +1,172 @@
+import logging
+import os
+import smtplib
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import Dict, List, Optional
+
+import requests
+
+from app.utils.crypto import decrypt
+from app.utils.tracing import traced
+
+HTTP_TIMEOUT_SECONDS = 10
+
+
+class NotificationChannel(ABC):
+    """One way of reaching users, with its own worker pool and recipients per request.
+
+    deliver() splits the recipients into chunks of at most max_batch and sends
+    them concurrently on the channel's workers, so a slow channel or a long
+    recipient list does not hold up the others.
+    """
+    name = 'channel'
+
+    def __init__(self, max_batch: int = 50, workers: int = 4):
+        self.max_batch = max(1, max_batch)
+        self.workers = max(1, workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'notify-{self.name}')
+        self.stats = {'sent': 0, 'failed': 0, 'batches': 0}
+        self._stats_lock = threading.Lock()
+
+    @abstractmethod
+    def address(self, user_id, account: dict) -> Optional[str]:
+        """Where this channel reaches a user, None when the user has not set it up."""
+
+    @abstractmethod
+    def send_batch(self, message: str, title: str, recipients: List[str]) -> bool:
+        """Send one request to the recipients, True when it was accepted."""
+
+    def _send_chunk(self, message: str, title: str, recipients: List[str]) -> bool:
+        try:
+            ok = self.send_batch(message, title, recipients)
+        except Exception as e:
+            logging.error(f'Error sending {self.name} notification: {e}')
+            ok = False
+        with self._stats_lock:
+            self.stats['batches'] += 1
+            self.stats['sent' if ok else 'failed'] += len(recipients)
+        return ok
+
+    def deliver(self, message: str, title: str, recipients: List[str]) -> List[tuple]:
+        """(chunk, future) per chunk of recipients, the future resolving to whether that chunk was accepted."""
+        chunks = [recipients[i:i + self.max_batch] for i in range(0, len(recipients), self.max_batch)]
+        return [(chunk, self._pool.submit(self._send_chunk, message, title, chunk)) for chunk in chunks]
+
+    def shutdown(self) -> None:
+        # chunks already submitted still go out
+        self._pool.shutdown(wait=False)
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats, max_batch=self.max_batch, workers=self.workers)
+
+
+class AlertzyChannel(NotificationChannel):
+    """Alertzy push; one request reaches several accounts with their keys joined by '_'."""
+    name = 'alertzy'
+
+    def __init__(self, url: Optional[str] = None, max_batch: int = 20, workers: int = 4):
+        super().__init__(max_batch, workers)
+        self.url = url or os.getenv('ALERTZY_URL', 'https://alertzy.app/send')
+
+    def address(self, user_id, account: dict) -> Optional[str]:
+        if not account.get('account_id'):
+            return None
+        return decrypt(account['account_id'], os.getenv('ENCRYPT_KEY'))
+
+    @traced('notify.alertzy')
+    def send_batch(self, message: str, title: str, recipients: List[str]) -> bool:
+        payload = {
+            'accountKey': '_'.join(recipients),
+            'title': title,
+            'message': message
+        }
+        response = requests.post(self.url, json=payload, timeout=HTTP_TIMEOUT_SECONDS)
+        if response.status_code == 200:
+            logging.debug('Notification sent successfully')
+            return True
+        logging.error(f'Failed to send notification. Status Code: {response.status_code}, Response: {response.text}')
+        return False
+
+
+class WebhookChannel(NotificationChannel):
+    """POSTs the message and the recipients' user ids as JSON to a URL, for bots and bridges."""
+    name = 'webhook'
+
+    def __init__(self, url: str, max_batch: int = 100, workers: int = 4, headers: Optional[dict] = None):
+        super().__init__(max_batch, workers)
+        self.url = url
+        self.headers = headers or {}
+
+    def address(self, user_id, account: dict) -> Optional[str]:
+        return str(user_id)
+
+    @traced('notify.webhook')
+    def send_batch(self, message: str, title: str, recipients: List[str]) -> bool:
+        payload = {'title': title, 'message': message, 'users': recipients}
+        response = requests.post(self.url, json=payload, headers=self.headers, timeout=HTTP_TIMEOUT_SECONDS)
+        if 200 <= response.status_code < 300:
+            return True
+        logging.error(f'Webhook {self.url} answered {response.status_code}: {response.text}')
+        return False
+
+
+class EmailChannel(NotificationChannel):
+    """Plain-text email over SMTP, one message per chunk with the recipients in Bcc."""
+    name = 'email'
+
+    def __init__(self, host: str = 'localhost', port: int = 25, sender: str = 'stocklerts@localhost',
+                 starttls: bool = False, max_batch: int = 50, workers: int = 2):
+        super().__init__(max_batch, workers)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.starttls = starttls
+        self.username = os.getenv('SMTP_USERNAME')
+        self.password = os.getenv('SMTP_PASSWORD')
+
+    def address(self, user_id, account: dict) -> Optional[str]:
+        return account.get('email')
+
+    @traced('notify.email')
+    def send_batch(self, message: str, title: str, recipients: List[str]) -> bool:
+        email = EmailMessage()
+        email['Subject'] = title
+        email['From'] = self.sender
+        email['To'] = self.sender
+        email.set_content(message)
+        with smtplib.SMTP(self.host, self.port, timeout=HTTP_TIMEOUT_SECONDS) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or '')
+            refused = smtp.send_message(email, to_addrs=recipients)
+        # addresses the server rejects will not be accepted on a retry either
+        if refused:
+            logging.error(f'SMTP server refused {sorted(refused)}')
+        return True
+
+
+CHANNEL_TYPES = {
+    'alertzy': AlertzyChannel,
+    'webhook': WebhookChannel,
+    'email': EmailChannel,
+}
+
+
+def build_channels(channels_config: Optional[Dict[str, dict]]) -> List[NotificationChannel]:
+    """Enabled channels from notifications.channels, Alertzy alone when the section is missing."""
+    if not channels_config:
+        return [AlertzyChannel()]
+    channels = []
+    for name, settings in channels_config.items():
+        settings = dict(settings or {})
+        if not settings.pop('enabled', True):
+            continue
+        if name not in CHANNEL_TYPES:
+            raise ValueError(f'Unknown notification channel {name!r}')
+        channels.append(CHANNEL_TYPES[name](**settings))
+    return channels
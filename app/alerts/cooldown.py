@@ -0,0 +1,181 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.database.db_manager import DBManager
+
+
+class TickerSubscribers:
+    """Threshold subscriptions and cooldown state of one ticker as packed arrays.
+
+    Every (threshold, user) pair from the config is a row of thresholds/pair_sub;
+    pair_sub points into the per subscriber arrays, which hold the dense user
+    id plus the alerted flag and last alerted change (NaN when unset).
+    """
+    __slots__ = ('thresholds', 'pair_sub', 'users', 'alerted', 'last_thresh', 'positions')
+
+    def __init__(self, thresholds: List[float], pair_users: List[int]):
+        subscribers = list(dict.fromkeys(pair_users))
+        self.positions = {user: pos for pos, user in enumerate(subscribers)}
+        self.thresholds = np.array(thresholds, dtype=np.float64)
+        self.pair_sub = np.array([self.positions[u] for u in pair_users], dtype=np.int32)
+        self.users = np.array(subscribers, dtype=np.int32)
+        self.alerted = np.zeros(len(subscribers), dtype=np.bool_)
+        self.last_thresh = np.full(len(subscribers), np.nan, dtype=np.float64)
+
+
+class CooldownStore:
+    """In-memory cooldown and daily-limit state for the threshold tracker.
+
+    Users are mapped to dense ids so notify_thresh and the daily counts are
+    flat arrays, and evaluating a quote against all of a ticker's subscribers
+    is a handful of vectorized comparisons. SQLite stays the durable copy:
+    state is bulk loaded once and every change is written through.
+    """
+
+    def __init__(self, ticker_config: dict, user_notify_thresh: dict, db_manager: DBManager):
+        self.db_manager = db_manager
+        user_ids = list(user_notify_thresh)
+        for thresholds in ticker_config.values():
+            for threshold_config in thresholds:
+                user_ids.extend(threshold_config['users'])
+        self.user_ids = list(dict.fromkeys(user_ids))
+        self.user_index = {user_id: idx for idx, user_id in enumerate(self.user_ids)}
+
+        self.notify_thresh = np.array([user_notify_thresh.get(u, 0.0) for u in self.user_ids], dtype=np.float64)
+        self.counts = np.zeros(len(self.user_ids), dtype=np.int64)
+        self._lock = threading.Lock()
+
+        self.tickers: Dict[str, TickerSubscribers] = {}
+        for ticker, thresholds in ticker_config.items():
+            values, pair_users = [], []
+            for threshold_config in thresholds:
+                for user_id in threshold_config['users']:
+                    values.append(threshold_config['value'])
+                    pair_users.append(self.user_index[user_id])
+            self.tickers[ticker] = TickerSubscribers(values, pair_users)
+
+    def load(self) -> None:
+        """Fill the arrays from the database with one query per table."""
+        # ticker_states.user_id is a string column
+        by_key = {str(user_id): idx for user_id, idx in self.user_index.items()}
+        states = self.db_manager.load_ticker_states()
+        for (user_id, ticker), (alerted, thresh) in states.items():
+            subscribers = self.tickers.get(ticker)
+            idx = by_key.get(str(user_id))
+            if subscribers is None or idx not in subscribers.positions:
+                continue
+            pos = subscribers.positions[idx]
+            subscribers.alerted[pos] = bool(alerted)
+            subscribers.last_thresh[pos] = np.nan if thresh is None else thresh
+
+        counts = self.db_manager.load_notification_counts()
+        with self._lock:
+            for user_id, count in counts.items():
+                idx = by_key.get(str(user_id))
+                if idx is not None:
+                    self.counts[idx] = count
+        logging.warning(f'Loaded cooldown state for {len(self.user_ids)} users and {len(self.tickers)} tickers')
+
+    def eligible(self, ticker: str, percentage_change: float, max_notifications: int) -> List:
+        """Users whose threshold was crossed, who are under the daily limit and out of cooldown."""
+        subscribers = self.tickers.get(ticker)
+        if subscribers is None or not len(subscribers.thresholds):
+            return []
+
+        thresholds = subscribers.thresholds
+        # positive thresholds fire at or above, negative ones at or below
+        crossed = np.where(thresholds >= 0, percentage_change >= thresholds, percentage_change <= thresholds)
+        if not crossed.any():
+            return []
+
+        pair_sub = subscribers.pair_sub[crossed]
+        pair_thresh = thresholds[crossed]
+        users = subscribers.users[pair_sub]
+        counts = self.counts[users]
+
+        near_limit = counts == 0.9 * max_notifications
+        if near_limit.any():
+            for idx in np.unique(users[near_limit]):
+                logging.info('User %s has almost reached the daily notification limit.', self.user_ids[idx],
+                             extra={'user': self.user_ids[idx]})
+        over_limit = counts >= max_notifications
+        if over_limit.any():
+            for idx in np.unique(users[over_limit]):
+                logging.warning('User %s has reached the daily notification limit.', self.user_ids[idx],
+                                extra={'user': self.user_ids[idx]})
+
+        # cooldown: once alerted, wait for a further notify_thresh move in the same direction
+        last = subscribers.last_thresh[pair_sub]
+        notify = self.notify_thresh[users]
+        cooling = subscribers.alerted[pair_sub] & ~np.isnan(last) & (last != 0)
+        cooling &= np.where(pair_thresh < 0, percentage_change > last - notify, percentage_change < last + notify)
+
+        return [self.user_ids[idx] for idx in np.unique(users[~over_limit & ~cooling])]
+
+    def under_limit(self, user_ids: Iterable, max_notifications: int) -> List:
+        result = []
+        for user_id in user_ids:
+            idx = self.user_index.get(user_id)
+            count = self.counts[idx] if idx is not None else self.db_manager.get_user_notification_count(user_id)
+            if count >= max_notifications:
+                logging.warning('User %s has reached the daily notification limit.', user_id,
+                                extra={'user': user_id})
+                continue
+            result.append(user_id)
+        return result
+
+    def record_alert(self, ticker: str, user_ids: Iterable, percentage_change: float) -> None:
+        subscribers = self.tickers[ticker]
+        user_ids = list(user_ids)
+        for user_id in user_ids:
+            pos = subscribers.positions[self.user_index[user_id]]
+            subscribers.alerted[pos] = True
+            subscribers.last_thresh[pos] = percentage_change
+        self.db_manager.set_tickers_alerted(ticker, user_ids, percentage_change)
+        self.increment(user_ids)
+
+    def increment(self, user_ids: Iterable) -> None:
+        user_ids = list(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                idx = self.user_index.get(user_id)
+                if idx is not None:
+                    self.counts[idx] += 1
+        self.db_manager.increment_notification_counts(user_ids)
+
+    def user_state(self, user_id) -> Optional[dict]:
+        """Threshold alert and cooldown state of one user, None for unknown users."""
+        idx = self.user_index.get(user_id)
+        if idx is None:
+            return None
+        notify_thresh = float(self.notify_thresh[idx])
+        tickers = {}
+        for ticker, subscribers in self.tickers.items():
+            pos = subscribers.positions.get(idx)
+            if pos is None:
+                continue
+            last = subscribers.last_thresh[pos]
+            cooling = bool(subscribers.alerted[pos]) and not np.isnan(last) and last != 0
+            tickers[ticker] = {
+                'thresholds': subscribers.thresholds[subscribers.pair_sub == pos].tolist(),
+                'alerted': bool(subscribers.alerted[pos]),
+                'last_alert_thresh': None if np.isnan(last) else float(last),
+                # next change needed to alert again while cooling down
+                'rearm_below': float(last - notify_thresh) if cooling else None,
+                'rearm_above': float(last + notify_thresh) if cooling else None,
+            }
+        return {'user_id': user_id, 'notify_thresh': notify_thresh,
+                'notification_count': int(self.counts[idx]), 'tickers': tickers}
+
+    def notification_counts(self) -> dict:
+        with self._lock:
+            counts = self.counts.tolist()
+        return dict(zip(self.user_ids, counts))
+
+    def reset_daily_counters(self) -> None:
+        self.db_manager.reset_daily_counters()
+        with self._lock:
+            self.counts[:] = 0
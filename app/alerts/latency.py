@@ -0,0 +1,91 @@
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+# in pipeline order; each alert's context carries the timestamps these are computed from
+STAGES = (
+    'quote_age',          # exchange quote time to fetch completion
+    'fetch_to_evaluate',  # waiting for and running evaluation
+    'db_write',           # persisting the alert in the outbox
+    'queue_wait',         # outbox backlog, retries and rate shaping
+    'alertzy',            # push request until Alertzy acknowledged it
+    'fetch_to_ack',       # everything we control
+    'end_to_end',         # exchange quote time to acknowledgement
+)
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyRecorder:
+    """Rolling latency samples per alert pipeline stage, overall and per ticker."""
+
+    def __init__(self, window: int = 1000, ticker_window: int = 100):
+        self.window = window
+        self.ticker_window = ticker_window
+        self._lock = threading.Lock()
+        self._stages: Dict[str, deque] = {stage: deque(maxlen=window) for stage in STAGES}
+        self._tickers: Dict[str, Dict[str, deque]] = {}
+
+    def record(self, stage: str, seconds: Optional[float], ticker: Optional[str] = None) -> None:
+        if seconds is None:
+            return
+        seconds = max(0.0, seconds)
+        with self._lock:
+            self._stages[stage].append(seconds)
+            if ticker is not None:
+                stages = self._tickers.setdefault(ticker, {})
+                stages.setdefault(stage, deque(maxlen=self.ticker_window)).append(seconds)
+
+    def record_alert(self, context: dict, send_started: float, acked_at: float) -> None:
+        """Stage latencies of a delivered alert from the timestamps in its context."""
+        ticker = context.get('ticker')
+        if ticker is None:
+            # digests and admin messages are not tied to a quote
+            return
+        quote_time, fetched_at = context.get('quote_time'), context.get('fetched_at')
+        evaluated_at, enqueued_at = context.get('evaluated_at'), context.get('enqueued_at')
+        # Finnhub sends 0 for symbols it has no quote for
+        quote_time = quote_time or None
+
+        def between(start, end):
+            return None if start is None or end is None else end - start
+
+        self.record('quote_age', between(quote_time, fetched_at), ticker)
+        self.record('fetch_to_evaluate', between(fetched_at, evaluated_at), ticker)
+        self.record('queue_wait', between(enqueued_at, send_started), ticker)
+        self.record('alertzy', acked_at - send_started, ticker)
+        self.record('fetch_to_ack', between(fetched_at, acked_at), ticker)
+        self.record('end_to_end', between(quote_time, acked_at), ticker)
+
+    @staticmethod
+    def _summary(samples) -> dict:
+        ordered = sorted(samples)
+        if not ordered:
+            return {'count': 0}
+        last = len(ordered) - 1
+        summary = {'count': len(ordered), 'max': round(ordered[-1], 4)}
+        for pct in PERCENTILES:
+            summary[f'p{pct}'] = round(ordered[min(last, int(round(pct / 100 * last)))], 4)
+        return summary
+
+    def snapshot(self, ticker: Optional[str] = None) -> Optional[dict]:
+        """Percentiles per stage, for one ticker when given (None when it has no samples)."""
+        with self._lock:
+            if ticker is None:
+                stages = {stage: list(samples) for stage, samples in self._stages.items()}
+            elif ticker in self._tickers:
+                stages = {stage: list(samples) for stage, samples in self._tickers[ticker].items()}
+            else:
+                return None
+        return {stage: self._summary(stages[stage]) for stage in STAGES if stage in stages}
+
+    def slowest_tickers(self, stage: str = 'end_to_end', top: int = 10) -> list:
+        with self._lock:
+            medians = []
+            for ticker, stages in self._tickers.items():
+                samples = sorted(stages.get(stage, ()))
+                if samples:
+                    medians.append((ticker, round(samples[len(samples) // 2], 4)))
+        return sorted(medians, key=lambda item: item[1], reverse=True)[:top]
+
+
+alert_latency = LatencyRecorder()
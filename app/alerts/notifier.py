@@ -1,48 +1,91 @@
 import logging
-import os
-
-import requests
-
-from app.utils.crypto import decrypt
-from app.utils.basic import load_config
-
-
-def send_push_notification(message: str, title: str, account_key: str) -> bool:
-    url = 'https://alertzy.app/send'
-    payload = {
-        'accountKey': account_key,
-        'title': title,
-        'message': message
-    }
-    try:
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            logging.debug(f'Notification sent successfully')
-            return True
-        else:
-            logging.error(
-                f'Failed to send notification. Status Code: {response.status_code}, Response: {response.text}')
-            return False
-    except Exception as e:
-        logging.error(f'Error sending notification: {e}')
+import threading
+from typing import Dict, List, Optional, Tuple
 
-    return False
+from app.alerts.channels import NotificationChannel, build_channels
+from app.utils.config_compiler import load_compiled_config
 
+TITLE = 'Stocklert'
 
-def send_notification(message: str, users: set = None, admin=False) -> bool:
-    config = load_config('config.yaml')
-    accounts = config['alertzy']['accounts']
-    title = 'Stocklert'
-    account_ids = []
-
-    for account in accounts:
-        if admin:
-            if account.get('is_admin'):
-                account_ids.append(decrypt(account['account_id'], os.getenv('ENCRYPT_KEY')))
+_channels_lock = threading.Lock()
+# channels built from the config with this digest
+_channel_state = {'digest': None, 'channels': []}
+
+
+def get_channels() -> List[NotificationChannel]:
+    compiled = load_compiled_config('config.yaml')
+    with _channels_lock:
+        if _channel_state['digest'] != compiled.digest:
+            for channel in _channel_state['channels']:
+                channel.shutdown()
+            channels_config = (compiled.raw.get('notifications') or {}).get('channels')
+            _channel_state['channels'] = build_channels(channels_config)
+            _channel_state['digest'] = compiled.digest
+            logging.warning(f'Notification channels: {[c.name for c in _channel_state["channels"]]}')
+        return _channel_state['channels']
+
+
+def get_recipients(users: set = None, admin=False) -> list:
+    """User ids a notification goes to: admins, the given users, or everyone."""
+    accounts = load_compiled_config('config.yaml').users
+    if admin:
+        return [user_id for user_id, account in accounts.items() if account['is_admin']]
+    return [user_id for user_id in accounts if not users or user_id in users]
+
+
+def _addresses(channel: NotificationChannel, recipients: list, accounts: dict, done: set) -> Dict[str, list]:
+    """User ids per address the channel still has to reach."""
+    by_address: Dict[str, list] = {}
+    for user_id in recipients:
+        address = None if user_id in done else channel.address(user_id, accounts[user_id])
+        if address:
+            by_address.setdefault(address, []).append(user_id)
+    return by_address
+
+
+def count_requests(users: set = None, admin=False, reached: Optional[Dict[str, list]] = None) -> int:
+    """Requests deliver_notification would make, one per chunk of max_batch recipients on each channel."""
+    accounts = load_compiled_config('config.yaml').users
+    recipients = get_recipients(users, admin)
+    reached = reached or {}
+    return sum(-(-len(_addresses(channel, recipients, accounts, set(reached.get(channel.name, ()))))
+                 // channel.max_batch) for channel in get_channels())
+
+
+def deliver_notification(message: str, users: set = None, admin=False,
+                         reached: Optional[Dict[str, list]] = None) -> Tuple[bool, Dict[str, list]]:
+    """Send on every channel at once, skipping users a channel already reached on an earlier attempt.
+
+    Returns whether every recipient is now reached on every channel that can
+    address them, and the user ids reached per channel so far, for the next
+    attempt to pass back in.
+    """
+    accounts = load_compiled_config('config.yaml').users
+    recipients = get_recipients(users, admin)
+    reached = {name: list(user_ids) for name, user_ids in (reached or {}).items()}
+    sends = []
+    for channel in get_channels():
+        by_address = _addresses(channel, recipients, accounts, set(reached.get(channel.name, ())))
+        if by_address:
+            sends += [(channel.name, chunk, future, by_address)
+                      for chunk, future in channel.deliver(message, TITLE, list(by_address))]
+
+    if not sends and not reached:
+        logging.error(f'No notification channel reaches users {recipients}')
+        return False, reached
+    complete = True
+    for name, chunk, future, by_address in sends:
+        if future.result():
+            reached.setdefault(name, []).extend(user_id for address in chunk for user_id in by_address[address])
         else:
-            if not users or (users and account['user_id'] in users):
-                account_ids.append(decrypt(account['account_id'], os.getenv('ENCRYPT_KEY')))
+            complete = False
+    return complete, reached
+
+
+def send_notification(message: str, users: set = None, admin=False) -> bool:
+    """One-shot send on every channel, True when every chunk on every channel was accepted."""
+    return deliver_notification(message, users, admin)[0]
+
 
-    account_key = '_'.join(account_ids)
-    status = send_push_notification(message, title, account_key)
-    return status
+def get_channel_stats() -> dict:
+    return {channel.name: channel.get_stats() for channel in get_channels()}
@@ -0,0 +1,296 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Optional
+
+from app.alerts.latency import alert_latency
+from app.alerts.notifier import count_requests, deliver_notification, get_recipients, send_notification
+from app.database.alert_log import record_delivery
+
+if TYPE_CHECKING:
+    # SQLAlchemy is only loaded once main() creates the database
+    from app.database.db_manager import DBManager
+
+# how often the delivery thread deletes old delivered items
+RETENTION_INTERVAL_SECONDS = 3600
+
+# the outbox the scheduler started, notify() falls back to sending directly without one
+outbox_state: dict = {'outbox': None}
+
+
+class AccountRateShaper:
+    """Token buckets so notification bursts are spread instead of rejected.
+
+    Every request a delivery makes, one per chunk of recipients on each
+    channel, spends a token from a shared request bucket, so the request rate
+    stays bounded however many recipients an alert has. Each account also has
+    a bucket of its own, so no single user is sent more than per_minute
+    alerts however many requests include them.
+    """
+
+    def __init__(self, per_minute: float = 6, burst: int = 3, requests_per_minute: float = 30,
+                 request_burst: int = 5):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.request_rate = requests_per_minute / 60
+        self.request_burst = request_burst
+        self._buckets: Dict[object, list] = {}
+        self._request_bucket = [float(request_burst), time.monotonic()]
+
+    @staticmethod
+    def _refill_bucket(bucket: list, now: float, rate: float, burst: float) -> list:
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        return bucket
+
+    def _refill(self, account, now: float) -> list:
+        bucket = self._buckets.setdefault(account, [float(self.burst), now])
+        return self._refill_bucket(bucket, now, self.rate, self.burst)
+
+    def account_waits(self, accounts: Iterable, now: Optional[float] = None) -> Dict[object, float]:
+        """Seconds until each account has a token, 0 for those that can be sent to now."""
+        now = time.monotonic() if now is None else now
+        return {a: max(0.0, (1 - self._refill(a, now)[0]) / self.rate) for a in accounts}
+
+    def request_wait(self, requests: int = 1, now: Optional[float] = None) -> float:
+        """Seconds until there are tokens for this many requests, 0 when they can be made now.
+
+        More requests than the burst go out once the bucket is full and leave
+        it in debt, so a large delivery is never held back for good.
+        """
+        now = time.monotonic() if now is None else now
+        tokens = self._refill_bucket(self._request_bucket, now, self.request_rate, self.request_burst)[0]
+        return max(0.0, (min(requests, self.request_burst) - tokens) / self.request_rate)
+
+    def take(self, accounts: Iterable, requests: int = 1) -> None:
+        now = time.monotonic()
+        self._refill_bucket(self._request_bucket, now, self.request_rate, self.request_burst)[0] -= requests
+        for account in accounts:
+            self._refill(account, now)[0] -= 1
+
+
+class NotificationOutbox:
+    """SQLite backed outbox drained by a single delivery thread.
+
+    Alerts are enqueued during evaluation and only count as sent once
+    Alertzy confirms them: the callback registered for the item's kind then
+    updates cooldowns and daily counts. Failed sends are retried with
+    exponential backoff, requests and accounts are rate shaped, and a
+    pending item with the same dedup key is never enqueued twice. When only
+    some of an item's users are throttled the others are split off onto an
+    item of their own and sent right away. Delivered items are deleted once
+    they are older than retention_days.
+    """
+
+    def __init__(self, db_manager: 'DBManager', per_account_per_minute: float = 6, burst: int = 3,
+                 max_attempts: int = 8, base_backoff_seconds: float = 5, max_backoff_seconds: float = 600,
+                 poll_seconds: float = 1, requests_per_minute: float = 30, retention_days: float = 7):
+        self.db_manager = db_manager
+        self.shaper = AccountRateShaper(per_account_per_minute, burst, requests_per_minute)
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.retention_days = retention_days
+        self._next_retention = 0.0
+        self._callbacks: Dict[str, Callable[[dict], None]] = {}
+        self._lock = threading.Lock()
+        # (kind, ticker) -> users with an undelivered item, so evaluation skips them
+        self._pending: Dict[tuple, set] = {}
+        # items per status, read from the table once on start and kept up to date in memory
+        self._counts: Dict[str, int] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'enqueued': 0, 'deduped': 0, 'delivered': 0, 'retried': 0, 'failed': 0, 'shaped': 0,
+                      'split': 0, 'purged': 0}
+
+    def on_delivered(self, kind: str, callback: Callable[[dict], None]) -> None:
+        self._callbacks[kind] = callback
+
+    def pending_users(self, kind: str, ticker: str) -> set:
+        with self._lock:
+            return set(self._pending.get((kind, ticker), ()))
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for status, delta in deltas.items():
+                self._counts[status] = self._counts.get(status, 0) + delta
+
+    def _track(self, item: dict, add: bool) -> None:
+        ticker = item['context'].get('ticker')
+        if ticker is None or not item['users']:
+            return
+        with self._lock:
+            users = self._pending.setdefault((item['kind'], ticker), set())
+            if add:
+                users.update(item['users'])
+            else:
+                users.difference_update(item['users'])
+
+    def enqueue(self, message: str, users: Optional[Iterable] = None, admin: bool = False, kind: str = 'message',
+                dedup_key: Optional[str] = None, context: Optional[dict] = None) -> bool:
+        users = sorted(users) if users else None
+        context = context or {}
+        item_id = self.db_manager.enqueue_outbox(kind, message, users, admin, dedup_key, context)
+        if item_id is None:
+            self.stats['deduped'] += 1
+            logging.info('Notification %s is already pending, skipping', dedup_key)
+            return False
+        self.stats['enqueued'] += 1
+        self._count(pending=1)
+        self._track({'kind': kind, 'users': users, 'context': context}, add=True)
+        self._wake.set()
+        return True
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff_seconds, self.base_backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _hold(self, item: dict, wait: float) -> float:
+        self.stats['shaped'] += 1
+        self.db_manager.update_outbox(item['id'], next_attempt_at=time.time() + wait)
+        return wait
+
+    def _split(self, item: dict, throttled: set, wait: float) -> dict:
+        """Leave the throttled users on the item and return a new item for the rest."""
+        held = [user_id for user_id in item['users'] if user_id in throttled]
+        ready = [user_id for user_id in item['users'] if user_id not in throttled]
+        # the held item keeps the dedup key, the split off one is sent right away
+        item_id = self.db_manager.enqueue_outbox(item['kind'], item['message'], ready, item['admin'], None,
+                                                 item['context'])
+        self.db_manager.update_outbox(item['id'], users=json.dumps(held), next_attempt_at=time.time() + wait)
+        self.stats['split'] += 1
+        self._count(pending=1)
+        return dict(item, id=item_id, users=ready, attempts=0)
+
+    def _deliver(self, item: dict) -> Optional[float]:
+        """Try one item, returns seconds to wait when it was held back by rate shaping."""
+        accounts = get_recipients(item['users'], item['admin'])
+        waits = self.shaper.account_waits(accounts)
+        throttled = {account for account, wait in waits.items() if wait > 0}
+        if throttled:
+            # only items naming their users can be split, admin and broadcast items wait for everyone
+            if len(throttled) == len(accounts) or not item['users'] or item['admin']:
+                wait = min(waits.values()) if item['users'] and not item['admin'] else max(waits.values())
+                return self._hold(item, wait)
+            item = self._split(item, throttled, min(waits[account] for account in throttled))
+            accounts = [account for account in accounts if account not in throttled]
+
+        # channels and users an earlier attempt reached are not sent to again
+        reached = item['context'].get('reached')
+        requests = count_requests(item['users'], item['admin'], reached)
+        wait = self.shaper.request_wait(requests)
+        if wait > 0:
+            return self._hold(item, wait)
+
+        self.shaper.take(accounts, requests)
+        send_started = time.time()
+        try:
+            delivered, reached = deliver_notification(item['message'], item['users'], item['admin'], reached)
+            error = None if delivered else 'send failed'
+        except Exception as e:
+            delivered, error = False, str(e)
+
+        attempts = item['attempts'] + 1
+        if delivered:
+            acked_at = time.time()
+            alert_latency.record_alert(item['context'], send_started, acked_at)
+            self.db_manager.update_outbox(item['id'], status='delivered', attempts=attempts,
+                                          delivered_at=acked_at, last_error=None)
+            self.stats['delivered'] += 1
+            self._count(pending=-1, delivered=1)
+            self._track(item, add=False)
+            record_delivery(item['kind'], item['users'], item['context'])
+            callback = self._callbacks.get(item['kind'])
+            if callback is not None:
+                try:
+                    callback(item)
+                except Exception as e:
+                    logging.error(f'Delivery callback for outbox item {item["id"]} failed: {e}')
+        elif attempts >= self.max_attempts:
+            logging.error(f'Giving up on notification {item["id"]} after {attempts} attempts: {error}')
+            self.db_manager.update_outbox(item['id'], status='failed', attempts=attempts, last_error=error)
+            self.stats['failed'] += 1
+            self._count(pending=-1, failed=1)
+            self._track(item, add=False)
+        else:
+            delay = self._backoff(attempts)
+            logging.warning(f'Notification {item["id"]} failed ({error}), retrying in {delay:.0f}s')
+            fields = {}
+            if reached:
+                item['context']['reached'] = reached
+                fields['context'] = json.dumps(item['context'])
+            self.db_manager.update_outbox(item['id'], attempts=attempts, last_error=error,
+                                          next_attempt_at=time.time() + delay, **fields)
+            self.stats['retried'] += 1
+        return None
+
+    def drain(self) -> int:
+        """Deliver every due item once, returns how many were attempted."""
+        items = self.db_manager.due_outbox()
+        for item in items:
+            if self._stop.is_set():
+                break
+            self._deliver(item)
+        return len(items)
+
+    def apply_retention(self) -> int:
+        """Delete delivered items older than retention_days, returns how many were deleted."""
+        purged = self.db_manager.purge_outbox(time.time() - self.retention_days * 86400)
+        self.stats['purged'] += purged
+        self._count(delivered=-purged)
+        if purged:
+            logging.info(f'Deleted {purged} delivered notifications older than {self.retention_days:g} days')
+        return purged
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if time.monotonic() >= self._next_retention:
+                self._next_retention = time.monotonic() + RETENTION_INTERVAL_SECONDS
+                try:
+                    self.apply_retention()
+                except Exception as e:
+                    logging.error(f'Notification outbox retention failed: {e}')
+            try:
+                attempted = self.drain()
+            except Exception as e:
+                logging.error(f'Notification outbox drain failed: {e}')
+                attempted = 0
+            if not attempted:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def start(self) -> None:
+        with self._lock:
+            self._counts = dict(self.db_manager.outbox_counts())
+        for item in self.db_manager.pending_outbox():
+            self._track(item, add=True)
+        self._thread = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+        self._thread.start()
+        outbox_state['outbox'] = self
+        logging.warning(f'Notification outbox started, {self._counts.get("pending", 0)} pending')
+
+    def stop(self, timeout: float = 10) -> None:
+        outbox_state['outbox'] = None
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_stats(self) -> dict:
+        """Counters and items per status, from memory so readers never query the table."""
+        with self._lock:
+            counts = dict(self._counts)
+        return dict(self.stats, **{f'db_{status}': count for status, count in counts.items()})
+
+
+def notify(message: str, users: Optional[Iterable] = None, admin: bool = False, kind: str = 'message',
+           dedup_key: Optional[str] = None, context: Optional[dict] = None) -> bool:
+    """Queue a notification on the running outbox, or send it right away when there is none."""
+    outbox = outbox_state['outbox']
+    if outbox is None:
+        return send_notification(message, set(users) if users else None, admin)
+    return outbox.enqueue(message, users, admin, kind, dedup_key, context)
@@ -0,0 +1,393 @@
+import logging
+import time
+from bisect import bisect_right
+from collections import deque
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from app.utils.basic import MARKET_TIMEZONE
+from app.utils.indicators import IndicatorState
+
+if TYPE_CHECKING:
+    from app.utils.candle_cache import CandleCache
+
+RULE_TYPES = ('pct_from_open', 'price_above', 'price_below', 'window_pct', 'new_high', 'new_low', 'sigma_move',
+              'pct_from_52w_high', 'pct_vs_sma')
+SIGMA_MIN_SAMPLES = 10
+# sigma_move rules re-arm once the move retreats by this many sigmas
+SIGMA_REARM = 0.5
+# sessions in a year of daily candles
+YEAR_SESSIONS = 252
+
+
+class Rule:
+    __slots__ = ('kind', 'value', 'users', 'window_minutes', 'days', 'rearm')
+
+    def __init__(self, kind: str, value: float, users: List[int], window_minutes: Optional[float] = None,
+                 days: Optional[int] = None, rearm: float = 0.0):
+        self.kind = kind
+        self.value = value
+        self.users = users
+        self.window_minutes = window_minutes
+        self.days = days
+        # how far the metric has to fall back past value, in the rule's own units, before it can fire again
+        self.rearm = rearm
+
+    def describe(self) -> str:
+        if self.kind == 'window_pct':
+            return f'{self.kind}({self.value:+g}% in {self.window_minutes:g}m)'
+        if self.kind == 'pct_vs_sma':
+            return f'{self.kind}({self.value:+g}% vs {self.days}d)'
+        return f'{self.kind}({self.value:g})'
+
+
+class ThresholdLadder:
+    """Rules on one metric sorted so that a quote only touches rules it crosses.
+
+    Rules are edge triggered: a rule fires when the metric moves past its
+    value and re-arms once the metric falls back by the rule's rearm margin,
+    so a price flickering around a level alerts once. The satisfied rules
+    always form a prefix of the sorted ladder, so each update is a bisect
+    plus the rules that actually changed state; a rule with a wider margin
+    keeps the ones above it satisfied until it re-arms itself.
+    """
+    __slots__ = ('rules', 'keys', 'rearm_keys', 'satisfied')
+
+    def __init__(self, rules: List[Rule], descending: bool = False):
+        self.rules = sorted(rules, key=lambda r: -r.value if descending else r.value)
+        self.keys = [-r.value if descending else r.value for r in self.rules]
+        self.rearm_keys = [key - rule.rearm for key, rule in zip(self.keys, self.rules)]
+        self.satisfied = 0
+
+    def update(self, metric_key: float) -> List[Rule]:
+        count = bisect_right(self.keys, metric_key)
+        if count > self.satisfied:
+            fired = self.rules[self.satisfied:count]
+            self.satisfied = count
+            return fired
+        while self.satisfied > count and metric_key < self.rearm_keys[self.satisfied - 1]:
+            self.satisfied -= 1
+        return []
+
+    def reset(self) -> None:
+        self.satisfied = 0
+
+    def restore(self, satisfied: int) -> None:
+        if not 0 <= satisfied <= len(self.rules):
+            raise ValueError(f'ladder state {satisfied} does not fit {len(self.rules)} rules')
+        self.satisfied = satisfied
+
+
+class RollingExtremes:
+    """Rolling min/max over a time window using monotonic deques."""
+    __slots__ = ('window_seconds', 'mins', 'maxs')
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.mins: deque = deque()
+        self.maxs: deque = deque()
+
+    def push(self, ts: float, price: float) -> Tuple[float, float]:
+        cutoff = ts - self.window_seconds
+        while self.mins and self.mins[-1][1] >= price:
+            self.mins.pop()
+        self.mins.append((ts, price))
+        while self.mins[0][0] < cutoff:
+            self.mins.popleft()
+
+        while self.maxs and self.maxs[-1][1] <= price:
+            self.maxs.pop()
+        self.maxs.append((ts, price))
+        while self.maxs[0][0] < cutoff:
+            self.maxs.popleft()
+
+        return self.mins[0][1], self.maxs[0][1]
+
+    def clear(self) -> None:
+        self.mins.clear()
+        self.maxs.clear()
+
+    def export(self) -> dict:
+        return {'mins': [list(item) for item in self.mins], 'maxs': [list(item) for item in self.maxs]}
+
+    def restore(self, data: dict) -> None:
+        self.mins = deque((ts, price) for ts, price in data['mins'])
+        self.maxs = deque((ts, price) for ts, price in data['maxs'])
+
+
+class WindowRules:
+    __slots__ = ('extremes', 'rising', 'falling')
+
+    def __init__(self, window_minutes: float, rules: List[Rule]):
+        self.extremes = RollingExtremes(window_minutes * 60)
+        self.rising = ThresholdLadder([r for r in rules if r.value >= 0])
+        self.falling = ThresholdLadder([r for r in rules if r.value < 0], descending=True)
+
+
+class ReferenceRules:
+    """Rules on the percent distance from a level taken from daily history, like a 52-week high."""
+    __slots__ = ('label', 'level', 'rising', 'falling')
+
+    def __init__(self, label: str, rules: List[Rule]):
+        self.label = label
+        self.level = None
+        self.rising = ThresholdLadder([r for r in rules if r.value >= 0])
+        self.falling = ThresholdLadder([r for r in rules if r.value < 0], descending=True)
+
+
+class TickerRules:
+    """Compiled rules and incremental state for one ticker."""
+    __slots__ = ('symbol', 'open_rising', 'open_falling', 'above', 'below', 'windows',
+                 'sigma_rising', 'sigma_falling', 'high_rules', 'low_rules', 'session', 'day_high', 'day_low',
+                 'last_alert_high', 'last_alert_low', 'references', 'candles', 'candles_version', 'signature')
+
+    def __init__(self, symbol: str, rules: List[Rule], candles: Optional['CandleCache'] = None):
+        self.symbol = symbol
+        # exported state only fits the same set of rules
+        self.signature = sorted(f'{rule.describe()}/{rule.rearm:g}' for rule in rules)
+        by_kind: Dict[str, List[Rule]] = {kind: [] for kind in RULE_TYPES}
+        for rule in rules:
+            by_kind[rule.kind].append(rule)
+
+        self.open_rising = ThresholdLadder([r for r in by_kind['pct_from_open'] if r.value >= 0])
+        self.open_falling = ThresholdLadder([r for r in by_kind['pct_from_open'] if r.value < 0], descending=True)
+        self.above = ThresholdLadder(by_kind['price_above'])
+        self.below = ThresholdLadder(by_kind['price_below'], descending=True)
+
+        windows: Dict[float, List[Rule]] = {}
+        for rule in by_kind['window_pct']:
+            windows.setdefault(rule.window_minutes, []).append(rule)
+        self.windows = [WindowRules(minutes, group) for minutes, group in windows.items()]
+        self.sigma_rising = ThresholdLadder([r for r in by_kind['sigma_move'] if r.value >= 0])
+        self.sigma_falling = ThresholdLadder([r for r in by_kind['sigma_move'] if r.value < 0], descending=True)
+
+        # levels from daily candles, looked up once per session or candle refresh rather than per quote
+        self.references: Dict[tuple, ReferenceRules] = {}
+        if by_kind['pct_from_52w_high']:
+            self.references[('high', YEAR_SESSIONS)] = ReferenceRules('its 52-week high', by_kind['pct_from_52w_high'])
+        sma_rules: Dict[int, List[Rule]] = {}
+        for rule in by_kind['pct_vs_sma']:
+            sma_rules.setdefault(rule.days, []).append(rule)
+        for days, group in sma_rules.items():
+            self.references[('sma', days)] = ReferenceRules(f'its {days}-day average', group)
+        self.candles = candles
+        self.candles_version = None
+
+        self.high_rules = by_kind['new_high']
+        self.low_rules = by_kind['new_low']
+        self.session = None
+        self.day_high = None
+        self.day_low = None
+        # last alerted level per new_high/new_low rule, in the order of high_rules/low_rules
+        self.last_alert_high: List[Optional[float]] = [None] * len(self.high_rules)
+        self.last_alert_low: List[Optional[float]] = [None] * len(self.low_rules)
+
+    def _start_session(self, session, quote: dict, price: float) -> None:
+        self.session = session
+        self.day_high = max(quote.get('h') or price, price)
+        self.day_low = min(quote.get('l') or price, price)
+        self.last_alert_high = [None] * len(self.high_rules)
+        self.last_alert_low = [None] * len(self.low_rules)
+        for ladder in self._ladders():
+            ladder.reset()
+        for window in self.windows:
+            window.extremes.clear()
+            window.rising.reset()
+            window.falling.reset()
+        for reference in self.references.values():
+            reference.rising.reset()
+            reference.falling.reset()
+        self._load_references()
+
+    def _ladders(self) -> List[ThresholdLadder]:
+        return [self.open_rising, self.open_falling, self.above, self.below, self.sigma_rising, self.sigma_falling]
+
+    def export(self) -> dict:
+        """Session state as plain JSON types, see restore."""
+        return {
+            'signature': self.signature,
+            'session': self.session.isoformat() if self.session else None,
+            'day_high': self.day_high, 'day_low': self.day_low,
+            'last_alert_high': list(self.last_alert_high), 'last_alert_low': list(self.last_alert_low),
+            'ladders': [ladder.satisfied for ladder in self._ladders()],
+            'windows': {f'{window.extremes.window_seconds:g}': {
+                'extremes': window.extremes.export(), 'rising': window.rising.satisfied,
+                'falling': window.falling.satisfied} for window in self.windows},
+            'references': {f'{kind}:{days}': [reference.rising.satisfied, reference.falling.satisfied]
+                           for (kind, days), reference in self.references.items()},
+        }
+
+    def restore(self, data: dict) -> bool:
+        """Pick up an exported session, returns False when the rules changed since."""
+        if data['signature'] != self.signature:
+            return False
+        if len(data['last_alert_high']) != len(self.high_rules) or len(data['last_alert_low']) != len(self.low_rules):
+            raise ValueError(f'new_high/new_low state does not fit the rules of {self.symbol}')
+        self.session = date.fromisoformat(data['session']) if data['session'] else None
+        self.day_high = data['day_high']
+        self.day_low = data['day_low']
+        self.last_alert_high = list(data['last_alert_high'])
+        self.last_alert_low = list(data['last_alert_low'])
+        for ladder, satisfied in zip(self._ladders(), data['ladders']):
+            ladder.restore(satisfied)
+        for window in self.windows:
+            window_data = data['windows'][f'{window.extremes.window_seconds:g}']
+            window.extremes.restore(window_data['extremes'])
+            window.rising.restore(window_data['rising'])
+            window.falling.restore(window_data['falling'])
+        for (kind, days), reference in self.references.items():
+            rising, falling = data['references'][f'{kind}:{days}']
+            reference.rising.restore(rising)
+            reference.falling.restore(falling)
+        # levels are read again from the candle cache on the next quote
+        self.candles_version = None
+        return True
+
+    def _load_references(self) -> None:
+        if self.candles is None:
+            return
+        self.candles_version = self.candles.version
+        for (kind, days), reference in self.references.items():
+            reference.level = self.candles.high(self.symbol, days) if kind == 'high' else \
+                self.candles.sma(self.symbol, days)
+
+    def evaluate(self, quote: dict, now: Optional[float] = None,
+                 indicators: Optional[IndicatorState] = None) -> List[Tuple[Rule, str]]:
+        price = quote.get('c')
+        if not price:
+            return []
+        now = now if now is not None else time.time()
+        session = datetime.now(MARKET_TIMEZONE).date()
+        fired: List[Tuple[Rule, str]] = []
+
+        if session != self.session:
+            self._start_session(session, quote, price)
+        else:
+            # each rule steps from the level it last alerted at, so a slow grind still adds up to its step
+            if price > self.day_high:
+                for i, rule in enumerate(self.high_rules):
+                    level = self.last_alert_high[i]
+                    if level is None or price >= level * (1 + rule.value / 100):
+                        fired.append((rule, f'{self.symbol} hit a new intraday high at {price}'))
+                        self.last_alert_high[i] = price
+                self.day_high = price
+            if price < self.day_low:
+                for i, rule in enumerate(self.low_rules):
+                    level = self.last_alert_low[i]
+                    if level is None or price <= level * (1 - rule.value / 100):
+                        fired.append((rule, f'{self.symbol} hit a new intraday low at {price}'))
+                        self.last_alert_low[i] = price
+                self.day_low = price
+
+        open_price = quote.get('o')
+        if open_price:
+            pct = (price - open_price) / open_price * 100
+            for rule in self.open_rising.update(pct) + self.open_falling.update(-pct):
+                fired.append((rule, f'{self.symbol} is {pct:+.2f}% from open ({open_price} to {price})'))
+
+        for rule in self.above.update(price):
+            fired.append((rule, f'{self.symbol} rose above {rule.value} ({price})'))
+        for rule in self.below.update(-price):
+            fired.append((rule, f'{self.symbol} fell below {rule.value} ({price})'))
+
+        for window in self.windows:
+            low, high = window.extremes.push(now, price)
+            rise = (price - low) / low * 100
+            drop = (price - high) / high * 100
+            minutes = window.extremes.window_seconds / 60
+            for rule in window.rising.update(rise):
+                fired.append((rule, f'{self.symbol} is up {rise:.2f}% in the last {minutes:g} minutes ({price})'))
+            for rule in window.falling.update(-drop):
+                fired.append((rule, f'{self.symbol} is down {-drop:.2f}% in the last {minutes:g} minutes ({price})'))
+
+        if self.references and self.candles is not None and self.candles.version != self.candles_version:
+            self._load_references()
+        for reference in self.references.values():
+            if not reference.level:
+                continue
+            pct = (price - reference.level) / reference.level * 100
+            for rule in reference.rising.update(pct) + reference.falling.update(-pct):
+                fired.append((rule, f'{self.symbol} is {pct:+.2f}% from {reference.label} '
+                                    f'({reference.level:.2f} to {price})'))
+
+        if indicators is not None and indicators.count >= SIGMA_MIN_SAMPLES:
+            volatility, ema = indicators.volatility, indicators.ema
+            if volatility and ema:
+                pct = (price - ema) / ema * 100
+                sigmas = pct / volatility
+                for rule in self.sigma_rising.update(sigmas) + self.sigma_falling.update(-sigmas):
+                    fired.append((rule, f'{self.symbol} is {sigmas:+.1f} sigma from its average '
+                                        f'({pct:+.2f}%, {price})'))
+
+        return fired
+
+
+class RuleEngine:
+    def __init__(self, tickers: Dict[str, TickerRules]):
+        self.tickers = tickers
+
+    def evaluate(self, ticker: str, quote: dict, now: Optional[float] = None,
+                 indicators: Optional[IndicatorState] = None) -> List[Tuple[Rule, str]]:
+        rules = self.tickers.get(ticker)
+        if rules is None:
+            return []
+        return rules.evaluate(quote, now, indicators)
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def export_states(self) -> Dict[str, dict]:
+        return {symbol: rules.export() for symbol, rules in list(self.tickers.items())}
+
+    def import_states(self, states: Dict[str, dict]) -> int:
+        """Restore exported ticker states, skipping tickers whose rules changed. Returns how many were restored."""
+        restored = 0
+        for symbol, data in states.items():
+            rules = self.tickers.get(symbol)
+            if rules is not None and rules.restore(data):
+                restored += 1
+        return restored
+
+
+def default_rearm(kind: str, value: float, users: List[int], user_notify_thresh: Dict[int, float]) -> float:
+    """Re-arm margin in the rule's units: the smallest notify_thresh of its users, as a percent."""
+    if kind in ('new_high', 'new_low'):
+        return 0.0
+    if kind == 'sigma_move':
+        return SIGMA_REARM
+    pct = min((user_notify_thresh.get(user_id, 0.0) for user_id in users), default=0.0)
+    if kind in ('price_above', 'price_below'):
+        return abs(value) * pct / 100
+    return pct
+
+
+def compile_rule(symbol: str, rule_config: dict, user_notify_thresh: Optional[Dict[int, float]] = None) -> Rule:
+    kind = rule_config.get('type')
+    if kind not in RULE_TYPES:
+        raise ValueError(f'Unknown alert rule type {kind!r} for {symbol}')
+    default_value = 0.5 if kind in ('new_high', 'new_low') else None
+    value = rule_config.get('value', default_value)
+    if value is None:
+        raise ValueError(f'Alert rule {kind} for {symbol} needs a value')
+    window_minutes = rule_config.get('window_minutes')
+    if kind == 'window_pct' and not window_minutes:
+        raise ValueError(f'Alert rule window_pct for {symbol} needs window_minutes')
+    days = int(rule_config.get('days', 20)) if kind == 'pct_vs_sma' else None
+    users = list(rule_config.get('users', []))
+    rearm = rule_config.get('rearm')
+    if rearm is None:
+        rearm = default_rearm(kind, float(value), users, user_notify_thresh or {})
+    return Rule(kind, float(value), users, window_minutes, days, float(rearm))
+
+
+def compile_rules(tickers_config: List[dict], candles: Optional['CandleCache'] = None,
+                  user_notify_thresh: Optional[Dict[int, float]] = None) -> RuleEngine:
+    compiled: Dict[str, List[Rule]] = {}
+    for item in tickers_config:
+        symbol = item['symbol']
+        for rule_config in item.get('rules', []) or []:
+            compiled.setdefault(symbol, []).append(compile_rule(symbol, rule_config, user_notify_thresh))
+
+    engine = RuleEngine({symbol: TickerRules(symbol, rules, candles) for symbol, rules in compiled.items()})
+    logging.info(f'Compiled alert rules for {len(engine)} tickers')
+    return engine
@@ -1,16 +1,64 @@
+import hashlib
+import hmac
 import json
+import logging
 import os
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
-
-import finnhub
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
 
+from app.alerts.latency import alert_latency
+from app.helpers.quote_providers import QuoteProvider, build_quote_provider
 from app.helpers.sheets_helpers import log_best_performers, upload_prompt_to_sheets
 from app.services.daily_recommender_service import (
+    daily_runs,
     get_daily_recommendations,
     get_best_daily_performers, send_daily_performance,
 )
 from app.services.improve_prompt_service import improve_daily_prompt
+from app.services.tracker_state_service import notifications_view, quote_view, quotes_view
+from app.utils.basic import mark_startup
+from app.utils.config_compiler import load_compiled_config
+from app.utils.indicators import indicator_registry
+from app.utils.tracing import span, get_trace_stats, sample_profile
+
+MAX_PROFILE_SECONDS = 60
+# /debug routes need this as a bearer token, and only answer local requests when it is unset
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN')
+# routes whose last segment is a parameter, grouped under one span name
+PARAM_ROUTES = ('/indicators/', '/quotes/', '/users/', '/tickers/', '/latency/')
+# read endpoints rebuild their JSON at most this often, however often dashboards poll
+READ_CACHE_SECONDS = 1.0
+# one entry per path, so requests for unknown symbols or users cannot grow the cache without bound
+READ_CACHE_MAX_ENTRIES = 1024
+
+_read_cache_lock = threading.Lock()
+# cache key -> (expires at, body, etag)
+_read_cache: dict[str, tuple] = {}
+
+
+def _cached_json(key: str, build) -> tuple[bytes, str] | None:
+    now = time.monotonic()
+    with _read_cache_lock:
+        cached = _read_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1], cached[2]
+
+    payload = build()
+    if payload is None:
+        return None
+    body = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    with _read_cache_lock:
+        if key not in _read_cache and len(_read_cache) >= READ_CACHE_MAX_ENTRIES:
+            for expired in [k for k, entry in _read_cache.items() if entry[0] <= now]:
+                del _read_cache[expired]
+            if len(_read_cache) >= READ_CACHE_MAX_ENTRIES:
+                # still full of live entries, drop the oldest
+                del _read_cache[next(iter(_read_cache))]
+        _read_cache[key] = (now + READ_CACHE_SECONDS, body, etag)
+    return body, etag
 
 
 class RequestHandler(BaseHTTPRequestHandler):
@@ -20,23 +68,178 @@ class RequestHandler(BaseHTTPRequestHandler):
             return
         super().log_message(format, *args)
 
+    def _get_quote_provider(self) -> QuoteProvider | None:
+        provider = getattr(self.server, 'quote_provider', None)
+        if provider is None:
+            try:
+                provider = build_quote_provider(load_compiled_config('config.yaml').raw)
+                self.server.quote_provider = provider  # type: ignore[attr-defined]
+            except Exception as e:
+                logging.error(f'Unable to set up quote provider: {e}')
+        return provider
+
+    def _route_name(self) -> str:
+        path = urlsplit(self.path).path
+        for prefix in PARAM_ROUTES:
+            if path.startswith(prefix):
+                return f'{prefix}<param>'
+        return path
+
+    def _debug_allowed(self) -> bool:
+        if DEBUG_TOKEN:
+            return hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {DEBUG_TOKEN}')
+        return self.client_address[0] in ('127.0.0.1', '::1')
+
+    def _send_read(self, key: str, build) -> None:
+        """Serve a read endpoint as compact JSON with ETag / If-None-Match support."""
+        result = _cached_json(key, build)
+        if result is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body, etag = result
+        if etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stale_after(self) -> float:
+        engine = getattr(self.server, 'tracker_engine', None)
+        # a quote is stale once it missed a few refreshes
+        return 3 * engine.refresh_interval if engine is not None else 60
+
+    def _send_alert_history(self) -> None:
+        alert_log = getattr(self.server, 'alert_log', None)
+        if alert_log is None:
+            self.send_response(503)
+            self.end_headers()
+            return
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            days = min(int(query.get('days', ['7'])[0]), alert_log.retention_days)
+            limit = min(int(query.get('limit', ['500'])[0]), 5000)
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+        kind, value = url.path.strip('/').split('/')[:2]
+        if kind == 'users':
+            events = alert_log.history(user_id=value, days=days, limit=limit)
+        else:
+            events = alert_log.history(ticker=value.upper(), days=days, limit=limit)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'days': days, 'events': events}).encode())
+
     def do_GET(self) -> None:  # type: ignore[override]
+        with span(f'http GET {self._route_name()}'):
+            self._handle_get()
+
+    def do_POST(self) -> None:  # type: ignore[override]
+        with span(f'http POST {self._route_name()}'):
+            self._handle_post()
+
+    def _handle_get(self) -> None:
         if self.path == '/health':
+            mark_startup('health')
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({'status': 'OK'}).encode())
+        elif self.path == '/indicators':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(indicator_registry.snapshot()).encode())
+        elif self.path.startswith('/indicators/'):
+            state = indicator_registry.get(self.path[len('/indicators/'):].upper())
+            if state is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(state.to_dict()).encode())
+        elif self.path == '/quotes':
+            self._send_read('quotes', lambda: quotes_view(self._stale_after()))
+        elif self.path.startswith('/quotes/'):
+            symbol = self.path[len('/quotes/'):].upper()
+            self._send_read(f'quotes/{symbol}', lambda: quote_view(symbol, self._stale_after()))
+        elif urlsplit(self.path).path.endswith('/alerts') and self.path.startswith(('/users/', '/tickers/')):
+            self._send_alert_history()
+        elif self.path.startswith('/users/') and self.path.endswith('/state'):
+            cooldowns = getattr(self.server, 'cooldowns', None)
+            user_id = self.path[len('/users/'):-len('/state')]
+            if cooldowns is None:
+                self.send_response(503)
+                self.end_headers()
+                return
+            # config user ids are integers
+            key = int(user_id) if user_id.isdigit() else user_id
+            self._send_read(f'users/{user_id}', lambda: cooldowns.user_state(key))
+        elif self.path == '/notifications':
+            cooldowns = getattr(self.server, 'cooldowns', None)
+            if cooldowns is None:
+                self.send_response(503)
+                self.end_headers()
+                return
+            self._send_read('notifications', lambda: notifications_view(
+                cooldowns, getattr(self.server, 'max_notifications', None), getattr(self.server, 'outbox', None)))
+        elif self.path == '/tracker/stats':
+            engine = getattr(self.server, 'tracker_engine', None)
+            if engine is None:
+                self.send_response(503)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(engine.get_stats()).encode())
+        elif self.path == '/latency':
+            self._send_read('latency', lambda: {'stages': alert_latency.snapshot(),
+                                                'slowest_tickers': alert_latency.slowest_tickers()})
+        elif self.path.startswith('/latency/'):
+            symbol = self.path[len('/latency/'):].upper()
+            self._send_read(f'latency/{symbol}', lambda: alert_latency.snapshot(symbol))
+        elif urlsplit(self.path).path.startswith('/debug/') and not self._debug_allowed():
+            self.send_response(403)
+            self.end_headers()
+        elif self.path == '/debug/traces':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(get_trace_stats()).encode())
+        elif urlsplit(self.path).path == '/debug/profile':
+            query = parse_qs(urlsplit(self.path).query)
+            try:
+                seconds = min(float(query.get('seconds', ['10'])[0]), MAX_PROFILE_SECONDS)
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            stacks = sample_profile(seconds)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write(stacks.encode())
         else:
             self.send_response(404)
             self.end_headers()
 
-    def do_POST(self) -> None:  # type: ignore[override]
+    def _handle_post(self) -> None:
         if self.path == '/recommendations':
-            client = getattr(self.server, 'finnhub_client', None)
-            if client is None:
-                api_key = os.getenv('FINNHUB_API_KEY')
-                client = finnhub.Client(api_key=api_key) if api_key else None
-
+            client = self._get_quote_provider()
             if client is None:
                 self.send_response(500)
                 self.end_headers()
@@ -48,23 +251,19 @@ class RequestHandler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(json.dumps(res).encode())
         elif self.path == '/daily_performance':
-            client = getattr(self.server, 'finnhub_client', None)
-            if client is None:
-                api_key = os.getenv('FINNHUB_API_KEY')
-                client = finnhub.Client(api_key=api_key) if api_key else None
-
+            client = self._get_quote_provider()
             if client is None:
                 self.send_response(500)
                 self.end_headers()
                 return
 
-            res = send_daily_performance(client, api=True)
+            res = daily_runs.run('daily_performance', lambda: send_daily_performance(client, api=True))
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps(res).encode())
         elif self.path == '/best_performers':
-            res = get_best_daily_performers(api=True)
+            res = daily_runs.run('best_performers', lambda: get_best_daily_performers(api=True))
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
@@ -108,9 +307,16 @@ class RequestHandler(BaseHTTPRequestHandler):
             self.end_headers()
 
 
-def start_server(port: int = 8000, finnhub_client: finnhub.Client | None = None) -> HTTPServer:
-    server = HTTPServer(('0.0.0.0', port), RequestHandler)
-    server.finnhub_client = finnhub_client  # type: ignore[attr-defined]
+def start_server(port: int = 8000, quote_provider: QuoteProvider | None = None) -> ThreadingHTTPServer:
+    # threaded so a slow route or a profile run does not block /health
+    server = ThreadingHTTPServer(('0.0.0.0', port), RequestHandler)
+    server.quote_provider = quote_provider  # type: ignore[attr-defined]
+    # attached once the scheduler has started the tracker
+    server.tracker_engine = None  # type: ignore[attr-defined]
+    server.cooldowns = None  # type: ignore[attr-defined]
+    server.max_notifications = None  # type: ignore[attr-defined]
+    server.outbox = None  # type: ignore[attr-defined]
+    server.alert_log = None  # type: ignore[attr-defined]
     thread = threading.Thread(target=server.serve_forever, daemon=True)
     thread.start()
     return server
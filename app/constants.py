@@ -3,4 +3,7 @@ from pathlib import Path
 
 DAILY_RECOMMENDATIONS_PROMPT_PATH = Path(__file__).resolve().parents[1] / 'resources' / 'daily_prompt.txt'
 DAILY_BEST_PERFORMERS_PROMPT_PATH = Path(__file__).resolve().parents[1] / 'resources' / 'best_performers_prompt.txt'
-IMPROVE_PROMPT_PATH = Path(__file__).resolve().parents[1] / "resources" / "improve_prompt.txt"
\ No newline at end of file
+IMPROVE_PROMPT_PATH = Path(__file__).resolve().parents[1] / "resources" / "improve_prompt.txt"
+SHARD_SCOPE_PROMPT_PATH = Path(__file__).resolve().parents[1] / 'resources' / 'shard_scope_prompt.txt'
+RANK_PROMPT_PATH = Path(__file__).resolve().parents[1] / 'resources' / 'rank_prompt.txt'
+EVAL_DAY_PROMPT_PATH = Path(__file__).resolve().parents[1] / 'resources' / 'eval_day_prompt.txt'
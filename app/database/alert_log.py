@@ -0,0 +1,218 @@
+import logging
+import queue
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from app.utils.basic import MARKET_TIMEZONE
+from app.utils.tracing import traced
+
+PARTITION_PREFIX = 'alert_events_'
+_PARTITION = re.compile(rf'^{PARTITION_PREFIX}(\d{{8}})$')
+COLUMNS = ('user_id', 'ticker', 'kind', 'pct', 'price', 'quote_time', 'sent_at')
+
+# the log the app started, record_delivery() is a no-op without one
+alert_log_state: dict = {'log': None}
+
+
+def _sql(statement: str):
+    # sqlalchemy is imported on first use, so importing record_delivery stays cheap at startup
+    from sqlalchemy import text
+    return text(statement)
+
+
+def _trading_day(timestamp: float) -> date:
+    return datetime.fromtimestamp(timestamp, MARKET_TIMEZONE).date()
+
+
+def _partition(day: date) -> str:
+    return f'{PARTITION_PREFIX}{day:%Y%m%d}'
+
+
+class AlertEventLog:
+    """Append-only log of delivered alerts, one SQLite table per trading day.
+
+    Each recipient of an alert is a row, and both history indexes carry every
+    column so per-user and per-ticker lookups never touch the table itself. A
+    query only opens the partitions of the days it asks for, so its cost does
+    not grow with the size of the history, and retention drops whole days.
+    Events are queued by the caller and written in batches by one thread.
+    """
+
+    def __init__(self, db_url: str = 'sqlite:///alert_events.db', retention_days: int = 90,
+                 flush_seconds: float = 1.0, batch_size: int = 500):
+        from sqlalchemy import create_engine
+
+        self.engine = create_engine(db_url, connect_args={'check_same_thread': False})
+        self.retention_days = retention_days
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        with self.engine.connect() as conn:
+            conn.execute(_sql('PRAGMA journal_mode=WAL'))
+            rows = conn.execute(_sql("SELECT name FROM sqlite_master WHERE type = 'table'")).all()
+        self._partitions = {name for (name,) in rows if _PARTITION.match(name)}
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'dropped_partitions': 0}
+
+    def record(self, kind: str, ticker: str, users: Iterable, pct: Optional[float] = None,
+               price: Optional[float] = None, quote_time: Optional[float] = None,
+               sent_at: Optional[float] = None) -> None:
+        """Queue one alert for writing, never blocks on the database."""
+        sent_at = time.time() if sent_at is None else sent_at
+        for user_id in users:
+            self._queue.put((str(user_id), ticker, kind, pct, price, quote_time, sent_at))
+            self.stats['queued'] += 1
+
+    def _ensure_partition(self, conn, name: str) -> None:
+        if name in self._partitions:
+            return
+        conn.execute(_sql(
+            f'CREATE TABLE IF NOT EXISTS {name} ('
+            'user_id TEXT NOT NULL, ticker TEXT NOT NULL, kind TEXT NOT NULL, pct REAL, price REAL, '
+            'quote_time REAL, sent_at REAL NOT NULL)'
+        ))
+        conn.execute(_sql(f'CREATE INDEX IF NOT EXISTS {name}_by_user ON {name} '
+                          '(user_id, sent_at, ticker, kind, pct, price, quote_time)'))
+        conn.execute(_sql(f'CREATE INDEX IF NOT EXISTS {name}_by_ticker ON {name} '
+                          '(ticker, sent_at, user_id, kind, pct, price, quote_time)'))
+        self._partitions.add(name)
+
+    @traced('alert_log.flush')
+    def flush(self) -> int:
+        """Write everything queued so far, returns the number of rows written."""
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not rows:
+            return 0
+
+        by_partition: dict = {}
+        for row in rows:
+            by_partition.setdefault(_partition(_trading_day(row[-1])), []).append(dict(zip(COLUMNS, row)))
+        placeholders = ', '.join(f':{column}' for column in COLUMNS)
+        with self._lock, self.engine.begin() as conn:
+            for name, params in by_partition.items():
+                self._ensure_partition(conn, name)
+                conn.execute(_sql(f'INSERT INTO {name} ({", ".join(COLUMNS)}) VALUES ({placeholders})'), params)
+        self.stats['written'] += len(rows)
+        self.stats['batches'] += 1
+        return len(rows)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.flush() < self.batch_size:
+                    self._stop.wait(self.flush_seconds)
+            except Exception as e:
+                logging.error(f'Writing alert events failed: {e}')
+                self._stop.wait(self.flush_seconds)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='alert-event-log', daemon=True)
+        self._thread.start()
+        alert_log_state['log'] = self
+
+    def stop(self, timeout: float = 10) -> None:
+        alert_log_state['log'] = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        while self.flush():
+            pass
+
+    def _days(self, since: date, until: date) -> List[str]:
+        """Existing partitions between the two days, newest first."""
+        names = []
+        day = until
+        while day >= since:
+            name = _partition(day)
+            if name in self._partitions:
+                names.append(name)
+            day -= timedelta(days=1)
+        return names
+
+    @traced('alert_log.history')
+    def history(self, user_id=None, ticker: Optional[str] = None, days: int = 7, limit: int = 500) -> List[dict]:
+        """Alerts of one user or one ticker (or both) over the last `days` days, newest first."""
+        if user_id is None and ticker is None:
+            raise ValueError('history needs a user_id or a ticker')
+        until = _trading_day(time.time())
+        where, params = [], {'limit': limit}
+        if user_id is not None:
+            where.append('user_id = :user_id')
+            params['user_id'] = str(user_id)
+        if ticker is not None:
+            where.append('ticker = :ticker')
+            params['ticker'] = ticker
+        # the user index is the narrower one when both are given
+        index = 'by_user' if user_id is not None else 'by_ticker'
+
+        events: List[dict] = []
+        with self._lock:
+            partitions = self._days(until - timedelta(days=days - 1), until)
+        with self.engine.connect() as conn:
+            for name in partitions:
+                params['limit'] = limit - len(events)
+                result = conn.execute(_sql(
+                    f'SELECT {", ".join(COLUMNS)} FROM {name} INDEXED BY {name}_{index} '
+                    f'WHERE {" AND ".join(where)} ORDER BY sent_at DESC LIMIT :limit'
+                ), params)
+                events.extend(dict(row._mapping) for row in result)
+                if len(events) >= limit:
+                    break
+        return events
+
+    def daily_counts(self, days: int = 20) -> Dict[str, Dict[str, int]]:
+        """Alerts per user for each logged trading day of the last `days` days, from the user index alone."""
+        until = _trading_day(time.time())
+        with self._lock:
+            partitions = self._days(until - timedelta(days=days - 1), until)
+        counts: Dict[str, Dict[str, int]] = {}
+        with self.engine.connect() as conn:
+            for name in partitions:
+                rows = conn.execute(_sql(
+                    f'SELECT user_id, COUNT(*) FROM {name} INDEXED BY {name}_by_user GROUP BY user_id'
+                )).all()
+                day = datetime.strptime(_PARTITION.match(name).group(1), '%Y%m%d').date().isoformat()
+                counts[day] = {str(user_id): count for user_id, count in rows}
+        return counts
+
+    def apply_retention(self, today: Optional[date] = None) -> int:
+        """Drop partitions older than retention_days and reclaim their space, returns how many were dropped."""
+        cutoff = (today or _trading_day(time.time())) - timedelta(days=self.retention_days)
+        with self._lock:
+            expired = sorted(name for name in self._partitions
+                             if datetime.strptime(_PARTITION.match(name).group(1), '%Y%m%d').date() < cutoff)
+            if not expired:
+                return 0
+            with self.engine.begin() as conn:
+                for name in expired:
+                    conn.execute(_sql(f'DROP TABLE IF EXISTS {name}'))
+                    self._partitions.discard(name)
+            # dropped pages stay in the file until it is rebuilt
+            with self.engine.connect() as conn:
+                conn.execution_options(isolation_level='AUTOCOMMIT').execute(_sql('VACUUM'))
+        self.stats['dropped_partitions'] += len(expired)
+        logging.warning(f'Dropped {len(expired)} alert event partitions older than {cutoff}')
+        return len(expired)
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, pending=self._queue.qsize(), partitions=len(self._partitions))
+
+
+def record_delivery(kind: str, users: Iterable, context: dict) -> None:
+    """Log a delivered alert on the running event log, if any."""
+    log = alert_log_state['log']
+    ticker = context.get('ticker')
+    if log is None or ticker is None or not users:
+        return
+    log.record(kind, ticker, users, context.get('percentage_change'), context.get('price'),
+               context.get('quote_time'))
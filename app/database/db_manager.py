@@ -1,10 +1,15 @@
 import datetime
+import json
+import time
 
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float, Text, Index, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from datetime import date
 from sqlalchemy.orm import scoped_session
 
+from app.utils.tracing import traced
+
 
 class Base(DeclarativeBase):
     pass
@@ -42,12 +47,48 @@ class TickerState(Base):
     last_alert_thresh = Column(Float, nullable=True)
 
 
+class OutboxItem(Base):
+    __tablename__ = 'notification_outbox'
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    dedup_key = Column(String, nullable=True)
+    message = Column(Text, nullable=False)
+    users = Column(Text, nullable=True)  # JSON list, NULL sends to every account
+    admin = Column(Boolean, default=False)
+    context = Column(Text, nullable=True)  # JSON, handed to the delivery callback
+    status = Column(String, default='pending', index=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(Float, nullable=False)
+    created_at = Column(Float, nullable=False)
+    delivered_at = Column(Float, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    # one pending item per dedup key, delivered items do not block new ones
+    __table_args__ = (
+        Index('ix_outbox_pending_dedup', 'dedup_key', unique=True, sqlite_where=(status == 'pending')),
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'dedup_key': self.dedup_key,
+            'message': self.message,
+            'users': json.loads(self.users) if self.users else None,
+            'admin': self.admin,
+            'context': json.loads(self.context) if self.context else {},
+            'attempts': self.attempts,
+            'created_at': self.created_at,
+        }
+
+
 class DBManager:
     def __init__(self, db_url='sqlite:///stockalerts.db'):
         self.engine = create_engine(db_url, connect_args={'check_same_thread': False})
         Base.metadata.create_all(self.engine)
         self.Session = scoped_session(sessionmaker(bind=self.engine))
 
+    @traced('db.get_user_notification_count')
     def get_user_notification_count(self, user_id: str):
         with self.Session() as session:
             user = session.query(User).filter_by(id=user_id).first()
@@ -57,13 +98,21 @@ class DBManager:
                 session.commit()
             return user.notification_count
 
-    def increment_notification_count(self, user_id: str):
+    @traced('db.increment_notification_counts')
+    def increment_notification_counts(self, user_ids: list) -> None:
+        """Add one to each user's count in a single transaction, creating missing users."""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return
         with self.Session() as session:
-            user = session.query(User).filter_by(id=user_id).first()
-            if user:
-                user.notification_count += 1
-                session.commit()
+            existing = {user_id for (user_id,) in session.query(User.id).filter(User.id.in_(user_ids))}
+            session.add_all(User(id=user_id, notification_count=0) for user_id in user_ids if user_id not in existing)
+            session.flush()
+            (session.query(User).filter(User.id.in_(user_ids))
+             .update({User.notification_count: User.notification_count + 1}, synchronize_session=False))
+            session.commit()
 
+    @traced('db.get_ticker_state')
     def get_ticker_state(self, user_id: str, ticker: str):
         with self.Session() as session:
             state = session.query(TickerState).filter_by(user_id=user_id, ticker=ticker).first()
@@ -73,14 +122,26 @@ class DBManager:
                 session.commit()
             return state.alerted, state.last_alert_thresh
 
-    def set_ticker_alerted(self, user_id: str, ticker: str, thresh: float):
-        session = self.Session()
-        state = session.query(TickerState).filter_by(user_id=user_id, ticker=ticker).first()
-        state.alerted = True
-        state.last_alert_thresh = thresh
-        session.commit()
-        session.close()
+    @traced('db.set_tickers_alerted')
+    def set_tickers_alerted(self, ticker: str, user_ids: list, thresh: float) -> None:
+        """Mark the ticker alerted for every user in a single transaction, creating missing rows."""
+        # ticker_states.user_id is a string column
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        if not user_ids:
+            return
+        with self.Session() as session:
+            states = {state.user_id: state for state in session.query(TickerState)
+                      .filter(TickerState.ticker == ticker, TickerState.user_id.in_(user_ids))}
+            for user_id in user_ids:
+                state = states.get(user_id)
+                if state is None:
+                    state = TickerState(user_id=user_id, ticker=ticker)
+                    session.add(state)
+                state.alerted = True
+                state.last_alert_thresh = thresh
+            session.commit()
 
+    @traced('db.reset_ticker_alerted')
     def reset_ticker_alerted(self, user_id: str, ticker: str):
         session = self.Session()
         state = session.query(TickerState).filter_by(user_id=user_id, ticker=ticker).first()
@@ -89,6 +150,7 @@ class DBManager:
         session.commit()
         session.close()
 
+    @traced('db.reset_daily_counters')
     def reset_daily_counters(self):
         session = self.Session()
         users = session.query(User).all()
@@ -96,3 +158,69 @@ class DBManager:
             user.reset_daily_count()
             session.commit()
         session.close()
+
+    @traced('db.load_ticker_states')
+    def load_ticker_states(self) -> dict:
+        """All (user_id, ticker) -> (alerted, last_alert_thresh) in one query."""
+        with self.Session() as session:
+            rows = session.query(TickerState.user_id, TickerState.ticker, TickerState.alerted,
+                                 TickerState.last_alert_thresh).all()
+        return {(user_id, ticker): (alerted, thresh) for user_id, ticker, alerted, thresh in rows}
+
+    @traced('db.load_notification_counts')
+    def load_notification_counts(self) -> dict:
+        """Notification count per user id in one query."""
+        with self.Session() as session:
+            rows = session.query(User.id, User.notification_count).all()
+        return {user_id: count or 0 for user_id, count in rows}
+
+    @traced('db.enqueue_outbox')
+    def enqueue_outbox(self, kind: str, message: str, users: list | None, admin: bool,
+                       dedup_key: str | None, context: dict | None) -> int | None:
+        """Add a pending notification, None when one with the same dedup key is already pending."""
+        now = time.time()
+        item = OutboxItem(kind=kind, message=message, users=json.dumps(users) if users is not None else None,
+                          admin=admin, dedup_key=dedup_key, context=json.dumps(context) if context else None,
+                          status='pending', attempts=0, next_attempt_at=now, created_at=now)
+        with self.Session() as session:
+            session.add(item)
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                return None
+            return item.id
+
+    @traced('db.due_outbox')
+    def due_outbox(self, limit: int = 20) -> list:
+        with self.Session() as session:
+            items = (session.query(OutboxItem)
+                     .filter(OutboxItem.status == 'pending', OutboxItem.next_attempt_at <= time.time())
+                     .order_by(OutboxItem.next_attempt_at, OutboxItem.id)
+                     .limit(limit).all())
+            return [item.to_dict() for item in items]
+
+    def pending_outbox(self) -> list:
+        with self.Session() as session:
+            return [item.to_dict() for item in session.query(OutboxItem).filter_by(status='pending').all()]
+
+    @traced('db.update_outbox')
+    def update_outbox(self, item_id: int, **fields) -> None:
+        with self.Session() as session:
+            session.query(OutboxItem).filter_by(id=item_id).update(fields)
+            session.commit()
+
+    @traced('db.purge_outbox')
+    def purge_outbox(self, delivered_before: float) -> int:
+        """Delete items delivered before the given time, returns how many were deleted."""
+        with self.Session() as session:
+            deleted = (session.query(OutboxItem)
+                       .filter(OutboxItem.status == 'delivered', OutboxItem.delivered_at < delivered_before)
+                       .delete(synchronize_session=False))
+            session.commit()
+        return deleted
+
+    def outbox_counts(self) -> dict:
+        with self.Session() as session:
+            rows = session.query(OutboxItem.status, func.count(OutboxItem.id)).group_by(OutboxItem.status).all()
+        return dict(rows)
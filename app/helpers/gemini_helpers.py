@@ -3,14 +3,16 @@ import json
 import logging
 from typing import List, Dict
 
-from google.oauth2 import service_account
-import google.genai as genai
-from google.genai import types
-
 from app.utils.parsing import parse_json
 
 
-def query_gemini(prompt: str, schema: dict, model_name: str = "gemini-2.5-pro") -> dict | str | List[Dict]:
+def query_gemini(prompt: str, schema: dict, model_name: str = "gemini-2.5-pro",
+                 usage: dict | None = None) -> dict | str | List[Dict]:
+    # google-genai is slow to import, load it on first use to keep cold starts fast
+    from google.oauth2 import service_account
+    import google.genai as genai
+    from google.genai import types
+
     project_id = os.getenv('GOOGLE_PROJECT_ID', 'doculoom-446020')
     location = os.getenv('GOOGLE_LOCATION', 'us-central1')
     model_name = os.getenv('GEMINI_MODEL', model_name)
@@ -68,6 +70,11 @@ def query_gemini(prompt: str, schema: dict, model_name: str = "gemini-2.5-pro")
             contents=prompt,
             config=generation_config,
         )
+        # callers that pass a dict get the billed token counts back
+        metadata = getattr(response, 'usage_metadata', None)
+        if usage is not None and metadata is not None:
+            usage['prompt_tokens'] = metadata.prompt_token_count
+            usage['output_tokens'] = metadata.candidates_token_count
 
         if response.candidates and len(response.candidates) > 0:
             candidate = response.candidates[0]
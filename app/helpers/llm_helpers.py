@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Dict, Optional
+
+from app.helpers.gemini_helpers import query_gemini
+from app.helpers.plex_helpers import query_perplexity
+from app.utils.parsing import unwrap_schema_result
+from app.utils.tracing import span
+
+DEFAULT_HEDGE_DELAY = 120.0
+LATENCY_WINDOW = 50
+
+
+def _gemini_backend(prompt: str, schema: dict, model_name: Optional[str] = None):
+    if model_name:
+        return query_gemini(prompt, schema, model_name=model_name)
+    return query_gemini(prompt, schema)
+
+
+def _perplexity_backend(prompt: str, schema: dict, model_name: Optional[str] = None):
+    return query_perplexity(prompt, schema)
+
+
+LLM_BACKENDS: Dict[str, Callable] = {
+    'gemini': _gemini_backend,
+    'perplexity': _perplexity_backend,
+}
+
+_latencies: Dict[str, deque] = {}
+_latency_lock = threading.Lock()
+
+
+def record_latency(backend: str, seconds: float) -> None:
+    with _latency_lock:
+        _latencies.setdefault(backend, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+def latency_percentile(backend: str, percentile: float) -> Optional[float]:
+    with _latency_lock:
+        samples = sorted(_latencies.get(backend, ()))
+    if not samples:
+        return None
+    idx = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+    return samples[idx]
+
+
+def _configured_backends() -> List[str]:
+    names = os.getenv('LLM_BACKENDS', 'gemini,perplexity')
+    return [n.strip() for n in names.split(',') if n.strip() in LLM_BACKENDS]
+
+
+def _run_backend(name: str, prompt: str, schema: dict, model_name: Optional[str]):
+    start = time.monotonic()
+    try:
+        with span(f'llm.{name}'):
+            result = LLM_BACKENDS[name](prompt, schema, model_name)
+    except Exception as e:
+        logging.error(f'LLM backend {name} failed: {e}')
+        return None
+    # fast failures would pull the hedge percentile down, only answers count
+    if result:
+        record_latency(name, time.monotonic() - start)
+    return result
+
+
+def query_llm(prompt: str, schema: dict, model_name: Optional[str] = None, backends: Optional[List[str]] = None,
+              mode: Optional[str] = None, hedge_percentile: Optional[float] = None,
+              timeout: Optional[float] = None) -> dict | List[Dict]:
+    """Query several LLM backends and return the first result that matches schema.
+
+    mode 'race' starts every backend at once, 'hedge' starts the first backend
+    and only fires the others once it is slower than hedge_percentile of its
+    recent latencies. Whatever is still pending when a valid result arrives is
+    cancelled. If nothing validates, the primary backend's result is returned
+    so callers keep working with partially valid responses.
+    """
+    backends = backends or _configured_backends()
+    mode = mode or os.getenv('LLM_MODE', 'hedge')
+    hedge_percentile = hedge_percentile or float(os.getenv('LLM_HEDGE_PERCENTILE', 95))
+    timeout = timeout or float(os.getenv('LLM_TIMEOUT_SECONDS', 900))
+
+    if not backends:
+        logging.error('No LLM backends configured')
+        return {}
+
+    # a single backend also runs on the executor so timeout holds for it too
+    executor = ThreadPoolExecutor(max_workers=len(backends), thread_name_prefix='llm')
+    deadline = time.monotonic() + timeout
+    pending = {}
+    waiting = list(backends)
+    fallback = None
+
+    def launch(name: str) -> None:
+        logging.info(f'Querying LLM backend {name}')
+        pending[executor.submit(_run_backend, name, prompt, schema, model_name)] = name
+
+    launch(waiting.pop(0))
+    if mode == 'race':
+        while waiting:
+            launch(waiting.pop(0))
+
+    hedge_at = None
+    if waiting:
+        delay = latency_percentile(backends[0], hedge_percentile) or DEFAULT_HEDGE_DELAY
+        hedge_at = time.monotonic() + delay
+
+    try:
+        while pending or waiting:
+            now = time.monotonic()
+            if now >= deadline:
+                logging.error('LLM query timed out')
+                break
+
+            if waiting and (not pending or (hedge_at is not None and now >= hedge_at)):
+                logging.warning(f'Hedging LLM request to {waiting[0]}')
+                launch(waiting.pop(0))
+                hedge_at = None if not waiting else now + (
+                    latency_percentile(backends[0], hedge_percentile) or DEFAULT_HEDGE_DELAY)
+                continue
+
+            wake = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, _ = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                result = future.result()
+                valid = unwrap_schema_result(result, schema)
+                if valid is not None:
+                    logging.info(f'LLM backend {name} returned first valid result')
+                    return valid
+                logging.warning(f'LLM backend {name} returned a result that does not match the schema')
+                if result and (fallback is None or name == backends[0]):
+                    fallback = result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return unwrap_schema_result(fallback, schema, strict=False) or {}
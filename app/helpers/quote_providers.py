@@ -0,0 +1,439 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import requests
+
+from app.utils.aio_http import HTTPError, get_json
+
+QUOTE_FIELDS = ('c', 'd', 'dp', 'h', 'l', 'o', 'pc', 't')
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class CandlesUnavailable(Exception):
+    """The provider, or the plan its keys are on, does not serve daily candles."""
+
+
+class QuoteProvider:
+    """Market data source returning quotes in Finnhub's quote shape."""
+    name = 'base'
+    batch_size = 1
+    # API keys spread over, the call budget scales with it
+    key_count = 1
+
+    def key_stats(self) -> dict:
+        return {}
+
+    def quote(self, symbol: str) -> dict:
+        raise NotImplementedError
+
+    def quotes(self, symbols: List[str]) -> Dict[str, dict]:
+        return {symbol: self.quote(symbol) for symbol in symbols}
+
+    def candles(self, symbol: str, start: int, end: int) -> dict:
+        """Daily candles between two unix times in Finnhub's shape ({'s', 't', 'o', 'h', 'l', 'c', 'v'})."""
+        raise CandlesUnavailable(f'{self.name} does not serve candles')
+
+    async def aquotes(self, symbols: List[str]) -> Dict[str, dict]:
+        """Async batch quotes; providers without native async support use a worker thread."""
+        return await asyncio.to_thread(self.quotes, symbols)
+
+
+class ApiKeyPool:
+    """API keys with a token bucket each, handed out least loaded first.
+
+    A key answering 429 is parked for rate_limit_cooldown_seconds and one
+    rejected as unauthorized for auth_cooldown_seconds; parked keys are
+    re-admitted on their own once that time is up.
+    """
+
+    def __init__(self, keys: List[str], calls_per_minute: float = 60, rate_limit_cooldown_seconds: float = 60,
+                 auth_cooldown_seconds: float = 900):
+        if not keys:
+            raise ValueError('At least one API key is required')
+        self.keys = list(dict.fromkeys(keys))
+        self.rate = calls_per_minute / 60
+        # a full bucket is a second of calls, so a key never bursts past its per-minute quota
+        self.burst = max(1.0, self.rate)
+        self.rate_limit_cooldown_seconds = rate_limit_cooldown_seconds
+        self.auth_cooldown_seconds = auth_cooldown_seconds
+        now = time.monotonic()
+        self._state = {key: {'tokens': self.burst, 'refilled': now, 'in_flight': 0, 'parked_until': 0.0,
+                             'calls': 0, 'rate_limited': 0, 'auth_errors': 0} for key in self.keys}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> tuple[Optional[str], float]:
+        """A key to call with, or None and the seconds until one frees up."""
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for key, state in self._state.items():
+                if state['parked_until'] > now:
+                    continue
+                state['tokens'] = min(self.burst, state['tokens'] + (now - state['refilled']) * self.rate)
+                state['refilled'] = now
+                available.append((state['in_flight'], -state['tokens'], key))
+            if not available:
+                return None, min(state['parked_until'] for state in self._state.values()) - now
+
+            # least loaded among the keys that can take a call right now
+            ready = [entry for entry in available if -entry[1] >= 1]
+            if not ready:
+                return None, min((1 + t) / self.rate for _, t, _ in available)
+            in_flight, tokens, key = min(ready)
+            state = self._state[key]
+            state['tokens'] -= 1
+            state['in_flight'] += 1
+            state['calls'] += 1
+            return key, 0.0
+
+    def release(self, key: str, status: Optional[int] = None) -> None:
+        """Return a key after a call, parking it when the call was rate limited or unauthorized."""
+        with self._lock:
+            state = self._state[key]
+            state['in_flight'] -= 1
+            if status == 429:
+                state['rate_limited'] += 1
+                seconds = self.rate_limit_cooldown_seconds
+            elif status in (401, 403):
+                state['auth_errors'] += 1
+                seconds = self.auth_cooldown_seconds
+            else:
+                return
+            now = time.monotonic()
+            # calls already in flight on a parked key report the same error, log it once
+            newly_parked = state['parked_until'] <= now
+            state['parked_until'] = now + seconds
+        if newly_parked:
+            logging.warning(f'Finnhub key ...{key[-4:]} answered {status}, parking it for {seconds}s')
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {f'...{key[-4:]}': {'calls': state['calls'], 'in_flight': state['in_flight'],
+                                       'rate_limited': state['rate_limited'], 'auth_errors': state['auth_errors'],
+                                       'parked_for': round(max(0.0, state['parked_until'] - now), 1)}
+                    for key, state in self._state.items()}
+
+
+class FinnhubProvider(QuoteProvider):
+    """Finnhub quotes spread over a pool of API keys.
+
+    Keys come from FINNHUB_API_KEYS (comma separated) or FINNHUB_API_KEY. A
+    call rejected with 429 or an auth error parks its key and is retried on
+    the next one; RateLimitError is raised once no key can take the call
+    within max_wait_seconds.
+    """
+    name = 'finnhub'
+    # overridable so load tests can point the tracker at a local stand-in
+    base_url = os.getenv('FINNHUB_BASE_URL', 'https://finnhub.io/api/v1')
+
+    def __init__(self, api_key: Optional[str] = None, api_keys: Optional[List[str]] = None,
+                 calls_per_minute_per_key: float = 60, rate_limit_cooldown_seconds: float = 60,
+                 auth_cooldown_seconds: float = 900, max_wait_seconds: float = 5):
+        import finnhub
+        if not api_keys:
+            keys = os.getenv('FINNHUB_API_KEYS', '')
+            api_keys = [k.strip() for k in keys.split(',') if k.strip()] or [api_key or os.getenv('FINNHUB_API_KEY')]
+        self.pool = ApiKeyPool(api_keys, calls_per_minute_per_key, rate_limit_cooldown_seconds,
+                               auth_cooldown_seconds)
+        self.key_count = len(self.pool.keys)
+        self.max_wait_seconds = max_wait_seconds
+        self.clients = {}
+        for key in self.pool.keys:
+            self.clients[key] = finnhub.Client(api_key=key)
+            self.clients[key].API_URL = self.base_url
+
+    def key_stats(self) -> dict:
+        return self.pool.stats()
+
+    def _rejected(self, symbol: str, waited: float, status: Optional[int] = None) -> RateLimitError:
+        return RateLimitError(f'No Finnhub key available for {symbol} after {waited:.1f}s'
+                              + (f' (last status {status})' if status else ''))
+
+    def _call(self, symbol: str, fn, retry_statuses: tuple = (401, 403, 429)):
+        waited, status = 0.0, None
+        while True:
+            key, wait = self.pool.acquire()
+            if key is None:
+                if waited + wait > self.max_wait_seconds:
+                    raise self._rejected(symbol, waited, status)
+                time.sleep(wait)
+                waited += wait
+                continue
+            try:
+                result = fn(self.clients[key])
+            except Exception as e:
+                status = getattr(e, 'status_code', None)
+                # only statuses that are retried on another key say anything about this key's health
+                self.pool.release(key, status if status in retry_statuses else None)
+                if status in retry_statuses:
+                    continue
+                raise
+            self.pool.release(key)
+            return result
+
+    def quote(self, symbol: str) -> dict:
+        return self._call(symbol, lambda client: client.quote(symbol))
+
+    def candles(self, symbol: str, start: int, end: int) -> dict:
+        # candles share the quote budget, but a key without candle access is still fine for quotes,
+        # so only a 429 parks the key
+        try:
+            return self._call(symbol, lambda client: client.stock_candles(symbol, 'D', start, end),
+                              retry_statuses=(429,))
+        except Exception as e:
+            status = getattr(e, 'status_code', None)
+            if status in (401, 403):
+                raise CandlesUnavailable(f'Finnhub candles for {symbol} answered {status}') from e
+            raise
+
+    async def aquote(self, symbol: str) -> dict:
+        waited, status = 0.0, None
+        while True:
+            key, wait = self.pool.acquire()
+            if key is None:
+                if waited + wait > self.max_wait_seconds:
+                    raise self._rejected(symbol, waited, status)
+                await asyncio.sleep(wait)
+                waited += wait
+                continue
+            try:
+                result = await get_json(f'{self.base_url}/quote', {'symbol': symbol, 'token': key})
+            except HTTPError as e:
+                status = e.status
+                self.pool.release(key, status)
+                if status in (401, 403, 429):
+                    continue
+                raise
+            except Exception:
+                self.pool.release(key)
+                raise
+            self.pool.release(key)
+            return result
+
+    async def aquotes(self, symbols: List[str]) -> Dict[str, dict]:
+        results = await asyncio.gather(*(self.aquote(symbol) for symbol in symbols))
+        return dict(zip(symbols, results))
+
+
+class FMPProvider(QuoteProvider):
+    name = 'fmp'
+    base_url = os.getenv('FMP_BASE_URL', 'https://financialmodelingprep.com/api/v3')
+
+    def __init__(self, api_key: Optional[str] = None, batch_size: int = 50):
+        self.api_key = api_key or os.getenv('FMP_API_KEY')
+        if not self.api_key:
+            raise ValueError('FMP_API_KEY environment variable not set')
+        self.batch_size = batch_size
+
+    @staticmethod
+    def _normalize(item: dict) -> dict:
+        return {
+            'c': item.get('price'),
+            'd': item.get('change'),
+            'dp': item.get('changesPercentage'),
+            'h': item.get('dayHigh'),
+            'l': item.get('dayLow'),
+            'o': item.get('open'),
+            'pc': item.get('previousClose'),
+            't': item.get('timestamp'),
+            'v': item.get('volume'),
+        }
+
+    def quote(self, symbol: str) -> dict:
+        return self.quotes([symbol]).get(symbol, defaultdict(int))
+
+    def quotes(self, symbols: List[str]) -> Dict[str, dict]:
+        url = f"{self.base_url}/quote/{','.join(symbols)}"
+        response = requests.get(url, params={'apikey': self.api_key}, timeout=10)
+        if response.status_code == 429:
+            raise RateLimitError('FMP rate limit hit')
+        response.raise_for_status()
+        data = response.json()
+        if not isinstance(data, list):
+            raise ValueError(f'Unexpected FMP quote response: {data}')
+        return {item['symbol']: self._normalize(item) for item in data if 'symbol' in item}
+
+    async def aquotes(self, symbols: List[str]) -> Dict[str, dict]:
+        try:
+            data = await get_json(f"{self.base_url}/quote/{','.join(symbols)}", {'apikey': self.api_key})
+        except HTTPError as e:
+            if e.status == 429:
+                raise RateLimitError('FMP rate limit hit') from e
+            raise
+        if not isinstance(data, list):
+            raise ValueError(f'Unexpected FMP quote response: {data}')
+        return {item['symbol']: self._normalize(item) for item in data if 'symbol' in item}
+
+
+class ReplayProvider(QuoteProvider):
+    """Replays quotes recorded as JSON lines ({"symbol": ..., "c": ..., ...}).
+
+    Each symbol cycles through its recorded quotes, so a short recording can
+    drive the tracker for as long as needed.
+    """
+    name = 'replay'
+
+    def __init__(self, path: str, batch_size: int = 50):
+        self.batch_size = batch_size
+        self._series: Dict[str, List[dict]] = defaultdict(list)
+        self._positions: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                self._series[record.pop('symbol')].append(record)
+
+    def quote(self, symbol: str) -> dict:
+        series = self._series.get(symbol)
+        if not series:
+            raise KeyError(f'No recorded quotes for {symbol}')
+        with self._lock:
+            pos = self._positions[symbol]
+            self._positions[symbol] = (pos + 1) % len(series)
+        return dict(series[pos])
+
+    def quotes(self, symbols: List[str]) -> Dict[str, dict]:
+        # like a batch endpoint, symbols without a recording are left out rather than failing the batch
+        return {symbol: self.quote(symbol) for symbol in symbols if self._series.get(symbol)}
+
+    async def aquotes(self, symbols: List[str]) -> Dict[str, dict]:
+        return self.quotes(symbols)
+
+
+class FailoverProvider(QuoteProvider):
+    """Tries providers in order, parking any that error or hit a rate limit."""
+    name = 'failover'
+
+    def __init__(self, providers: List[QuoteProvider], cooldown_seconds: float = 60,
+                 rate_limit_cooldown_seconds: float = 60):
+        if not providers:
+            raise ValueError('At least one quote provider is required')
+        self.providers = providers
+        self.cooldown_seconds = cooldown_seconds
+        self.rate_limit_cooldown_seconds = rate_limit_cooldown_seconds
+        self._parked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def batch_size(self) -> int:
+        provider = self._available()[0]
+        return provider.batch_size
+
+    @property
+    def key_count(self) -> int:
+        return self.providers[0].key_count
+
+    def key_stats(self) -> dict:
+        return {p.name: p.key_stats() for p in self.providers if p.key_stats()}
+
+    def _available(self) -> List[QuoteProvider]:
+        now = time.monotonic()
+        with self._lock:
+            available = [p for p in self.providers if self._parked_until.get(p.name, 0) <= now]
+        # when everything is parked, keep trying rather than failing every call
+        return available or list(self.providers)
+
+    def _park(self, provider: QuoteProvider, error: Exception) -> None:
+        seconds = self.rate_limit_cooldown_seconds if isinstance(error, RateLimitError) else self.cooldown_seconds
+        logging.warning(f'Quote provider {provider.name} failed ({error}), parking for {seconds}s')
+        with self._lock:
+            self._parked_until[provider.name] = time.monotonic() + seconds
+
+    def candles(self, symbol: str, start: int, end: int) -> dict:
+        """Candles from the first provider that serves them; failures here never park a provider for quotes."""
+        last_error: Exception = CandlesUnavailable('No quote provider serves candles')
+        for provider in self._available():
+            try:
+                return provider.candles(symbol, start, end)
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    def quote(self, symbol: str) -> dict:
+        last_error = None
+        for provider in self._available():
+            try:
+                return provider.quote(symbol)
+            except Exception as e:
+                last_error = e
+                self._park(provider, e)
+        raise last_error
+
+    def quotes(self, symbols: List[str]) -> Dict[str, dict]:
+        results: Dict[str, dict] = {}
+        missing = list(symbols)
+        last_error = None
+        for provider in self._available():
+            try:
+                for start in range(0, len(missing), provider.batch_size):
+                    results.update(provider.quotes(missing[start:start + provider.batch_size]))
+            except Exception as e:
+                last_error = e
+                self._park(provider, e)
+            missing = [s for s in symbols if s not in results]
+            if not missing:
+                return results
+        if not results and last_error:
+            raise last_error
+        return results
+
+    async def aquotes(self, symbols: List[str]) -> Dict[str, dict]:
+        results: Dict[str, dict] = {}
+        missing = list(symbols)
+        last_error = None
+        for provider in self._available():
+            try:
+                for start in range(0, len(missing), provider.batch_size):
+                    results.update(await provider.aquotes(missing[start:start + provider.batch_size]))
+            except Exception as e:
+                last_error = e
+                self._park(provider, e)
+            missing = [s for s in symbols if s not in results]
+            if not missing:
+                return results
+        if not results and last_error:
+            raise last_error
+        return results
+
+
+def build_quote_provider(config: dict) -> QuoteProvider:
+    market_config = config.get('market_data', {})
+    names = market_config.get('providers', ['finnhub'])
+    batch_size = market_config.get('batch_size', 50)
+
+    providers = []
+    for name in names:
+        try:
+            if name == 'finnhub':
+                providers.append(FinnhubProvider(
+                    calls_per_minute_per_key=config.get('defaults', {}).get('max_quote_calls_per_min', 60),
+                    rate_limit_cooldown_seconds=market_config.get('rate_limit_cooldown_seconds', 60),
+                    auth_cooldown_seconds=market_config.get('auth_cooldown_seconds', 900),
+                ))
+            elif name == 'fmp':
+                providers.append(FMPProvider(batch_size=batch_size))
+            elif name == 'replay':
+                providers.append(ReplayProvider(market_config['replay_file'], batch_size=batch_size))
+            else:
+                logging.error(f'Unknown quote provider: {name}')
+        except Exception as e:
+            logging.error(f'Unable to set up quote provider {name}: {e}')
+
+    return FailoverProvider(
+        providers,
+        cooldown_seconds=market_config.get('failover_cooldown_seconds', 60),
+        rate_limit_cooldown_seconds=market_config.get('rate_limit_cooldown_seconds', 60),
+    )
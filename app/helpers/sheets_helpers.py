@@ -6,6 +6,7 @@ from typing import List, Dict, Optional
 from functools import lru_cache
 
 from app.constants import DAILY_RECOMMENDATIONS_PROMPT_PATH
+from app.utils.tracing import traced
 
 
 @lru_cache(maxsize=1)
@@ -62,6 +63,7 @@ def parse_date_value(value: str) -> Optional[datetime]:
         return None
 
 
+@traced('sheets.get_worksheet')
 def get_worksheet(sheet_id: str) -> Optional[object]:
     """Get worksheet object with error handling."""
     if not sheet_id:
@@ -81,6 +83,7 @@ def get_worksheet(sheet_id: str) -> Optional[object]:
         return None
 
 
+@traced('sheets.get_last_prompt_from_sheets')
 def get_last_prompt_from_sheets(sheet_id: str) -> str:
     """Get the last prompt from Google Sheets with improved error handling."""
     logging.debug("Getting last prompt from Google Sheets")
@@ -154,6 +157,7 @@ def upload_prompt_to_sheets() -> None:
         logging.error("Failed to upload prompt to sheets")
 
 
+@traced('sheets.append_to_sheet')
 def append_to_sheet(sheet_id: str | None, row: List[str], header: List[str] | None = None) -> bool:
     """Append row to Google Sheet with improved error handling."""
     logging.debug(f"Appending to sheet {sheet_id}: {row}")
@@ -175,6 +179,10 @@ def append_to_sheet(sheet_id: str | None, row: List[str], header: List[str] | No
                 if not existing_headers:
                     worksheet.append_row(header, value_input_option='USER_ENTERED')
                     logging.debug(f"Added header row: {header}")
+                elif len(existing_headers) < len(header) and header[:len(existing_headers)] == existing_headers:
+                    # columns added since the sheet was created, extend the header in place
+                    worksheet.update(values=[header], range_name='A1', value_input_option='USER_ENTERED')
+                    logging.info(f"Extended header row to {header}")
             except Exception as e:
                 logging.warning(f"Could not check/add header: {e}")
 
@@ -188,6 +196,7 @@ def append_to_sheet(sheet_id: str | None, row: List[str], header: List[str] | No
         return False
 
 
+@traced('sheets.get_last_prompt_date')
 def get_last_prompt_date(sheet_id: str) -> Optional[datetime]:
     """Get the date of the last prompt from the sheet."""
     if not sheet_id:
@@ -226,6 +235,7 @@ def get_last_prompt_date(sheet_id: str) -> Optional[datetime]:
         return None
 
 
+@traced('sheets.fetch_records_since')
 def fetch_records_since(sheet_id: str | None, since: datetime | None) -> List[Dict]:
     """Fetch records from Google Sheets with optional date filtering."""
     if not sheet_id:
@@ -362,13 +372,19 @@ def log_best_performers(recs: List[Dict[str, float]]) -> None:
         logging.error("Failed to log best performers data")
 
 
-def log_recommended_prompt(analysis: str, new_prompt: str) -> None:
+def log_recommended_prompt(analysis: str, new_prompt: str, prompt_tokens: int | None = None,
+                           latency_seconds: float | None = None, rows_used: str = '') -> None:
     """Log recommended prompt analysis to Google Sheets."""
     logging.info("Logging recommended prompt analysis")
 
     sheet_id = os.getenv("RECOMMENDED_PROMPT_SHEET_ID")
-    row = [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), analysis, new_prompt]
-    header = ["Date", "Analysis", "Prompt"]
+    row = [
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), analysis, new_prompt,
+        str(prompt_tokens) if prompt_tokens is not None else "",
+        f"{latency_seconds:.1f}" if latency_seconds is not None else "",
+        rows_used,
+    ]
+    header = ["Date", "Analysis", "Prompt", "PromptTokens", "LatencySeconds", "RowsUsed"]
 
     logging.debug(
         f"Logging recommended prompt to sheet {sheet_id or '<disabled>'}: {len(analysis)} chars analysis, {len(new_prompt)} chars prompt")
@@ -9,7 +9,8 @@ def fetch_top_gainers_from_fmp(limit: int = 5) -> List[Dict]:
     if not fmp_api_key:
         raise ValueError("FMP_API_KEY environment variable not set")
 
-    fmp_url = f"https://financialmodelingprep.com/api/v3/stock_market/gainers?apikey={fmp_api_key}"
+    base_url = os.getenv('FMP_BASE_URL', 'https://financialmodelingprep.com/api/v3')
+    fmp_url = f"{base_url}/stock_market/gainers?apikey={fmp_api_key}"
 
     try:
         response = requests.get(fmp_url)
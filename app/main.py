@@ -1,42 +1,105 @@
 import logging
+import os
+import signal
+import sys
+from typing import Callable, Optional
 
-from app.scheduler.job_scheduler import start_scheduler
-from app.database.db_manager import DBManager
-from app.utils.basic import load_config, setup_logging
+from app.alerts.outbox import NotificationOutbox
+from app.alerts.rules import compile_rules
+from app.helpers.quote_providers import build_quote_provider
+from app.utils.basic import setup_logging, mark_startup
+from app.utils.config_compiler import load_compiled_config
+from app.utils.indicators import indicator_registry
 from app.api_server import start_server
 
 
-def main() -> None:
-    config = load_config('config.yaml')
-    accounts = config['alertzy']['accounts']
-    user_notify_thresh = {}
-
-    for account in accounts:
-        user_id = account['user_id']
-        thresh = account['notify_thresh']
-        user_notify_thresh[user_id] = thresh
+def main(tick: Optional[Callable[[], bool]] = None) -> None:
+    """Run the tracker until SIGTERM; tick replaces the market hours check, for the bench and soak tools."""
+    compiled = load_compiled_config('config.yaml')
+    config = compiled.raw
+    user_notify_thresh = compiled.user_notify_thresh
 
     setup_logging('logs/app.log')
 
+    quote_provider = build_quote_provider(config)
+    # serve /health before the slower scheduler and database setup
+    server = start_server(port=int(os.getenv('PORT', 8000)), quote_provider=quote_provider)
+    mark_startup('server_ready')
+
+    # SQLAlchemy, numpy and the scheduler load after /health is up
+    from app.alerts.cooldown import CooldownStore
+    from app.database.alert_log import AlertEventLog
+    from app.database.db_manager import DBManager
+    from app.scheduler.job_scheduler import start_scheduler
+    from app.utils.candle_cache import CandleCache
+
     db_manager = DBManager()
 
     max_quote_calls_per_min = config['defaults'].get('max_quote_calls_per_min', 60)
     max_notifications = config['defaults'].get('max_notifications_per_day', 100)
 
-    ticker_config = {}
-    for item in config['tickers']:
-        symbol = item['symbol']
-        ticker_config[symbol] = item['threshold']
+    ticker_config = compiled.thresholds
+
+    indicator_registry.configure(
+        config['defaults'].get('indicator_window', 60),
+        config['defaults'].get('indicator_ema_span', 20),
+    )
+    candle_config = config.get('candles', {})
+    candle_cache = CandleCache(
+        candle_config.get('directory', 'candles'),
+        history_days=candle_config.get('history_days', 3 * 365),
+    )
+    rule_engine = compile_rules(compiled.tickers, candle_cache, user_notify_thresh)
+    cooldowns = CooldownStore(ticker_config, user_notify_thresh, db_manager)
+    cooldowns.load()
+
+    outbox_config = config.get('notifications', {})
+    outbox = NotificationOutbox(
+        db_manager,
+        per_account_per_minute=outbox_config.get('per_account_per_minute', 6),
+        burst=outbox_config.get('burst', 3),
+        max_attempts=outbox_config.get('max_attempts', 8),
+        requests_per_minute=outbox_config.get('requests_per_minute', 30),
+        retention_days=outbox_config.get('retention_days', 7),
+    )
+    # cooldowns and daily counts only move once Alertzy accepted the alert
+    outbox.on_delivered('threshold', lambda item: cooldowns.record_alert(
+        item['context']['ticker'], item['users'], item['context']['percentage_change']))
+    outbox.on_delivered('rule', lambda item: cooldowns.increment(item['users']))
+    outbox.start()
+
+    alert_log_config = config.get('alert_log', {})
+    alert_log = AlertEventLog(
+        alert_log_config.get('db_url', 'sqlite:///alert_events.db'),
+        retention_days=alert_log_config.get('retention_days', 90),
+    )
+    alert_log.start()
 
     logging.info('Starting Stock Price Alert Tracker.')
-    start_scheduler(
+    engine, snapshotter = start_scheduler(
         db_manager,
         ticker_config,
-        user_notify_thresh,
+        cooldowns,
+        quote_provider,
         max_notifications,
-        max_quote_calls_per_min
+        max_quote_calls_per_min,
+        rule_engine,
+        config['defaults'].get('snapshot_path', 'runtime.snapshot'),
+        config['defaults'].get('snapshot_interval_seconds', 300),
+        config['defaults'].get('max_in_flight_quotes', 4),
+        alert_log,
+        candle_cache,
+        tick,
     )
-    start_server()
+    server.tracker_engine = engine
+    server.cooldowns = cooldowns
+    server.max_notifications = max_notifications
+    server.outbox = outbox
+    server.alert_log = alert_log
+    mark_startup('scheduler_ready')
+
+    # fly and docker stop the machine with SIGTERM, exit through the shutdown path below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     try:
         import time
@@ -44,6 +107,10 @@ def main() -> None:
             time.sleep(1)
     except (KeyboardInterrupt, SystemExit):
         logging.info('Shutting down Stock Price Alert Tracker.')
+        engine.stop()
+        outbox.stop()
+        alert_log.stop()
+        snapshotter.save()
 
 
 if __name__ == '__main__':
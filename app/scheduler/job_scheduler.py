@@ -1,16 +1,25 @@
 import logging
+from datetime import datetime
+from functools import partial
+from typing import Callable
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
-import finnhub
-from queue import Queue
 from app.database.db_manager import DBManager
-import os
 
+from app.alerts.cooldown import CooldownStore
+from app.alerts.rules import RuleEngine
+from app.database.alert_log import AlertEventLog
+from app.helpers.quote_providers import QuoteProvider
 from app.helpers.sheets_helpers import upload_prompt_to_sheets
 from app.services.improve_prompt_service import improve_daily_prompt
-from app.services.price_tracker_service import check_stock_price_change
+from app.services.price_tracker_service import process_quotes, tracker_tick
+from app.services.snapshot_service import RuntimeSnapshotter
+from app.services.tracker_engine import TrackerEngine
+from app.utils.basic import MARKET_TIMEZONE
+from app.utils.candle_cache import CandleCache
+from app.utils.tracing import traced
 from app.services.daily_recommender_service import (
     get_daily_recommendations,
     send_daily_performance,
@@ -18,30 +27,33 @@ from app.services.daily_recommender_service import (
 )
 
 
-def start_scheduler(db_manager: DBManager, ticker_config: dict, user_notify_thresh: dict,
-                    max_notifications: int = 100, max_quote_calls_per_min: int = 60) -> None:
-    finnhub_client = finnhub.Client(api_key=os.getenv('FINNHUB_API_KEY'))
+def start_scheduler(db_manager: DBManager, ticker_config: dict, cooldowns: CooldownStore,
+                    quote_provider: QuoteProvider, max_notifications: int = 100,
+                    max_quote_calls_per_min: int = 60, rule_engine: RuleEngine | None = None,
+                    snapshot_path: str = 'runtime.snapshot',
+                    snapshot_interval_seconds: int = 300,
+                    max_in_flight_quotes: int = 4,
+                    alert_log: AlertEventLog | None = None,
+                    candle_cache: CandleCache | None = None,
+                    tick: Callable[[], bool] | None = None) -> tuple[TrackerEngine, RuntimeSnapshotter]:
     scheduler = BackgroundScheduler()
-    interval_seconds = (max_quote_calls_per_min // 60) + 1
 
-    ticker_queue = Queue()
-
-    for symbol in ticker_config:
-        ticker_queue.put(symbol)
-        logging.warning(f'Added ticker to queue: {symbol}')
-
-    scheduler.add_job(
-        func=check_stock_price_change,
-        trigger=IntervalTrigger(seconds=interval_seconds),
-        args=[ticker_config, user_notify_thresh, ticker_queue, finnhub_client, db_manager, max_notifications],
-        id=f'job_check_stock_price_change',
-        max_instances=3,
-        replace_existing=True
+    engine = TrackerEngine(
+        list(ticker_config),
+        quote_provider,
+        partial(process_quotes, ticker_config=ticker_config, cooldowns=cooldowns,
+                max_notifications=max_notifications, rule_engine=rule_engine),
+        # the per-minute quota is per API key, a pool of keys multiplies it
+        calls_per_minute=max_quote_calls_per_min * quote_provider.key_count,
+        max_in_flight=max_in_flight_quotes,
+        tick=tick or tracker_tick,
     )
-    logging.warning(f'Stock price tracker scheduled')
+    snapshotter = RuntimeSnapshotter(snapshot_path, engine, rule_engine)
+    snapshotter.restore(list(ticker_config))
+    engine.start()
 
     scheduler.add_job(
-        func=db_manager.reset_daily_counters,
+        func=traced('job.reset_daily_counters')(cooldowns.reset_daily_counters),
         trigger='cron',
         hour=0,
         minute=0,
@@ -51,25 +63,25 @@ def start_scheduler(db_manager: DBManager, ticker_config: dict, user_notify_thre
     )
 
     scheduler.add_job(
-        func=get_daily_recommendations,
+        func=traced('job.daily_recommendations')(get_daily_recommendations),
         trigger=CronTrigger(hour=9, minute=30, timezone='US/Eastern', day_of_week='mon-fri'),
-        args=[finnhub_client],
+        args=[quote_provider],
         id='daily_recommendations',
         max_instances=1,
         replace_existing=True,
     )
 
     scheduler.add_job(
-        func=send_daily_performance,
+        func=traced('job.daily_performance')(send_daily_performance),
         trigger=CronTrigger(hour=16, minute=0, timezone='US/Eastern', day_of_week='mon-fri'),
-        args=[finnhub_client],
+        args=[quote_provider],
         id='daily_performance',
         max_instances=1,
         replace_existing=True,
     )
 
     scheduler.add_job(
-        func=get_best_daily_performers,
+        func=traced('job.best_daily_performers')(get_best_daily_performers),
         trigger=CronTrigger(hour=16, minute=5, timezone='US/Eastern', day_of_week='mon-fri'),
         id='best_daily_performers',
         max_instances=1,
@@ -77,7 +89,7 @@ def start_scheduler(db_manager: DBManager, ticker_config: dict, user_notify_thre
     )
 
     scheduler.add_job(
-        func=upload_prompt_to_sheets,
+        func=traced('job.upload_prompt_tracking')(upload_prompt_to_sheets),
         trigger=CronTrigger(hour=8, minute=0, timezone='US/Eastern'),
         id='upload_prompt_tracking',
         max_instances=1,
@@ -85,12 +97,43 @@ def start_scheduler(db_manager: DBManager, ticker_config: dict, user_notify_thre
     )
 
     scheduler.add_job(
-        func=improve_daily_prompt,
+        func=traced('job.improve_daily_prompt')(improve_daily_prompt),
         trigger=CronTrigger(day_of_week='sun', hour=8, minute=0, timezone='US/Eastern'),
         id='improve_daily_prompt',
         max_instances=1,
         replace_existing=True,
     )
 
+    scheduler.add_job(
+        func=traced('job.save_runtime_snapshot')(snapshotter.save),
+        trigger=IntervalTrigger(seconds=snapshot_interval_seconds),
+        id='save_runtime_snapshot',
+        max_instances=1,
+        replace_existing=True,
+    )
+
+    if candle_cache is not None:
+        symbols = list(ticker_config)
+        scheduler.add_job(
+            func=traced('job.refresh_candles')(candle_cache.refresh),
+            trigger=CronTrigger(hour=8, minute=30, timezone='US/Eastern', day_of_week='mon-fri'),
+            args=[quote_provider, symbols],
+            id='refresh_candles',
+            max_instances=1,
+            replace_existing=True,
+            # catch up right away when the process starts after today's refresh time
+            **({'next_run_time': datetime.now(MARKET_TIMEZONE)} if candle_cache.is_stale(symbols) else {}),
+        )
+
+    if alert_log is not None:
+        scheduler.add_job(
+            func=traced('job.alert_log_retention')(alert_log.apply_retention),
+            trigger=CronTrigger(hour=1, minute=0, timezone='US/Eastern'),
+            id='alert_log_retention',
+            max_instances=1,
+            replace_existing=True,
+        )
+
     scheduler.start()
     logging.warning('Scheduler started.')
+    return engine, snapshotter
@@ -44,4 +44,17 @@ IMPROVE_SCHEMA = {
     "type": "object",
     "properties": {"new_prompt": {"type": "string"}, "analysis": {"type": "string"}},
     "required": ["new_prompt", "analysis"],
-}
\ No newline at end of file
+}
+
+SHARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "candidates": {
+            "type": "array",
+            "items": DAILY_SCHEMA["properties"]["recommendations"]["items"],
+            "minItems": 0,
+            "maxItems": 10
+        }
+    },
+    "required": ["candidates"]
+}
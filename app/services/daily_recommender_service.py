@@ -1,24 +1,25 @@
 import logging
+from datetime import date
 from typing import List, Dict, Optional
 
-import finnhub
-
-from app.alerts.notifier import send_notification
+from app.alerts.outbox import notify
 from app.constants import DAILY_RECOMMENDATIONS_PROMPT_PATH, DAILY_BEST_PERFORMERS_PROMPT_PATH
-from app.helpers.gemini_helpers import query_gemini
-from app.helpers.plex_helpers import query_perplexity
+from app.helpers.llm_helpers import query_llm
+from app.helpers.quote_providers import QuoteProvider
 from app.helpers.sheets_helpers import log_daily_performance, log_best_performers
 from app.helpers.stock_helpers import fetch_top_gainers_from_fmp
 from app.schemas.prompt_schemas import DAILY_SCHEMA, BEST_PERFORMERS_SCHEMA
-from app.utils.basic import is_weekday, load_prompt
+from app.services.recommendation_fanout import fanout_recommendations
+from app.utils.basic import is_weekday, get_prompt
+from app.utils.config_compiler import load_compiled_config
+from app.utils.single_flight import SingleFlight
 
 daily_recommendations: List[Dict[str, float]] = []
-
-DAILY_RECOMMENDATIONS_PROMPT = load_prompt(DAILY_RECOMMENDATIONS_PROMPT_PATH)
-DAILY_BEST_PERFORMERS_PROMPT = load_prompt(DAILY_BEST_PERFORMERS_PROMPT_PATH)
+# the scheduled jobs and the manual API triggers share one run and its result per trading day
+daily_runs = SingleFlight()
 
 
-def get_market_pct(client: finnhub.Client) -> Optional[float]:
+def get_market_pct(client: QuoteProvider) -> Optional[float]:
     try:
         quote = client.quote('SPY')
         open_price = quote.get('o')
@@ -30,15 +31,35 @@ def get_market_pct(client: finnhub.Client) -> Optional[float]:
     return None
 
 
-def get_daily_recommendations(finnhub_client: finnhub.Client, api=False) -> Dict:
+def get_daily_recommendations(quote_provider: QuoteProvider, api=False) -> Dict:
     if not api and not is_weekday():
         return {}
-    logging.info('Fetching daily stock recommendations from Gemini')
-    response = query_gemini(DAILY_RECOMMENDATIONS_PROMPT, DAILY_SCHEMA)
+    result = daily_runs.run('recommendations', lambda: _generate_recommendations(quote_provider))
+    # the scheduled run tells every user, a manual trigger only tells the admin about a run it started itself
+    if result.get('message') and (not api or not (result['cached'] or result['shared'])):
+        notify(result['message'], admin=api, dedup_key=f'daily_recommendations:{date.today()}:{api}')
+    return result
+
+
+def _generate_recommendations(quote_provider: QuoteProvider) -> Dict:
+    logging.info('Fetching daily stock recommendations from LLM backends')
+    rec_config = load_compiled_config('config.yaml').raw.get('recommendations', {})
+    if rec_config.get('mode') == 'fanout':
+        response = fanout_recommendations(
+            get_prompt(DAILY_RECOMMENDATIONS_PROMPT_PATH),
+            sectors=rec_config.get('sectors'),
+            shard_model=rec_config.get('shard_model', 'gemini-2.5-flash'),
+            rank_model=rec_config.get('rank_model', 'gemini-2.5-flash'),
+            deadline_seconds=rec_config.get('deadline_seconds', 300),
+            rank_seconds=rec_config.get('rank_seconds', 60),
+            max_candidates=rec_config.get('candidates_per_sector', 3),
+        )
+    else:
+        response = query_llm(get_prompt(DAILY_RECOMMENDATIONS_PROMPT_PATH), DAILY_SCHEMA)
 
     for rec in response:
         try:
-            quote = finnhub_client.quote(rec['symbol'])
+            quote = quote_provider.quote(rec['symbol'])
             open_price = quote.get('o')
         except Exception as e:
             logging.error(f"Failed to fetch open price for {rec['symbol']}: {e}")
@@ -52,20 +73,19 @@ def get_daily_recommendations(finnhub_client: finnhub.Client, api=False) -> Dict
         lines = [f"{r['symbol']}: {r['catalyst']} Target: {r['target']} Risk: {r['risk']}" for r in
                  daily_recommendations]
         message = "Stocklerts read the news and recommends:\n" + "\n".join(lines)
-        send_notification(message, admin=api)
         return {"message": message}
 
     return {}
 
 
-def send_daily_performance(finnhub_client: finnhub.Client, api=False) -> Dict:
+def send_daily_performance(quote_provider: QuoteProvider, api=False) -> Dict:
     global daily_recommendations
     if (not api and not is_weekday()) or not daily_recommendations:
         return {}
     lines = []
     for rec in daily_recommendations:
         try:
-            quote = finnhub_client.quote(rec['symbol'])
+            quote = quote_provider.quote(rec['symbol'])
             close_price = quote.get('c')
             open_price = rec.get('open_price')
             if open_price and close_price is not None:
@@ -78,8 +98,8 @@ def send_daily_performance(finnhub_client: finnhub.Client, api=False) -> Dict:
             logging.error(f"Failed to fetch close price for {rec['symbol']}: {e}")
     if lines:
         message = "Performance of today's picks:\n" + "\n".join(lines)
-        send_notification(message, admin=api)
-        market_pct = get_market_pct(finnhub_client)
+        notify(message, admin=api, dedup_key=f'daily_performance:{date.today()}:{api}')
+        market_pct = get_market_pct(quote_provider)
         try:
             log_daily_performance(daily_recommendations, market_pct)
         except Exception as e:
@@ -106,8 +126,8 @@ def get_best_daily_performers(api=False) -> Dict:
             tickers.append(s)
         tickers_str = "\n ".join(tickers)
 
-        prompt = DAILY_BEST_PERFORMERS_PROMPT.format(tickers_str=tickers_str)
-        response = query_gemini(prompt, BEST_PERFORMERS_SCHEMA, model_name='gemini-2.5-flash')
+        prompt = get_prompt(DAILY_BEST_PERFORMERS_PROMPT_PATH).format(tickers_str=tickers_str)
+        response = query_llm(prompt, BEST_PERFORMERS_SCHEMA, model_name='gemini-2.5-flash')
 
         reason_dict = {item['symbol']: item['reason'] for item in response if
                        isinstance(item, dict) and 'symbol' in item}
@@ -132,7 +152,7 @@ def get_best_daily_performers(api=False) -> Dict:
             else:
                 lines.append(f"{r['symbol']}: {r['reason']}")
         message = "Today's best performers:\n" + "\n".join(lines)
-        send_notification(message, admin=api)
+        notify(message, admin=api, dedup_key=f'best_daily_performers:{date.today()}:{api}')
         log_best_performers(recs_with_pct)
         return {"message": message}
 
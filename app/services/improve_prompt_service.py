@@ -1,16 +1,18 @@
 import logging
 import os
+import time
 from typing import Dict
 
-from app.alerts.notifier import send_notification
+from app.alerts.outbox import notify
 from app.constants import DAILY_RECOMMENDATIONS_PROMPT_PATH, IMPROVE_PROMPT_PATH
 from app.helpers.gemini_helpers import query_gemini
 from app.helpers.sheets_helpers import fetch_records_since, get_last_prompt_date, log_recommended_prompt
 from app.schemas.prompt_schemas import IMPROVE_SCHEMA
-from app.utils.basic import load_prompt, fmt
+from app.utils.basic import get_prompt
+from app.utils.compaction import compact_history, estimate_tokens
 
-IMPROVE_PROMPT = load_prompt(IMPROVE_PROMPT_PATH)
-DAILY_RECOMMENDATIONS_PROMPT = load_prompt(DAILY_RECOMMENDATIONS_PROMPT_PATH)
+# tokens of sheet history sent along with the current prompt
+DEFAULT_HISTORY_TOKEN_BUDGET = 6000
 
 
 def improve_daily_prompt() -> Dict:
@@ -28,20 +30,31 @@ def improve_daily_prompt() -> Dict:
         logging.warning("No new data found for prompt improvement")
         return {"ok": False}
 
-    prompt = IMPROVE_PROMPT.format(
-        current_prompt=DAILY_RECOMMENDATIONS_PROMPT,
-        daily_rows=fmt(daily_rows),
-        best_rows=fmt(best_rows),
+    budget = int(os.getenv("PROMPT_HISTORY_TOKEN_BUDGET", DEFAULT_HISTORY_TOKEN_BUDGET))
+    daily_text, best_text, used = compact_history(daily_rows, best_rows, budget)
+    prompt = get_prompt(IMPROVE_PROMPT_PATH).format(
+        current_prompt=get_prompt(DAILY_RECOMMENDATIONS_PROMPT_PATH),
+        daily_rows=daily_text,
+        best_rows=best_text,
     )
-
-    resp = query_gemini(prompt, IMPROVE_SCHEMA)
+    rows_used = (f"daily {used['daily_rows_used']}/{used['daily_rows']}, "
+                 f"best {used['best_rows_used']}/{used['best_rows']}")
+    logging.warning(f"Improve prompt is ~{estimate_tokens(prompt)} tokens using {rows_used} rows")
+
+    usage = {}
+    start = time.monotonic()
+    resp = query_gemini(prompt, IMPROVE_SCHEMA, usage=usage)
+    latency = time.monotonic() - start
+    prompt_tokens = usage.get('prompt_tokens') or estimate_tokens(prompt)
+    logging.warning(f"Improve prompt answered in {latency:.1f}s, {prompt_tokens} prompt tokens")
     new_prompt = resp.get("new_prompt") if isinstance(resp, dict) else None
     if not new_prompt:
         logging.error("Gemini did not return improved prompt")
         return {"ok": False}
 
-    log_recommended_prompt(analysis=resp['analysis'], new_prompt=resp['new_prompt'])
-    send_notification("Daily prompt is updated", admin=True)
+    log_recommended_prompt(analysis=resp['analysis'], new_prompt=resp['new_prompt'],
+                           prompt_tokens=prompt_tokens, latency_seconds=latency, rows_used=rows_used)
+    notify("Daily prompt is updated", admin=True)
     return {"ok": True}
 
 
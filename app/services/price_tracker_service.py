@@ -1,87 +1,132 @@
 import logging
+import time
 from collections import defaultdict
-from queue import Queue
-from typing import Any
+from typing import TYPE_CHECKING, Callable
 
+from app.alerts.latency import alert_latency
 from app.alerts.notifier import send_notification
-from app.database.db_manager import DBManager
-from app.utils.basic import is_market_open, state_tracker, heartbeat, load_config
+from app.alerts.outbox import outbox_state
+from app.alerts.rules import RuleEngine
+from app.database.alert_log import record_delivery
+from app.utils.indicators import IndicatorState, indicator_registry
+from app.utils.tracing import traced
+from app.utils.basic import is_market_open, state_tracker, heartbeat, mark_startup
+from app.utils.config_compiler import load_compiled_config
 
-config = load_config('config.yaml')
+if TYPE_CHECKING:
+    # numpy is only loaded once main() builds the cooldown arrays
+    from app.alerts.cooldown import CooldownStore
 
+config = load_compiled_config('config.yaml').raw
 
-def fetch_quote(ticker: str, finnhub_client) -> dict[Any, Any] | Any:
-    try:
-        quote = finnhub_client.quote(ticker)
-        return quote
-    except Exception as e:
-        logging.error(f'Error fetching price for {ticker}: {e}')
-        return defaultdict(int)
+# latest quote per ticker, when it was last fetched and when a fetch last returned a price,
+# kept for snapshots and readers outside the tracker
+latest_quotes: dict[str, dict] = {}
+last_checked: dict[str, float] = {}
+last_quoted: dict[str, float] = {}
 
 
 @heartbeat(config['heartbeat']['url'])
 @state_tracker
-def check_stock_price_change(ticker_config: dict, user_notify_thresh: dict, ticker_queue: Queue,
-                             finnhub_client, db_manager: DBManager, max_notifications: int) -> None:
-    if not is_market_open():
+def tracker_tick() -> bool:
+    """Called by the tracker engine before each dispatch, returns whether to keep fetching."""
+    return is_market_open()
+
+
+@traced('tracker.process_quotes')
+def process_quotes(tickers: list[str], quotes: dict[str, dict], ticker_config: dict, cooldowns: 'CooldownStore',
+                   max_notifications: int, rule_engine: RuleEngine | None = None,
+                   fetched_at: float | None = None) -> None:
+    mark_startup('first_quote')
+    # the engine passes when the batch came back, before any wait for the evaluator thread
+    fetched_at = fetched_at or time.time()
+    for ticker in tickers:
+        quote = quotes.get(ticker) or defaultdict(int)
+        last_checked[ticker] = fetched_at
+        if quote.get('c'):
+            latest_quotes[ticker] = dict(quote)
+            last_quoted[ticker] = fetched_at
+        indicators = indicator_registry.update(ticker, quote)
+        evaluate_quote(ticker, quote, ticker_config, cooldowns, max_notifications, fetched_at)
+        if rule_engine is not None:
+            evaluate_rules(ticker, quote, rule_engine, cooldowns, max_notifications, indicators, fetched_at)
+
+
+def dispatch_alert(kind: str, ticker: str, message: str, users: list, context: dict,
+                   on_sent: Callable[[list], None], coalesce: bool = False, dedup: str | None = None) -> None:
+    """Queue an alert on the outbox, whose delivery callback updates state, or send it directly.
+
+    With coalesce, users still waiting on an earlier alert of this kind for
+    the ticker are left out instead of being queued a second time. Otherwise
+    the dedup key ends with dedup, or the message when it is not given.
+    """
+    outbox = outbox_state['outbox']
+    if outbox is not None and coalesce:
+        pending = outbox.pending_users(kind, ticker)
+        users = [user_id for user_id in users if user_id not in pending]
+        if not users:
+            return
+
+    logging.info('For %s notifying %s: %s', ticker, users, message, extra={'ticker': ticker, 'users': users})
+    context = dict(context, ticker=ticker, evaluated_at=time.time())
+    if outbox is None:
+        send_started = time.time()
+        if send_notification(message, set(users)):
+            alert_latency.record_alert(context, send_started, time.time())
+            on_sent(users)
+            record_delivery(kind, users, context)
         return
+    dedup_key = f"{kind}:{ticker}:{','.join(map(str, sorted(users)))}"
+    context['enqueued_at'] = time.time()
+    outbox.enqueue(message, users, kind=kind, dedup_key=dedup_key if coalesce else f'{dedup_key}:{dedup or message}',
+                   context=context)
+    alert_latency.record('db_write', time.time() - context['enqueued_at'], ticker)
 
-    ticker = ticker_queue.get()
-    quote = fetch_quote(ticker, finnhub_client)
-    current_price, prev_close, percentage_change = quote['c'], quote['pc'], quote['dp']
-
-    logging.debug(
-        f"Ticker: {ticker}, Current Price: {current_price}, "
-        f"Previous close: {prev_close}, Percentage Change: {percentage_change}%"
-    )
-    logging.debug(f'ticker_config[{ticker}] = {ticker_config[ticker]}')
-
-    users_to_notify = set()
-
-    for threshold_config in ticker_config[ticker]:
-        threshold, users = threshold_config['value'], threshold_config['users']
-
-        # positive: stock price below the threshold
-        if threshold >= 0 and threshold > percentage_change:
-            continue
-
-        # negative: stock price above the threshold
-        if threshold < 0 and threshold < percentage_change:
-            continue
-
-        for user_id in users:
-            user_notification_count = db_manager.get_user_notification_count(user_id)
 
-            if user_notification_count == 0.9 * max_notifications:
-                message = f'User {user_id} has almost reached the daily notification limit.'
-                logging.info(message)
-
-            # notification count check: alertz limitation
-            if user_notification_count >= max_notifications:
-                logging.warning(f'User {user_id} has reached the daily notification limit.')
-                continue
+@traced('tracker.evaluate_quote')
+def evaluate_quote(ticker: str, quote: dict, ticker_config: dict, cooldowns: 'CooldownStore',
+                   max_notifications: int, fetched_at: float | None = None) -> None:
+    current_price, prev_close, percentage_change = quote['c'], quote['pc'], quote['dp']
+    if not current_price or percentage_change is None:
+        logging.debug('No usable quote for %s, skipping', ticker)
+        return
 
-            # cooldown notifications
-            alerted, last_alert_thresh = db_manager.get_ticker_state(user_id, ticker)
-            if alerted:
-                if last_alert_thresh:
-                    if threshold < 0:
-                        if percentage_change > last_alert_thresh - user_notify_thresh[user_id]:
-                            continue
-                    else:
-                        if percentage_change < last_alert_thresh + user_notify_thresh[user_id]:
-                            continue
+    if logging.root.isEnabledFor(logging.DEBUG):
+        logging.debug(
+            'Ticker: %s, Current Price: %s, Previous close: %s, Percentage Change: %s%%, thresholds: %s',
+            ticker, current_price, prev_close, percentage_change, ticker_config[ticker],
+            extra={'ticker': ticker},
+        )
 
-            users_to_notify.add(user_id)
+    users_to_notify = cooldowns.eligible(ticker, percentage_change, max_notifications)
 
     if len(users_to_notify) > 0:
         message = f"{ticker} price has changed by {percentage_change:.2f}% ({prev_close} to {current_price})"
-        logging.debug(message)
-        logging.info(f'For {ticker} notifying {list(users_to_notify)}')
-        if send_notification(message, users_to_notify):
-            for user_id in users_to_notify:
-                db_manager.set_ticker_alerted(user_id, ticker, percentage_change)
-                db_manager.increment_notification_count(user_id)
-
-    logging.debug(f'Putting ticker {ticker} back in queue')
-    ticker_queue.put(ticker)
+        context = {'percentage_change': percentage_change, 'price': current_price, 'quote_time': quote.get('t'),
+                   'fetched_at': fetched_at}
+        dispatch_alert('threshold', ticker, message, users_to_notify, context,
+                       lambda users: cooldowns.record_alert(ticker, users, percentage_change), coalesce=True)
+
+
+@traced('tracker.evaluate_rules')
+def evaluate_rules(ticker: str, quote: dict, rule_engine: RuleEngine, cooldowns: 'CooldownStore',
+                   max_notifications: int, indicators: IndicatorState | None = None,
+                   fetched_at: float | None = None) -> None:
+    # rules crossed on the same quote often share a message, send it once
+    messages: dict[str, tuple[set, set]] = {}
+    for rule, message in rule_engine.evaluate(ticker, quote, indicators=indicators):
+        logging.info('Rule %s fired for %s', rule.kind, ticker, extra={'ticker': ticker})
+        users, described = messages.setdefault(message, (set(), set()))
+        users.update(rule.users)
+        described.add(rule.describe())
+
+    for message, (users, described) in messages.items():
+        users_to_notify = cooldowns.under_limit(users, max_notifications)
+        if not users_to_notify:
+            continue
+
+        context = {'percentage_change': quote.get('dp'), 'price': quote.get('c'), 'quote_time': quote.get('t'),
+                   'fetched_at': fetched_at}
+        # keyed on the rules rather than the message, which carries the price and differs every quote
+        dispatch_alert('rule', ticker, message, users_to_notify, context, cooldowns.increment,
+                       dedup=','.join(sorted(described)))
@@ -0,0 +1,116 @@
+import json
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from app.constants import RANK_PROMPT_PATH, SHARD_SCOPE_PROMPT_PATH
+from app.helpers.llm_helpers import query_llm
+from app.schemas.prompt_schemas import DAILY_SCHEMA, SHARD_SCHEMA
+from app.utils.basic import get_prompt
+from app.utils.tracing import span
+
+DEFAULT_SECTORS = [
+    'biotechnology and pharmaceuticals',
+    'companies being acquired or in announced merger deals',
+    'technology, software and semiconductors',
+    'energy, materials and industrials',
+    'financials and real estate',
+    'consumer, retail and media',
+]
+RISK_ORDER = {'low': 0, 'medium': 1, 'high': 2}
+MAX_PICKS = 5
+MIN_PICKS = 3
+
+
+def _target(rec: dict) -> float:
+    numbers = re.findall(r'\d+(?:\.\d+)?', str(rec.get('target', '')))
+    return max((float(n) for n in numbers), default=0.0)
+
+
+def merge_candidates(shards: Dict[str, List[dict]]) -> List[dict]:
+    """Candidates from every shard, one per symbol, in the order the shards listed them."""
+    merged: Dict[str, dict] = {}
+    for sector, candidates in shards.items():
+        for rec in candidates:
+            symbol = str(rec.get('symbol', '')).upper().strip()
+            if symbol and symbol not in merged:
+                merged[symbol] = dict(rec, symbol=symbol, sector=sector)
+    return list(merged.values())
+
+
+def fallback_ranking(candidates: List[dict], max_picks: int = MAX_PICKS) -> List[dict]:
+    """Lowest risk first, then the highest target, for when the ranking call does not answer in time."""
+    ranked = sorted(candidates, key=lambda r: (RISK_ORDER.get(str(r.get('risk', '')).lower(), 3), -_target(r)))
+    return ranked[:max_picks]
+
+
+def _research_shard(daily_prompt: str, sector: str, model_name: str, max_candidates: int,
+                    timeout: float) -> List[dict]:
+    prompt = daily_prompt + get_prompt(SHARD_SCOPE_PROMPT_PATH).format(sector=sector, max_candidates=max_candidates)
+    with span('recommendations.shard'):
+        result = query_llm(prompt, SHARD_SCHEMA, model_name=model_name, timeout=timeout)
+    candidates = result if isinstance(result, list) else []
+    logging.info(f'Recommendation shard {sector!r} returned {len(candidates)} candidates')
+    return candidates[:max_candidates]
+
+
+def fanout_recommendations(daily_prompt: str, sectors: Optional[List[str]] = None,
+                           shard_model: str = 'gemini-2.5-flash', rank_model: str = 'gemini-2.5-flash',
+                           deadline_seconds: float = 300, rank_seconds: float = 60,
+                           max_candidates: int = 3) -> List[dict]:
+    """Research the market one sector per concurrent LLM call, then rank the pooled candidates.
+
+    Shards get whatever is left of deadline_seconds after rank_seconds is set
+    aside for the ranking call; shards still running then are dropped and the
+    ranking works with what arrived. If the ranking call fails or runs out of
+    time the candidates are ranked by risk and target instead.
+    """
+    sectors = sectors or DEFAULT_SECTORS
+    started = time.monotonic()
+    shard_timeout = max(1.0, deadline_seconds - rank_seconds)
+
+    executor = ThreadPoolExecutor(max_workers=len(sectors), thread_name_prefix='rec-shard')
+    futures = {executor.submit(_research_shard, daily_prompt, sector, shard_model, max_candidates, shard_timeout):
+               sector for sector in sectors}
+    done, not_done = wait(futures, timeout=shard_timeout)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    shards: Dict[str, List[dict]] = {}
+    for future in done:
+        try:
+            shards[futures[future]] = future.result()
+        except Exception as e:
+            logging.error(f'Recommendation shard {futures[future]!r} failed: {e}')
+    # keep the configured sector order so merging is deterministic
+    shards = {sector: shards[sector] for sector in sectors if sector in shards}
+    if not_done:
+        logging.warning(f'{len(not_done)} recommendation shards missed the deadline: '
+                        f'{sorted(futures[f] for f in not_done)}')
+
+    candidates = merge_candidates(shards)
+    logging.warning(f'Recommendation shards finished in {time.monotonic() - started:.1f}s '
+                    f'with {len(candidates)} candidates from {len(shards)}/{len(sectors)} sectors')
+    if len(candidates) <= MIN_PICKS:
+        return candidates
+
+    remaining = deadline_seconds - (time.monotonic() - started)
+    ranked = None
+    if remaining > 1:
+        listing = json.dumps([{k: r[k] for k in ('symbol', 'catalyst', 'target', 'risk', 'sector') if k in r}
+                              for r in candidates], indent=1)
+        prompt = get_prompt(RANK_PROMPT_PATH).format(candidates=listing, daily_prompt=daily_prompt,
+                                                     min_picks=MIN_PICKS, max_picks=MAX_PICKS)
+        with span('recommendations.rank'):
+            result = query_llm(prompt, DAILY_SCHEMA, model_name=rank_model, timeout=remaining)
+        by_symbol = {r['symbol']: r for r in candidates}
+        # only picks from the researched list count, with the analysts' wording
+        ranked = [by_symbol[s] for s in dict.fromkeys(str(r.get('symbol', '')).upper() for r in result or []
+                                                      if isinstance(r, dict)) if s in by_symbol]
+    if not ranked:
+        logging.warning('Ranking recommendations failed or timed out, ranking by risk and target')
+        ranked = fallback_ranking(candidates)
+    elif len(ranked) < MIN_PICKS:
+        ranked += fallback_ranking([r for r in candidates if r not in ranked], MIN_PICKS - len(ranked))
+    return ranked[:MAX_PICKS]
@@ -0,0 +1,75 @@
+import logging
+import time
+from typing import Optional
+
+from app.alerts.rules import RuleEngine
+from app.services import price_tracker_service
+from app.services.tracker_engine import TrackerEngine
+from app.utils.basic import market_state
+from app.utils.indicators import indicator_registry
+from app.utils.snapshot import read_snapshot, write_snapshot
+
+
+class RuntimeSnapshotter:
+    """Saves and restores the tracker's in-memory state across restarts."""
+
+    def __init__(self, path: str, engine: TrackerEngine, rule_engine: Optional[RuleEngine] = None):
+        self.path = path
+        self.engine = engine
+        self.rule_engine = rule_engine
+
+    def collect(self) -> dict:
+        return {
+            'schedule': self.engine.export_schedule(),
+            'last_checked': dict(price_tracker_service.last_checked),
+            'last_quoted': dict(price_tracker_service.last_quoted),
+            'latest_quotes': dict(price_tracker_service.latest_quotes),
+            'market_open': market_state['open'],
+            'indicators': indicator_registry.export_states(),
+            'rules': self.rule_engine.export_states() if self.rule_engine is not None else {},
+        }
+
+    def save(self) -> None:
+        start = time.monotonic()
+        try:
+            size = write_snapshot(self.path, self.collect())
+            logging.info(f'Saved runtime snapshot ({size} bytes) in {time.monotonic() - start:.3f}s')
+        except Exception as e:
+            logging.error(f'Failed to save runtime snapshot: {e}')
+
+    def restore(self, tickers: list[str]) -> bool:
+        """Restore the engine's schedule, the caches and the rule state from the last snapshot.
+
+        Tickers removed from the config are dropped and new ones keep their
+        immediate deadline. Returns False when there is nothing to restore.
+        """
+        state = read_snapshot(self.path)
+        if not state:
+            return False
+
+        try:
+            wanted = set(tickers)
+            schedule = {t: deadline for t, deadline in state['schedule'].items() if t in wanted}
+
+            price_tracker_service.last_checked.update(
+                {t: ts for t, ts in state['last_checked'].items() if t in wanted})
+            price_tracker_service.last_quoted.update(
+                {t: ts for t, ts in state.get('last_quoted', {}).items() if t in wanted})
+            price_tracker_service.latest_quotes.update(
+                {t: q for t, q in state['latest_quotes'].items() if t in wanted})
+            market_state['open'] = state['market_open']
+            indicator_registry.import_states(
+                {s: indicators for s, indicators in state['indicators'].items() if s in wanted})
+            if self.rule_engine is not None:
+                restored_rules = self.rule_engine.import_states(
+                    {s: rules for s, rules in state.get('rules', {}).items() if s in wanted})
+                logging.info(f'Restored rule state for {restored_rules} tickers')
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            logging.error(f'Runtime snapshot is incompatible, starting cold: {e}')
+            return False
+
+        self.engine.import_schedule(schedule)
+
+        age = time.time() - state['written_at']
+        logging.warning(f'Restored runtime snapshot taken {age:.0f}s ago with {len(schedule)} tickers')
+        return True
@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from app.helpers.quote_providers import QuoteProvider
+from app.utils.tracing import span
+
+IDLE_POLL_SECONDS = 1.0
+
+
+def cycle_seconds(ticker_count: int, batch_size: int, calls_per_minute: float) -> float:
+    """Seconds to refresh every ticker once when the call budget is fully used."""
+    calls_per_cycle = -(-ticker_count // max(1, batch_size))
+    return max(calls_per_cycle * 60 / calls_per_minute, 60 / calls_per_minute)
+
+
+class TrackerEngine:
+    """Asyncio loop that keeps every ticker's quote fresh within a call budget.
+
+    Each ticker has a deadline; the earliest deadlines are dispatched first,
+    batched up to the provider's batch size, with at most max_in_flight quote
+    requests outstanding. A ticker is rescheduled one refresh interval after
+    its previous deadline only once its quote has been evaluated, so it is
+    never fetched twice at once. Dispatches later than late_tolerance count
+    as late, and whole refresh intervals skipped while behind count as missed;
+    time spent paused by tick counts as neither.
+
+    Quote handling runs on a single evaluation thread, so per-ticker state is
+    only ever touched from one thread. on_quotes is called with the batch's
+    tickers and quotes, and the wall-clock fetched_at keyword.
+    """
+
+    def __init__(self, tickers: List[str], quote_provider: QuoteProvider,
+                 on_quotes: Callable[..., None],
+                 calls_per_minute: int = 60, max_in_flight: int = 4,
+                 late_tolerance: float = 2.0, tick: Optional[Callable[[], bool]] = None):
+        self.quote_provider = quote_provider
+        self.on_quotes = on_quotes
+        self.calls_per_minute = calls_per_minute
+        self.max_in_flight = max_in_flight
+        self.late_tolerance = late_tolerance
+        # called before each dispatch, returns False while tracking should pause
+        self.tick = tick or (lambda: True)
+
+        self._tickers = list(dict.fromkeys(tickers))
+        self._deadlines: Dict[str, float] = {}
+        self._heap: List[tuple] = []
+        now = time.monotonic()
+        for ticker in self._tickers:
+            self._schedule(ticker, now)
+
+        self.stats = {'dispatched': 0, 'completed': 0, 'failed': 0, 'late': 0, 'missed': 0,
+                      'max_lag': 0.0, 'in_flight': 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._evaluator = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tracker-eval')
+
+    @property
+    def refresh_interval(self) -> float:
+        """Seconds between refreshes of one ticker when the call budget is fully used."""
+        return cycle_seconds(len(self._tickers), self.quote_provider.batch_size, self.calls_per_minute)
+
+    def _schedule(self, ticker: str, deadline: float) -> None:
+        self._deadlines[ticker] = deadline
+        heapq.heappush(self._heap, (deadline, ticker))
+
+    def _pop_due(self, limit: int, horizon: float) -> List[tuple]:
+        batch = []
+        while self._heap and len(batch) < limit:
+            deadline, ticker = self._heap[0]
+            if self._deadlines.get(ticker) != deadline:
+                heapq.heappop(self._heap)  # superseded entry
+                continue
+            if batch and deadline > horizon:
+                break
+            heapq.heappop(self._heap)
+            del self._deadlines[ticker]
+            batch.append((deadline, ticker))
+        return batch
+
+    def export_schedule(self) -> Dict[str, float]:
+        """Next deadline per ticker as wall clock time, in dispatch order."""
+        offset = time.time() - time.monotonic()
+        ordered = sorted((d, t) for t, d in list(self._deadlines.items()))
+        return {ticker: deadline + offset for deadline, ticker in ordered}
+
+    def import_schedule(self, schedule: Dict[str, float]) -> None:
+        offset = time.time() - time.monotonic()
+        self._rebase({ticker: deadline - offset for ticker, deadline in schedule.items() if ticker in self._deadlines})
+
+    def _rebase(self, deadlines: Dict[str, float]) -> None:
+        """Schedule the given monotonic deadlines, moving overdue ones up to now."""
+        now = time.monotonic()
+        ordered = sorted((deadline, ticker) for ticker, deadline in deadlines.items())
+        for rank, (deadline, ticker) in enumerate(ordered):
+            # overdue deadlines keep their order but are not counted as late
+            self._deadlines[ticker] = max(deadline, now + rank * 1e-6)
+        self._heap = [(deadline, ticker) for ticker, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    async def _wait(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stop.wait(), max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _fetch(self, batch: List[tuple], semaphore: asyncio.Semaphore) -> None:
+        tickers = [ticker for _, ticker in batch]
+        try:
+            try:
+                with span('quote.fetch_batch'):
+                    quotes = await self.quote_provider.aquotes(tickers)
+            except Exception as e:
+                logging.error('Error fetching prices for %s: %s', tickers, e)
+                self.stats['failed'] += 1
+                quotes = {}
+            # when the batch arrived, so alert latency can tell fetching apart from waiting to be evaluated
+            fetched_at = time.time()
+            await self._loop.run_in_executor(self._evaluator, partial(self.on_quotes, fetched_at=fetched_at),
+                                             tickers, quotes)
+            self.stats['completed'] += 1
+        except Exception as e:
+            logging.error('Error evaluating quotes for %s: %s', tickers, e)
+            self.stats['failed'] += 1
+        finally:
+            semaphore.release()
+            self.stats['in_flight'] -= 1
+            interval = self.refresh_interval
+            now = time.monotonic()
+            for deadline, ticker in batch:
+                next_deadline = deadline + interval
+                if next_deadline < now - interval:
+                    self.stats['missed'] += int((now - next_deadline) // interval)
+                    next_deadline = now
+                self._schedule(ticker, next_deadline)
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        next_call = time.monotonic()
+        paused = False
+
+        while not self._stop.is_set():
+            if not await self._loop.run_in_executor(self._evaluator, self.tick):
+                paused = True
+                await self._wait(IDLE_POLL_SECONDS)
+                continue
+            if paused:
+                # deadlines that ran out while paused are not late or missed, start them again from now
+                self._rebase(dict(self._deadlines))
+                paused = False
+
+            # keep within the call budget
+            await self._wait(next_call - time.monotonic())
+            if self._stop.is_set():
+                break
+
+            if not self._heap:
+                await self._wait(IDLE_POLL_SECONDS)
+                continue
+
+            deadline = self._heap[0][0]
+            if deadline > time.monotonic():
+                await self._wait(min(deadline - time.monotonic(), IDLE_POLL_SECONDS))
+                continue
+
+            await semaphore.acquire()
+            now = time.monotonic()
+            batch = self._pop_due(max(1, self.quote_provider.batch_size), now + self.refresh_interval)
+            if not batch:
+                semaphore.release()
+                continue
+
+            lag = now - batch[0][0]
+            self.stats['max_lag'] = max(self.stats['max_lag'], lag)
+            if lag > self.late_tolerance:
+                self.stats['late'] += 1
+            self.stats['dispatched'] += 1
+            self.stats['in_flight'] += 1
+            next_call = now + 60 / self.calls_per_minute
+
+            task = asyncio.create_task(self._fetch(batch, semaphore))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.wait(tasks, timeout=10)
+
+    def start(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        # created before the thread starts so stop() always has something to set
+        self._stop = asyncio.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._run())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='tracker-engine', daemon=True)
+        self._thread.start()
+        logging.warning(f'Tracker engine started for {len(self._tickers)} tickers, '
+                        f'refresh interval {self.refresh_interval:.1f}s')
+
+    def stop(self, timeout: float = 15) -> None:
+        if self._loop is None or self._thread is None:
+            return
+        try:
+            # queued even when the loop has not started running yet
+            self._loop.call_soon_threadsafe(self._stop.set)
+        except RuntimeError:
+            # the loop already finished and was closed
+            pass
+        self._thread.join(timeout)
+        self._evaluator.shutdown(wait=True)
+        logging.warning(f'Tracker engine stopped: {self.get_stats()}')
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats, tickers=len(self._tickers), refresh_interval=self.refresh_interval,
+                     calls_per_minute=self.calls_per_minute)
+        keys = self.quote_provider.key_stats()
+        if keys:
+            stats['keys'] = keys
+        return stats
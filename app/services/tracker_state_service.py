@@ -0,0 +1,51 @@
+import time
+from typing import TYPE_CHECKING
+
+from app.alerts.notifier import get_channel_stats
+from app.alerts.outbox import NotificationOutbox
+from app.services import price_tracker_service
+
+if TYPE_CHECKING:
+    from app.alerts.cooldown import CooldownStore
+
+DEFAULT_STALE_AFTER_SECONDS = 60
+
+
+def _quote_entry(symbol: str, stale_after: float, now: float) -> dict | None:
+    checked_at = price_tracker_service.last_checked.get(symbol)
+    # a fetch that failed or came back empty does not make the quote we have any fresher
+    quoted_at = price_tracker_service.last_quoted.get(symbol)
+    quote = price_tracker_service.latest_quotes.get(symbol)
+    if checked_at is None and quote is None:
+        return None
+    return {
+        'quote': quote,
+        'checked_at': checked_at,
+        'quoted_at': quoted_at,
+        # a boolean rather than an age so unchanged state keeps its ETag between polls
+        'stale': quoted_at is None or now - quoted_at > stale_after,
+    }
+
+
+def quotes_view(stale_after: float = DEFAULT_STALE_AFTER_SECONDS) -> dict:
+    """Latest quote and freshness per tracked symbol, read from the tracker's in-memory state."""
+    now = time.time()
+    symbols = set(price_tracker_service.last_checked) | set(price_tracker_service.latest_quotes)
+    return {'stale_after': stale_after,
+            'symbols': {symbol: _quote_entry(symbol, stale_after, now) for symbol in sorted(symbols)}}
+
+
+def quote_view(symbol: str, stale_after: float = DEFAULT_STALE_AFTER_SECONDS) -> dict | None:
+    entry = _quote_entry(symbol, stale_after, time.time())
+    return None if entry is None else dict(entry, symbol=symbol)
+
+
+def notifications_view(cooldowns: 'CooldownStore', max_notifications: int,
+                       outbox: NotificationOutbox | None = None) -> dict:
+    """Daily counts plus outbox and channel counters, all kept in memory."""
+    view = {'max_per_day': max_notifications,
+            'counts': {str(user_id): count for user_id, count in cooldowns.notification_counts().items()}}
+    if outbox is not None:
+        view['outbox'] = outbox.get_stats()
+    view['channels'] = get_channel_stats()
+    return view
@@ -0,0 +1,225 @@
+"""Watchlist capacity planner.
+
+Works out from config.yaml and the quote budget how stale each ticker's quote
+gets over a full refresh cycle, the worst-case delay before an alert reaches
+a user, each user's daily notification headroom from the alert event log, and
+how many Finnhub keys and processes a target freshness needs. The cycle comes
+from the same formula the tracker engine schedules by, so nothing is fetched.
+Exits non-zero when a budget is exceeded.
+
+    python -m app.tools.capacity_plan --target-freshness 30 --max-alert-delay 60
+"""
+import argparse
+import inspect
+import json
+import math
+import os
+import sys
+from datetime import timedelta
+
+from app.alerts.channels import CHANNEL_TYPES
+from app.database.alert_log import AlertEventLog
+from app.services.tracker_engine import cycle_seconds
+from app.utils.basic import trading_day
+from app.utils.config_compiler import load_compiled_config
+
+# Finnhub answers one symbol per call, other providers take a batch
+FINNHUB_BATCH_SIZE = 1
+# requests the outbox's shaper lets through at once before spreading them at requests_per_minute
+REQUEST_BURST = 5
+
+
+def _key_count() -> int:
+    keys = [k for k in os.getenv('FINNHUB_API_KEYS', '').split(',') if k.strip()]
+    return len(keys) or 1
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _channel_batches(notify_config: dict) -> list:
+    """max_batch of each enabled channel, as build_channels would set them up."""
+    channels_config = notify_config.get('channels') or {'alertzy': {}}
+    batches = []
+    for name, settings in channels_config.items():
+        settings = settings or {}
+        if not settings.get('enabled', True) or name not in CHANNEL_TYPES:
+            continue
+        default = inspect.signature(CHANNEL_TYPES[name]).parameters['max_batch'].default
+        batches.append(max(1, settings.get('max_batch', default)))
+    return batches
+
+
+def _headroom(config: dict, users: dict, max_notifications: int, days: int) -> dict | None:
+    """Alerts per user and day from the event log against the daily limit, None without a log."""
+    db_url = (config.get('alert_log') or {}).get('db_url', 'sqlite:///alert_events.db')
+    if db_url.startswith('sqlite:///') and not os.path.exists(db_url[len('sqlite:///'):]):
+        return None
+    counts = AlertEventLog(db_url).daily_counts(days)
+    if not counts:
+        return None
+    # a weekday without a partition had no alerts, it still counts as a day of headroom
+    today = trading_day()
+    weekdays = [today - timedelta(days=offset) for offset in range(days)]
+    weekdays = [day.isoformat() for day in reversed(weekdays) if day.weekday() < 5]
+    report = {}
+    for user_id in users:
+        per_day = [counts.get(day, {}).get(str(user_id), 0) for day in weekdays]
+        report[str(user_id)] = {
+            'mean_per_day': round(sum(per_day) / len(per_day), 1),
+            'p95_per_day': _percentile(per_day, 95),
+            'max_per_day': max(per_day),
+            'headroom': max_notifications - max(per_day),
+            'days_at_limit': sum(count >= max_notifications for count in per_day),
+        }
+    return {'days': len(weekdays), 'logged_days': len(counts), 'users': report}
+
+
+def plan(config_path: str = 'config.yaml', keys: int | None = None, fetch_latency: float = 0.3,
+         send_latency: float = 0.5, target_freshness: float | None = None, history_days: int = 20) -> dict:
+    compiled = load_compiled_config(config_path)
+    config = compiled.raw
+    defaults = config.get('defaults', {})
+    market_config = config.get('market_data', {})
+    notify_config = config.get('notifications', {})
+
+    providers = market_config.get('providers', ['finnhub'])
+    batch_size = FINNHUB_BATCH_SIZE if providers[0] == 'finnhub' else market_config.get('batch_size', 50)
+    keys = keys or (_key_count() if providers[0] == 'finnhub' else 1)
+    per_key = defaults.get('max_quote_calls_per_min', 60)
+    max_in_flight = defaults.get('max_in_flight_quotes', 4)
+    tickers = compiled.tickers
+
+    # calls go out at the budget's pace unless the in-flight limit runs out first
+    budget_per_minute = per_key * keys
+    in_flight_per_minute = max_in_flight * 60 / fetch_latency
+    calls_per_minute = min(budget_per_minute, in_flight_per_minute)
+    cycle = cycle_seconds(len(tickers), batch_size, calls_per_minute)
+    calls_per_cycle = math.ceil(len(tickers) / batch_size)
+
+    batches = _channel_batches(notify_config)
+    per_ticker = []
+    for item in tickers:
+        symbol = item['symbol']
+        subscribers = {user for threshold in compiled.thresholds.get(symbol, []) for user in threshold['users']}
+        subscribers.update(user for rule in item.get('rules') or [] for user in rule.get('users') or [])
+        # a window spanning fewer than two refreshes compares a quote with itself
+        blind_windows = sorted({rule['window_minutes'] for rule in item.get('rules') or []
+                                if rule.get('type') == 'window_pct' and rule['window_minutes'] * 60 < 2 * cycle})
+        per_ticker.append({
+            'symbol': symbol,
+            'subscribers': len(subscribers),
+            # one request per chunk of subscribers on each channel
+            'requests_per_alert': sum(math.ceil(len(subscribers) / batch) for batch in batches),
+            'mean_staleness': round(cycle / 2 + fetch_latency, 2),
+            'worst_staleness': round(cycle + fetch_latency, 2),
+            'blind_window_minutes': blind_windows,
+        })
+
+    # alerts for every ticker a user follows can fire on the same cycle, the rate shaper spreads them out,
+    # and every ticker firing at once shares the request bucket, so the last request waits for all the others
+    per_minute = notify_config.get('per_account_per_minute', 6)
+    burst = notify_config.get('burst', 3)
+    requests_per_minute = notify_config.get('requests_per_minute', 30)
+    requests_per_cycle = sum(ticker['requests_per_alert'] for ticker in per_ticker)
+    request_shaping = max(0, requests_per_cycle - REQUEST_BURST) * 60 / requests_per_minute
+    delays = {}
+    for user_id, subscriptions in compiled.subscriptions.items():
+        simultaneous = len({symbol for symbol, _, _ in subscriptions})
+        shaping = max(max(0, simultaneous - burst) * 60 / per_minute, request_shaping)
+        delays[str(user_id)] = round(cycle + fetch_latency + shaping + send_latency, 2)
+    worst_user = max(delays, key=delays.get) if delays else None
+
+    report = {
+        'tickers': len(tickers),
+        'batch_size': batch_size,
+        'keys': keys,
+        'calls_per_minute': round(calls_per_minute, 1),
+        'bound_by': 'call budget' if budget_per_minute <= in_flight_per_minute else 'in-flight limit',
+        'cycle_seconds': round(cycle, 2),
+        'per_ticker': per_ticker,
+        'alert_delay': {
+            'requests_per_cycle': requests_per_cycle,
+            'request_shaping_seconds': round(request_shaping, 2),
+            'worst_seconds': delays.get(worst_user, round(cycle + fetch_latency + send_latency, 2)),
+            'worst_user': worst_user,
+            'per_user': delays,
+        },
+        'headroom': _headroom(config, compiled.users, defaults.get('max_notifications_per_day', 100),
+                              history_days),
+    }
+    if target_freshness:
+        # the fetch itself eats into the target
+        required_per_minute = calls_per_cycle * 60 / max(target_freshness - fetch_latency, 1e-3)
+        report['target'] = {
+            'freshness_seconds': target_freshness,
+            'calls_per_minute': round(required_per_minute, 1),
+            'keys': math.ceil(required_per_minute / per_key),
+            # each process keeps at most max_in_flight calls outstanding
+            'processes': math.ceil(required_per_minute / in_flight_per_minute),
+            'max_tickers_with_current_keys':
+                int(budget_per_minute * max(target_freshness - fetch_latency, 0) / 60) * batch_size,
+        }
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Plan stocklerts watchlist capacity.')
+    parser.add_argument('--config', default='config.yaml', help='config file to plan for')
+    parser.add_argument('--keys', type=int, help='Finnhub keys (default: FINNHUB_API_KEYS)')
+    parser.add_argument('--fetch-latency', type=float, default=0.3, help='seconds per quote call')
+    parser.add_argument('--send-latency', type=float, default=0.5, help='seconds per notification send')
+    parser.add_argument('--history-days', type=int, default=20, help='days of alert history for headroom')
+    parser.add_argument('--target-freshness', type=float, help='max seconds between refreshes of a ticker')
+    parser.add_argument('--max-alert-delay', type=float, help='max seconds from a move to the alert')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = plan(args.config, args.keys, args.fetch_latency, args.send_latency, args.target_freshness,
+                  args.history_days)
+
+    failures = []
+    worst_staleness = report['cycle_seconds'] + args.fetch_latency
+    if args.target_freshness is not None and worst_staleness > args.target_freshness:
+        failures.append(f'worst staleness {worst_staleness:.1f}s > {args.target_freshness}s')
+    worst_delay = report['alert_delay']['worst_seconds']
+    if args.max_alert_delay is not None and worst_delay > args.max_alert_delay:
+        failures.append(f'worst alert delay {worst_delay:.1f}s > {args.max_alert_delay}s')
+    report['failures'] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['tickers']} tickers, batch {report['batch_size']}, {report['keys']} keys: "
+              f"{report['calls_per_minute']} calls/min ({report['bound_by']})")
+        print(f"full cycle: {report['cycle_seconds']:.1f}s, worst staleness {worst_staleness:.1f}s")
+        for ticker in report['per_ticker']:
+            if ticker['blind_window_minutes']:
+                print(f"  {ticker['symbol']}: window_pct {ticker['blind_window_minutes']} minutes "
+                      f"is shorter than two refreshes")
+        delay = report['alert_delay']
+        print(f"worst alert delay: {delay['worst_seconds']:.1f}s (user {delay['worst_user']}), "
+              f"{delay['requests_per_cycle']} requests when every ticker fires at once take "
+              f"{delay['request_shaping_seconds']:.1f}s")
+        if report['headroom'] is None:
+            print('headroom: no alert history')
+        else:
+            print(f"headroom over {report['headroom']['days']} trading days:")
+            for user_id, row in report['headroom']['users'].items():
+                print(f"  user {user_id}: max {row['max_per_day']}/day, p95 {row['p95_per_day']}, "
+                      f"headroom {row['headroom']}, {row['days_at_limit']} days at the limit")
+        if 'target' in report:
+            target = report['target']
+            print(f"for {target['freshness_seconds']:g}s freshness: {target['calls_per_minute']} calls/min, "
+                  f"{target['keys']} keys, {target['processes']} processes "
+                  f"(current keys cover {target['max_tickers_with_current_keys']} tickers)")
+        for failure in failures:
+            print(f'OVER BUDGET: {failure}')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
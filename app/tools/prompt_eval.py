@@ -0,0 +1,324 @@
+"""Offline A/B evaluation of daily recommendation prompts.
+
+Replays candidate prompts against stored trading days and scores their picks
+against the performance recorded for those days, relative to the mean of the
+day's whole candidate pool. Every prompt and day pair is
+an independent LLM call, run concurrently up to --parallel, and responses are
+cached on disk by backend, model and prompt text, so re-running a comparison
+after changing one candidate only pays for that candidate.
+
+Days are JSON lines of the form
+
+    {"date": "2025-07-01", "market_pct": 0.4,
+     "candidates": [{"symbol": "ABCD", "note": "to be acquired at $12 in cash"}],
+     "outcomes": {"ABCD": 3.1, "WXYZ": -2.4}}
+
+and can be exported from the daily performance sheet. The candidates are only
+what was known before the open, that day's recorded picks with their
+catalysts, so a prompt is scored on how well it ranks them: the edge is the
+mean return of its picks minus the mean of the pool. Any pre-open universe
+with recorded outcomes can be used as candidates in the same format.
+
+    python -m app.tools.prompt_eval export --days 60 --out eval_days.jsonl
+    python -m app.tools.prompt_eval run --days-file eval_days.jsonl --prompt current \\
+        --prompt candidate.txt --suggested --backend gemini --parallel 8
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from app.constants import DAILY_RECOMMENDATIONS_PROMPT_PATH, EVAL_DAY_PROMPT_PATH
+from app.schemas.prompt_schemas import DAILY_SCHEMA
+from app.utils.basic import get_prompt
+from app.utils.parsing import unwrap_schema_result
+
+MAX_PICKS = 5
+CANDIDATE_LINE = re.compile(r'^- ([A-Z][A-Z0-9.\-]*):', re.MULTILINE)
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(str(value).replace('%', '').replace('+', ''))
+    except ValueError:
+        return None
+
+
+def export_days(days: int = 60) -> List[dict]:
+    """Trading days from the daily performance sheet, oldest first, candidates limited to the day's picks."""
+    from app.helpers.sheets_helpers import fetch_records_since
+
+    since = datetime.now() - timedelta(days=days)
+    by_date: Dict[str, dict] = {}
+
+    def day(date_value) -> dict:
+        date = str(date_value)[:10]
+        return by_date.setdefault(date, {'date': date, 'market_pct': None, 'candidates': [], 'outcomes': {}})
+
+    for row in fetch_records_since(os.getenv('DAILY_PERF_SHEET_ID'), since):
+        entry = day(row.get('date'))
+        entry['market_pct'] = _number(row.get('market_growth'))
+        for idx in range(1, MAX_PICKS + 1):
+            symbol, pct = str(row.get(f'ticker{idx}', '')).strip().upper(), _number(row.get(f'actual_growth{idx}'))
+            if symbol and pct is not None:
+                entry['candidates'].append({'symbol': symbol, 'note': row.get(f'catalyst{idx}', '')})
+                entry['outcomes'][symbol] = pct
+
+    return [by_date[date] for date in sorted(by_date) if by_date[date]['outcomes']]
+
+
+def _local_backend(prompt: str, schema: dict, model_name: Optional[str] = None) -> list:
+    """Stand-in that needs no network: the first listed candidates, to exercise the harness."""
+    symbols = list(dict.fromkeys(CANDIDATE_LINE.findall(prompt.rsplit('BACKTEST DAY', 1)[-1])))
+    return [{'symbol': s, 'catalyst': 'local stand-in', 'target': '5%', 'risk': 'Medium'} for s in symbols[:3]]
+
+
+def _llm_backend(prompt: str, schema: dict, model_name: Optional[str] = None):
+    from app.helpers.llm_helpers import query_llm
+    return query_llm(prompt, schema, model_name=model_name)
+
+
+def get_backend(name: str) -> Callable:
+    """'llm' for the hedged query_llm, a name from LLM_BACKENDS, 'local', or module:function."""
+    if name == 'local':
+        return _local_backend
+    if name == 'llm':
+        return _llm_backend
+    if ':' in name:
+        module, attr = name.split(':', 1)
+        return getattr(importlib.import_module(module), attr)
+    from app.helpers.llm_helpers import LLM_BACKENDS
+    if name not in LLM_BACKENDS:
+        raise ValueError(f'Unknown backend {name!r}, expected local, llm, module:function '
+                         f'or one of {list(LLM_BACKENDS)}')
+    return LLM_BACKENDS[name]
+
+
+class ResponseCache:
+    """LLM responses on disk, one JSON file per backend, model and prompt text."""
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.json')
+
+    @staticmethod
+    def key(backend: str, model_name: Optional[str], prompt: str) -> str:
+        return hashlib.sha256(f'{backend}\0{model_name or ""}\0{prompt}'.encode()).hexdigest()
+
+    def get(self, key: str):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(value, f)
+        os.replace(f'{path}.tmp', path)
+
+
+def render_day(prompt: str, day: dict) -> str:
+    lines = [f"- {c['symbol']}: {c['note']}" if c.get('note') else f"- {c['symbol']}:" for c in day['candidates']]
+    return prompt + get_prompt(EVAL_DAY_PROMPT_PATH).format(date=day['date'], context='\n'.join(lines))
+
+
+def score_day(picks: List[dict], day: dict) -> dict:
+    symbols = list(dict.fromkeys(str(p.get('symbol', '')).upper().strip() for p in picks
+                                 if isinstance(p, dict)))[:MAX_PICKS]
+    symbols = [s for s in symbols if s]
+    returns = [day['outcomes'][s] for s in symbols if s in day['outcomes']]
+    mean = sum(returns) / len(returns) if returns else None
+    market = day.get('market_pct')
+    pool = list(day['outcomes'].values())
+    pool_mean = sum(pool) / len(pool) if pool else None
+    return {
+        'date': day['date'],
+        'picks': symbols,
+        'covered': len(returns),
+        'mean_pct': mean,
+        'excess_pct': mean - market if mean is not None and market is not None else None,
+        'edge_pct': mean - pool_mean if mean is not None and pool_mean is not None else None,
+        'hits': sum(r > 0 for r in returns),
+    }
+
+
+def summarize(name: str, days: List[dict]) -> dict:
+    answered = [d for d in days if d.get('picks')]
+    scored = [d for d in answered if d['mean_pct'] is not None]
+    picks = sum(len(d['picks']) for d in answered)
+    covered = sum(d['covered'] for d in answered)
+    excess = [d['excess_pct'] for d in scored if d['excess_pct'] is not None]
+    edge = [d['edge_pct'] for d in scored if d['edge_pct'] is not None]
+
+    def mean(values):
+        return round(sum(values) / len(values), 3) if values else None
+
+    return {
+        'prompt': name,
+        'days': len(days),
+        'answered': len(answered),
+        'picks': picks,
+        'coverage': round(covered / picks, 3) if picks else None,
+        'mean_daily_pct': mean([d['mean_pct'] for d in scored]),
+        'mean_excess_pct': mean(excess),
+        'mean_edge_pct': mean(edge),
+        'hit_rate': round(sum(d['hits'] for d in scored) / covered, 3) if covered else None,
+        'per_day': days,
+    }
+
+
+def run(prompts: Dict[str, str], days: List[dict], backend: str = 'local', model_name: Optional[str] = None,
+        parallel: int = 4, cache_dir: Optional[str] = '.prompt_eval_cache') -> dict:
+    """Every prompt on every day, at most `parallel` calls at once, summarized per prompt."""
+    call = get_backend(backend)
+    cache = ResponseCache(cache_dir)
+    stats = {'calls': 0, 'cached': 0, 'failed': 0}
+    stats_lock = threading.Lock()
+    started = time.monotonic()
+
+    def count(stat: str) -> None:
+        with stats_lock:
+            stats[stat] += 1
+
+    def evaluate(name: str, day: dict) -> tuple:
+        prompt = render_day(prompts[name], day)
+        key = cache.key(backend, model_name, prompt)
+        result = cache.get(key)
+        if result is not None:
+            count('cached')
+        else:
+            count('calls')
+            try:
+                result = call(prompt, DAILY_SCHEMA, model_name)
+            except Exception as e:
+                print(f'{name} on {day["date"]} failed: {e}', file=sys.stderr)
+                result = None
+            picks = unwrap_schema_result(result, DAILY_SCHEMA, strict=False) if result else None
+            if picks:
+                cache.put(key, picks)
+            else:
+                count('failed')
+            result = picks
+        return name, score_day(result or [], day)
+
+    results: Dict[str, List[dict]] = {name: [] for name in prompts}
+    with ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix='prompt-eval') as executor:
+        futures = [executor.submit(evaluate, name, day) for name in prompts for day in days]
+        for future in as_completed(futures):
+            name, scored = future.result()
+            results[name].append(scored)
+
+    summaries = []
+    for name, scored in results.items():
+        summaries.append(summarize(name, sorted(scored, key=lambda d: d['date'])))
+    baseline = summaries[0]['mean_edge_pct'] if summaries else None
+    for summary in summaries:
+        value = summary['mean_edge_pct']
+        summary['vs_baseline_pct'] = round(value - baseline, 3) if value is not None and baseline is not None \
+            else None
+    return {
+        'backend': backend,
+        'model': model_name,
+        'days': len(days),
+        'seconds': round(time.monotonic() - started, 1),
+        **stats,
+        'prompts': summaries,
+    }
+
+
+def _load_prompts(paths: List[str], suggested: bool) -> Dict[str, str]:
+    prompts: Dict[str, str] = {}
+    for path in paths or ['current']:
+        if path == 'current':
+            prompts['current'] = get_prompt(DAILY_RECOMMENDATIONS_PROMPT_PATH)
+        else:
+            prompts[Path(path).stem] = Path(path).read_text()
+    if suggested:
+        from app.helpers.sheets_helpers import get_last_prompt_from_sheets
+        text = get_last_prompt_from_sheets(os.getenv('PROMPT_TRACKING_SHEET_ID'))
+        if not text:
+            raise SystemExit('No suggested prompt found in the prompt tracking sheet')
+        prompts['suggested'] = text
+    return prompts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Compare daily recommendation prompts on past trading days.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='write past days from the performance sheets as JSON lines')
+    export.add_argument('--days', type=int, default=60, help='calendar days of history to export')
+    export.add_argument('--out', default='eval_days.jsonl', help='file to write')
+
+    evaluate = commands.add_parser('run', help='score prompts on exported days')
+    evaluate.add_argument('--days-file', default='eval_days.jsonl', help='days exported with export')
+    evaluate.add_argument('--prompt', action='append', default=[],
+                          help="prompt file to compare, or 'current' for resources/daily_prompt.txt; "
+                               'the first one is the baseline (repeatable)')
+    evaluate.add_argument('--suggested', action='store_true',
+                          help='add the latest prompt suggested by improve_daily_prompt')
+    evaluate.add_argument('--backend', default='local',
+                          help='local, llm, a backend from LLM_BACKENDS, or module:function')
+    evaluate.add_argument('--model', help='model name passed to the backend')
+    evaluate.add_argument('--parallel', type=int, default=4, help='LLM calls in flight at once')
+    evaluate.add_argument('--cache-dir', default='.prompt_eval_cache', help="response cache, '' to disable")
+    evaluate.add_argument('--out', help='also write the full report as JSON')
+    evaluate.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        days = export_days(args.days)
+        with open(args.out, 'w') as f:
+            for day in days:
+                f.write(json.dumps(day) + '\n')
+        print(f'Wrote {len(days)} days to {args.out}')
+        return 0 if days else 1
+
+    with open(args.days_file) as f:
+        days = [json.loads(line) for line in f if line.strip()]
+    report = run(_load_prompts(args.prompt, args.suggested), days, args.backend, args.model, args.parallel,
+                 args.cache_dir or None)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['days']} days on {report['backend']}: {report['calls']} calls, {report['cached']} cached, "
+              f"{report['failed']} failed in {report['seconds']}s")
+        print(f"{'prompt':<24} {'answered':>8} {'coverage':>8} {'mean %':>8} {'excess %':>9} {'edge %':>8} "
+              f"{'hit rate':>8} {'vs base':>8}")
+
+        def fmt(value, width):
+            return f'{value:>{width}}' if value is not None else f'{"n/a":>{width}}'
+
+        for summary in report['prompts']:
+            print(f"{summary['prompt'][:24]:<24} {summary['answered']:>8} {fmt(summary['coverage'], 8)} "
+                  f"{fmt(summary['mean_daily_pct'], 8)} {fmt(summary['mean_excess_pct'], 9)} "
+                  f"{fmt(summary['mean_edge_pct'], 8)} {fmt(summary['hit_rate'], 8)} "
+                  f"{fmt(summary['vs_baseline_pct'], 8)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Local SMTP stand-in.
+
+Accepts every message the email notification channel sends and keeps it
+instead of delivering it: each message is printed and, with --out, appended
+to a JSON lines file with its sender, recipients and body. It speaks just
+enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT) and
+needs nothing outside the standard library.
+
+    python -m app.tools.smtp_sink --port 1025 --out sent_emails.jsonl
+"""
+import argparse
+import json
+import socketserver
+import sys
+import threading
+import time
+from email import message_from_bytes
+from typing import List, Optional
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, out: Optional[str] = None, quiet: bool = False):
+        super().__init__(address, SMTPHandler)
+        self.out = out
+        self.quiet = quiet
+        self.messages: List[dict] = []
+        self._lock = threading.Lock()
+
+    def store(self, sender: str, recipients: List[str], data: bytes) -> None:
+        email = message_from_bytes(data)
+        record = {'received_at': time.time(), 'from': sender, 'to': recipients,
+                  'subject': email.get('Subject', ''), 'body': email.get_payload()}
+        with self._lock:
+            self.messages.append(record)
+            if self.out:
+                with open(self.out, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+        if not self.quiet:
+            print(f"{record['subject']!r} from {sender} to {', '.join(recipients)}: {record['body'].strip()}",
+                  flush=True)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self) -> None:
+        self._reply('220 stocklerts smtp sink')
+        sender, recipients = '', []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode('latin-1').strip().partition(' ')
+            command = command.upper()
+            if command == 'EHLO':
+                self._reply('250-stocklerts')
+                self._reply('250 8BITMIME')
+            elif command == 'HELO':
+                self._reply('250 stocklerts')
+            elif command == 'MAIL':
+                sender, recipients = argument.partition(':')[2].strip().strip('<>'), []
+                self._reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(argument.partition(':')[2].strip().strip('<>'))
+                self._reply('250 OK')
+            elif command == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    # undo dot stuffing
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                self.server.store(sender, recipients, b''.join(lines))
+                sender, recipients = '', []
+                self._reply('250 OK')
+            elif command == 'RSET':
+                sender, recipients = '', []
+                self._reply('250 OK')
+            elif command == 'NOOP':
+                self._reply('250 OK')
+            elif command == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Local SMTP server that keeps every message it receives.')
+    parser.add_argument('--host', default='localhost', help='address to listen on')
+    parser.add_argument('--port', type=int, default=1025, help='port to listen on')
+    parser.add_argument('--out', help='append received messages to this JSON lines file')
+    parser.add_argument('--quiet', action='store_true', help='do not print received messages')
+    args = parser.parse_args(argv)
+
+    with SMTPSink((args.host, args.port), args.out, args.quiet) as server:
+        print(f'SMTP sink listening on {args.host}:{args.port}', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
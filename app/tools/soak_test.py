@@ -0,0 +1,473 @@
+"""Soak test.
+
+Runs app.main, kept open outside market hours, for a long stretch against local stand-ins for
+Finnhub, FMP and Alertzy, with a generated config of many synthetic tickers
+and subscriptions, and samples the process over time: alert latency (quote
+served to push received), resident memory, thread count, open files and the
+SQLite database size. The fake market moves every ticker along a geometric
+Brownian motion whose clock runs ``--speed`` times faster than wall time, so an
+hour of soak covers many simulated sessions. Memory and thread figures are
+read from /proc and need Linux. Exits non-zero when a budget is exceeded.
+
+    python -m app.tools.soak_test --duration 3600 --tickers 2000 --users 200 --users-per-ticker 5 \\
+        --max-rss-growth-mb 50 --max-p95-latency 5
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from statistics import quantiles
+
+import yaml
+
+from app.tools.startup_bench import ALWAYS_OPEN_MAIN, REPO_ROOT, _free_port
+
+ENCRYPT_KEY = 'soak-test-key-16'
+SESSION_SECONDS = 6.5 * 3600
+TRADING_SECONDS_PER_YEAR = 252 * SESSION_SECONDS
+# threshold and rule messages all start with the symbol and end with the quoted price
+ALERT_MESSAGE = re.compile(r'^(\S+) .*[ (]([-\d.e]+)\)?$')
+
+
+def _encrypt(plain_text: str, key: str) -> str:
+    """The inverse of app.utils.crypto.decrypt, for the account ids in the generated config."""
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives import padding
+
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    padded = padder.update(plain_text.encode('utf-8')) + padder.finalize()
+    encryptor = Cipher(algorithms.AES(key.encode('utf-8')), modes.CBC(b'\x00' * 16)).encryptor()
+    return base64.b64encode(encryptor.update(padded) + encryptor.finalize()).decode('utf-8')
+
+
+class MarketSimulator:
+    """Geometric Brownian motion prices for synthetic tickers on an accelerated clock.
+
+    Each quote advances its symbol by the simulated time since it was last
+    quoted. When the simulated clock passes a session boundary the symbol
+    opens a new day with the last price as previous close.
+    """
+
+    def __init__(self, symbols, speed: float = 60, drift: float = 0.05, volatility: float = 0.4, seed: int = 0):
+        self.symbols = list(symbols)
+        self.speed = speed
+        self.drift = drift
+        self.volatility = volatility
+        self._rng = random.Random(seed)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._state = {}
+        for symbol in symbols:
+            price = round(self._rng.uniform(10, 500), 4)
+            self._state[symbol] = {'price': price, 'open': price, 'pc': price, 'high': price, 'low': price,
+                                   'day': 0, 'sim': 0.0}
+        # recently served prices per symbol, to match alerts to the quote that caused them
+        self._served = {symbol: deque(maxlen=64) for symbol in symbols}
+        self.quotes_served = 0
+
+    def sim_seconds(self) -> float:
+        return (time.monotonic() - self._started) * self.speed
+
+    def quote(self, symbol: str) -> dict | None:
+        state = self._state.get(symbol)
+        if state is None:
+            return None
+        with self._lock:
+            sim = self.sim_seconds()
+            day = int(sim // SESSION_SECONDS)
+            if day != state['day']:
+                state.update(day=day, pc=state['price'], open=state['price'], high=state['price'],
+                             low=state['price'], sim=day * SESSION_SECONDS)
+            dt = max(0.0, sim - state['sim']) / TRADING_SECONDS_PER_YEAR
+            shock = self._rng.gauss(0.0, 1.0)
+            growth = (self.drift - self.volatility ** 2 / 2) * dt + self.volatility * math.sqrt(dt) * shock
+            price = round(state['price'] * math.exp(growth), 4)
+            state.update(price=price, sim=sim, high=max(state['high'], price), low=min(state['low'], price))
+            self._served[symbol].append((price, time.time()))
+            self.quotes_served += 1
+            pc = state['pc']
+            return {
+                'c': price, 'd': round(price - pc, 4), 'dp': round((price - pc) / pc * 100, 4),
+                'h': state['high'], 'l': state['low'], 'o': state['open'], 'pc': pc,
+                't': int(time.time()), 'v': self._rng.randint(100, 10_000),
+            }
+
+    def served_at(self, symbol: str, price: float) -> float | None:
+        """Wall time the given price was served for symbol, the latest quote when it is unknown."""
+        with self._lock:
+            served = self._served.get(symbol)
+            if not served:
+                return None
+            for served_price, at in reversed(served):
+                if served_price == price:
+                    return at
+            return served[-1][1]
+
+
+class AlertRecorder:
+    """Pushes received by the fake Alertzy with their latency from the quote that triggered them."""
+
+    def __init__(self, market: MarketSimulator):
+        self.market = market
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.pushes = 0
+        self.deliveries = 0
+        self.unmatched = 0
+
+    def record(self, payload: dict) -> None:
+        received = time.time()
+        accounts = len([key for key in str(payload.get('accountKey', '')).split('_') if key])
+        match = ALERT_MESSAGE.match(str(payload.get('message', '')))
+        served = self.market.served_at(match.group(1), float(match.group(2))) if match else None
+        with self._lock:
+            self.pushes += 1
+            self.deliveries += accounts
+            if served is None:
+                self.unmatched += 1
+            else:
+                self.latencies.append(received - served)
+
+    def take_latencies(self) -> list:
+        with self._lock:
+            latencies, self.latencies = self.latencies, []
+        return latencies
+
+
+class FakeServices:
+    """One local HTTP server standing in for Finnhub (/finnhub), FMP (/fmp) and Alertzy (/alertzy)."""
+
+    def __init__(self, market: MarketSimulator, quote_latency: float = 0.0, alertzy_error_rate: float = 0.0):
+        self.market = market
+        self.alerts = AlertRecorder(market)
+        self.quote_latency = quote_latency
+        self.alertzy_error_rate = alertzy_error_rate
+        self.port = _free_port()
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='soak-fakes', daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                params = urllib.parse.parse_qs(url.query)
+                if services.quote_latency:
+                    time.sleep(services.quote_latency)
+                if url.path == '/finnhub/api/v1/quote':
+                    symbol = params.get('symbol', [''])[0]
+                    quote = services.market.quote(symbol)
+                    # Finnhub answers unknown symbols with an all-zero quote
+                    self._send(200, quote or dict.fromkeys(('c', 'd', 'dp', 'h', 'l', 'o', 'pc', 't'), 0))
+                elif url.path.startswith('/fmp/api/v3/quote/'):
+                    items = []
+                    for symbol in url.path.rsplit('/', 1)[1].split(','):
+                        quote = services.market.quote(symbol)
+                        if quote:
+                            items.append({'symbol': symbol, 'price': quote['c'], 'change': quote['d'],
+                                          'changesPercentage': quote['dp'], 'dayHigh': quote['h'],
+                                          'dayLow': quote['l'], 'open': quote['o'], 'previousClose': quote['pc'],
+                                          'timestamp': quote['t'], 'volume': quote['v']})
+                    self._send(200, items)
+                elif url.path == '/fmp/api/v3/stock_market/gainers':
+                    self._send(200, [])
+                elif url.path == '/heartbeat':
+                    self._send(200, {})
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)) or 0)
+                if self.path != '/alertzy/send':
+                    self._send(404, {'error': 'not found'})
+                    return
+                if random.random() < services.alertzy_error_rate:
+                    self._send(500, {'response': 'fail'})
+                    return
+                services.alerts.record(json.loads(body or b'{}'))
+                self._send(200, {'response': 'success'})
+
+        return Handler
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _symbols(count: int) -> list:
+    return [f'SK{i:05d}' for i in range(count)]
+
+
+def write_config(workdir: Path, services: FakeServices, args) -> int:
+    """Write config.yaml for the run, returns the number of (ticker, threshold, user) subscriptions."""
+    rng = random.Random(args.seed)
+    config = yaml.safe_load((REPO_ROOT / 'config.yaml').read_text())
+    users = list(range(1, args.users + 1))
+    config['alertzy'] = {'accounts': [
+        {'user_id': user_id, 'account_id': _encrypt(f'soak-account-{user_id}', ENCRYPT_KEY),
+         'notify_thresh': 1, 'is_admin': user_id == 1}
+        for user_id in users
+    ]}
+
+    levels = [step * 1.5 for step in range(1, args.thresholds_per_ticker // 2 + 2)]
+    values = [sign * level for level in levels for sign in (1, -1)][:args.thresholds_per_ticker]
+    tickers, subscriptions = [], 0
+    for symbol in services.market.symbols:
+        thresholds = []
+        for value in values:
+            subscribers = rng.sample(users, min(args.users_per_ticker, len(users)))
+            thresholds.append({'value': value, 'users': subscribers})
+            subscriptions += len(subscribers)
+        tickers.append({'symbol': symbol, 'threshold': thresholds})
+    config['tickers'] = tickers
+
+    config['defaults'].update(
+        max_quote_calls_per_min=args.calls_per_minute,
+        max_notifications_per_day=10 ** 9,
+        snapshot_path='runtime.snapshot',
+    )
+    config['market_data'] = {'providers': [args.provider], 'batch_size': 50,
+                             'failover_cooldown_seconds': 5, 'rate_limit_cooldown_seconds': 5}
+    config.setdefault('notifications', {})['per_account_per_minute'] = args.alertzy_per_minute
+    config['notifications']['requests_per_minute'] = args.alertzy_requests_per_minute
+    config['heartbeat'] = {'url': f'{services.base_url}/heartbeat'}
+    (workdir / 'config.yaml').write_text(yaml.safe_dump(config))
+    return subscriptions
+
+
+def _proc_status(pid: int) -> dict:
+    status = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'Threads'):
+                    status[key] = int(value.split()[0])
+        status['fds'] = len(os.listdir(f'/proc/{pid}/fd'))
+    except OSError:
+        pass
+    return {'rss_mb': status['VmRSS'] / 1024 if 'VmRSS' in status else None,
+            'threads': status.get('Threads'), 'fds': status.get('fds')}
+
+
+def _db_bytes(workdir: Path) -> int:
+    """Bytes of the state and alert event databases, with their WAL and journal files."""
+    paths = [*workdir.glob('stockalerts.db*'), *workdir.glob('alert_events.db*')]
+    return sum(path.stat().st_size for path in paths if path.exists())
+
+
+def _get_json(port: int, path: str) -> dict:
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=5) as resp:
+            return json.loads(resp.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def _percentile(values: list, pct: int) -> float | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def _slope_per_hour(samples: list, key: str) -> float | None:
+    """Least squares growth of a sampled value per wall clock hour."""
+    points = [(s['elapsed'], s[key]) for s in samples if s.get(key) is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x * 3600
+
+
+def run_soak(args) -> dict:
+    market = MarketSimulator(_symbols(args.tickers), speed=args.speed, seed=args.seed)
+    services = FakeServices(market, quote_latency=args.quote_latency_ms / 1000,
+                            alertzy_error_rate=args.alertzy_error_rate)
+    services.start()
+
+    workdir = Path(tempfile.mkdtemp(prefix='stocklerts-soak-'))
+    subscriptions = write_config(workdir, services, args)
+    port = _free_port()
+    env = {k: v for k, v in os.environ.items() if k not in ('GOOGLE_SERVICE_ACCOUNT', 'TRACING_ENABLED')}
+    env.update(
+        PORT=str(port), PYTHONPATH=str(REPO_ROOT), ENCRYPT_KEY=ENCRYPT_KEY,
+        FINNHUB_API_KEY='soak', FMP_API_KEY='soak', FINNHUB_BASE_URL=f'{services.base_url}/finnhub/api/v1',
+        FMP_BASE_URL=f'{services.base_url}/fmp/api/v3', ALERTZY_URL=f'{services.base_url}/alertzy/send',
+    )
+
+    print(f'Soak run in {workdir}: {args.tickers} tickers, {args.users} users, {subscriptions} subscriptions, '
+          f'{args.speed}x market clock for {args.duration}s', flush=True)
+    output = open(workdir / 'app.out', 'w')
+    proc = subprocess.Popen(ALWAYS_OPEN_MAIN, cwd=workdir, env=env,
+                            stdout=output, stderr=subprocess.STDOUT)
+
+    samples, all_latencies = [], []
+    start = time.monotonic()
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            if proc.poll() is not None:
+                raise RuntimeError(f'app.main exited with code {proc.returncode}, see {workdir / "app.out"}')
+
+            latencies = services.alerts.take_latencies()
+            all_latencies.extend(latencies)
+            tracker = _get_json(port, '/tracker/stats')
+            outbox = _get_json(port, '/notifications').get('outbox', {})
+            sample = {
+                'elapsed': round(elapsed, 1),
+                'sim_hours': round(market.sim_seconds() / 3600, 2),
+                **_proc_status(proc.pid),
+                'db_bytes': _db_bytes(workdir),
+                'quotes_served': market.quotes_served,
+                'ticks_late': tracker.get('late'),
+                'max_lag': tracker.get('max_lag'),
+                'pushes': services.alerts.pushes,
+                'outbox_pending': outbox.get('db_pending'),
+                'latency_p95': _percentile(latencies, 95),
+            }
+            samples.append(sample)
+            print(' '.join(f'{k}={round(v, 3) if isinstance(v, float) else v}' for k, v in sample.items()), flush=True)
+
+            if elapsed >= args.duration:
+                break
+            time.sleep(min(args.sample_interval, max(0.0, args.duration - elapsed)))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        output.close()
+        services.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # growth is measured after warm up so caches filling on the first sweep are not counted as leaks
+    steady = [s for s in samples if s['elapsed'] >= args.warmup] or samples
+    first, last = steady[0], steady[-1]
+    wall = samples[-1]['elapsed'] or 1
+    return {
+        'subscriptions': subscriptions,
+        'wall_seconds': wall,
+        'sim_hours': samples[-1]['sim_hours'],
+        'quotes_served': market.quotes_served,
+        'quotes_per_second': round(market.quotes_served / wall, 2),
+        'pushes': services.alerts.pushes,
+        'deliveries': services.alerts.deliveries,
+        'unmatched_pushes': services.alerts.unmatched,
+        'alert_latency': {f'p{p}': _percentile(all_latencies, p) for p in (50, 95, 99)}
+                         | {'max': max(all_latencies, default=None)},
+        'rss_mb': {'start': first.get('rss_mb'), 'end': last.get('rss_mb'),
+                   'growth': None if first.get('rss_mb') is None else last['rss_mb'] - first['rss_mb'],
+                   'per_hour': _slope_per_hour(steady, 'rss_mb')},
+        'threads': {'start': first.get('threads'), 'end': last.get('threads'),
+                    'max': max((s['threads'] for s in samples if s.get('threads') is not None), default=None)},
+        'fds': {'start': first.get('fds'), 'end': last.get('fds')},
+        'db_bytes': {'start': first['db_bytes'], 'end': last['db_bytes'],
+                     'per_hour': _slope_per_hour(steady, 'db_bytes')},
+        'max_lag': last.get('max_lag'),
+        'workdir': str(workdir) if args.keep_workdir else None,
+        'samples': samples,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Soak test stocklerts against local fake market data and Alertzy.')
+    parser.add_argument('--duration', type=float, default=3600, help='wall clock seconds to run')
+    parser.add_argument('--speed', type=float, default=60, help='simulated market seconds per wall second')
+    parser.add_argument('--tickers', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--thresholds-per-ticker', type=int, default=4)
+    parser.add_argument('--users-per-ticker', type=int, default=5, help='subscribers drawn for each threshold')
+    parser.add_argument('--provider', choices=('finnhub', 'fmp'), default='finnhub')
+    parser.add_argument('--calls-per-minute', type=int, default=6000, help='max_quote_calls_per_min for the app')
+    parser.add_argument('--alertzy-per-minute', type=float, default=60, help='per account notification rate')
+    parser.add_argument('--alertzy-requests-per-minute', type=float, default=600,
+                        help='rate of joined Alertzy requests')
+    parser.add_argument('--alertzy-error-rate', type=float, default=0.0, help='share of pushes answered with 500')
+    parser.add_argument('--quote-latency-ms', type=float, default=0.0, help='delay added to every quote response')
+    parser.add_argument('--sample-interval', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=120, help='seconds excluded from growth figures')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-rss-growth-mb', type=float, help='max resident memory growth after warm up')
+    parser.add_argument('--max-thread-growth', type=int, help='max thread count growth after warm up')
+    parser.add_argument('--max-p95-latency', type=float, help='max p95 seconds from quote to push')
+    parser.add_argument('--keep-workdir', action='store_true', help='keep the config, database and app output')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = run_soak(args)
+
+    failures = []
+    growth = report['rss_mb']['growth']
+    if args.max_rss_growth_mb is not None and growth is not None and growth > args.max_rss_growth_mb:
+        failures.append(f'resident memory grew {growth:.1f} MB > {args.max_rss_growth_mb} MB')
+    threads = report['threads']
+    if args.max_thread_growth is not None and threads['start'] is not None \
+            and threads['end'] - threads['start'] > args.max_thread_growth:
+        failures.append(f"thread count grew {threads['start']} -> {threads['end']}")
+    p95 = report['alert_latency']['p95']
+    if args.max_p95_latency is not None and (p95 is None or p95 > args.max_p95_latency):
+        failures.append(f'p95 alert latency {p95 if p95 is None else round(p95, 3)}s > {args.max_p95_latency}s')
+    report['failures'] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['subscriptions']} subscriptions, {report['sim_hours']} simulated hours "
+              f"in {report['wall_seconds']}s")
+        print(f"quotes: {report['quotes_served']} ({report['quotes_per_second']}/s), max lag {report['max_lag']}")
+        print(f"pushes: {report['pushes']} to {report['deliveries']} accounts "
+              f"({report['unmatched_pushes']} not matched to a quote)")
+        latency = report['alert_latency']
+        print('alert latency: ' + ', '.join(f'{k}={"n/a" if v is None else f"{v:.3f}s"}' for k, v in latency.items()))
+        for key in ('rss_mb', 'threads', 'fds', 'db_bytes'):
+            print(f'{key}: ' + ', '.join(f'{k}={"n/a" if v is None else round(v, 2)}' for k, v in report[key].items()))
+        for failure in failures:
+            print(f'OVER BUDGET: {failure}')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Cold start benchmark.
+
+Measures import time of app.main with ``python -X importtime`` and the wall
+clock time until a freshly started app.main answers /health and fetches its
+first quote. The market hours check is replaced so the tracker runs at any
+time, and quotes are replayed from a generated file so the run needs no
+network access. Exits non-zero when a budget is exceeded.
+
+    python -m app.tools.startup_bench --health-budget 1.5 --first-quote-budget 3
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import yaml
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+# app.main with the market hours check replaced, so the tracker fetches at any time of day
+ALWAYS_OPEN_MAIN = [sys.executable, '-c', 'from app.main import main; main(tick=lambda: True)']
+IMPORT_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+
+def measure_imports(module: str = 'app.main', top: int = 15) -> dict:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr[-2000:]}')
+
+    packages = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative, name = int(match.group(1)), int(match.group(2)), match.group(3)
+        if name == module:
+            total_us = cumulative
+        # self time summed per top-level package shows which dependency is slow to import
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0) + self_us
+
+    slowest = sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return {
+        'total_seconds': total_us / 1e6,
+        'slowest': [{'package': name, 'seconds': us / 1e6} for name, us in slowest],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _write_workdir(workdir: Path) -> None:
+    config = yaml.safe_load((REPO_ROOT / 'config.yaml').read_text())
+    replay_file = workdir / 'quotes.jsonl'
+    with open(replay_file, 'w') as f:
+        for item in config['tickers']:
+            f.write(json.dumps({'symbol': item['symbol'], 'c': 100.0, 'o': 100.0, 'h': 100.0, 'l': 100.0,
+                                'pc': 100.0, 'd': 0.0, 'dp': 0.0, 't': int(time.time())}) + '\n')
+    config['market_data'] = {'providers': ['replay'], 'replay_file': str(replay_file)}
+    config['heartbeat'] = {'url': 'http://127.0.0.1:9/'}
+    (workdir / 'config.yaml').write_text(yaml.safe_dump(config))
+
+
+def measure_startup(timeout: float = 60) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix='stocklerts-bench-'))
+    _write_workdir(workdir)
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), PYTHONPATH=str(REPO_ROOT))
+
+    marks = {}
+    start = time.monotonic()
+    proc = subprocess.Popen(ALWAYS_OPEN_MAIN, cwd=workdir, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    def read_output():
+        for line in proc.stdout:
+            match = re.search(r'Startup: (\w+) after ([\d.]+)s', line)
+            if match:
+                marks[match.group(1)] = float(match.group(2))
+                marks.setdefault(f'{match.group(1)}_wall', time.monotonic() - start)
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+
+    health = None
+    try:
+        while time.monotonic() - start < timeout:
+            if health is None:
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1) as resp:
+                        if resp.status == 200:
+                            health = time.monotonic() - start
+                except OSError:
+                    pass
+            if health is not None and 'first_quote_wall' in marks:
+                break
+            if proc.poll() is not None:
+                raise RuntimeError(f'app.main exited with code {proc.returncode}')
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'time_to_health': health,
+        'time_to_first_quote': marks.get('first_quote_wall'),
+        'in_process_marks': {k: v for k, v in marks.items() if not k.endswith('_wall')},
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Measure stocklerts cold start time.')
+    parser.add_argument('--import-budget', type=float, help='max seconds to import app.main')
+    parser.add_argument('--health-budget', type=float, help='max seconds until /health answers')
+    parser.add_argument('--first-quote-budget', type=float, help='max seconds until the first quote is fetched')
+    parser.add_argument('--skip-startup', action='store_true', help='only measure import time')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = {'imports': measure_imports()}
+    if not args.skip_startup:
+        report['startup'] = measure_startup()
+
+    failures = []
+    if args.import_budget is not None and report['imports']['total_seconds'] > args.import_budget:
+        failures.append(f"import took {report['imports']['total_seconds']:.3f}s > {args.import_budget}s")
+    if 'startup' in report:
+        for key, budget in (('time_to_health', args.health_budget), ('time_to_first_quote', args.first_quote_budget)):
+            value = report['startup'][key]
+            if budget is not None and (value is None or value > budget):
+                failures.append(f'{key} {value if value is None else round(value, 3)}s > {budget}s')
+    report['failures'] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import app.main: {report['imports']['total_seconds']:.3f}s")
+        for item in report['imports']['slowest']:
+            print(f"  {item['package']:<30} {item['seconds']:.3f}s")
+        if 'startup' in report:
+            for key in ('time_to_health', 'time_to_first_quote'):
+                value = report['startup'][key]
+                print(f"{key}: {'n/a' if value is None else f'{value:.3f}s'}")
+        for failure in failures:
+            print(f'OVER BUDGET: {failure}')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# enough pooled connections per host for every quote request the tracker keeps in flight
+POOL_SIZE = 32
+
+_session: Optional[requests.Session] = None
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, body: bytes):
+        super().__init__(f'HTTP {status}: {body[:200]!r}')
+        self.status = status
+        self.body = body
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Accept': 'application/json', 'User-Agent': 'stocklerts'})
+        _session = session
+    return _session
+
+
+def _get(url: str, params: Optional[dict], timeout: float) -> Any:
+    response = _get_session().get(url, params=params, timeout=timeout)
+    if not 200 <= response.status_code < 300:
+        raise HTTPError(response.status_code, response.content)
+    return response.json()
+
+
+async def get_json(url: str, params: Optional[dict] = None, timeout: float = 10) -> Any:
+    """HTTP GET returning decoded JSON, awaitable from the tracker's event loop.
+
+    Requests go through one pooled requests.Session on worker threads, so
+    connections (and their TLS handshakes) are reused across quotes, with
+    redirects, compression and proxies handled by requests. Raises HTTPError
+    for non-2xx responses.
+    """
+    return await asyncio.to_thread(_get, url, params, timeout)
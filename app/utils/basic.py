@@ -1,7 +1,10 @@
+import atexit
 import os
-from functools import wraps
+from functools import lru_cache, wraps
 import threading
 import logging
+import logging.handlers
+import queue
 import pytz
 from datetime import datetime, time as dt_time
 import time
@@ -9,6 +12,8 @@ import time
 import requests
 import yaml
 
+from app.utils.log_handlers import JsonFormatter, SizedTimedRotatingFileHandler, StructuredQueueHandler
+
 from concurrent.futures import ThreadPoolExecutor
 
 executor = ThreadPoolExecutor(max_workers=1)
@@ -17,6 +22,19 @@ MARKET_OPEN_TIME = dt_time(9, 30)
 MARKET_CLOSE_TIME = dt_time(16, 0)
 MARKET_TIMEZONE = pytz.timezone('US/Eastern')
 
+STARTUP_TIME = time.time()
+startup_marks: dict[str, float] = {}
+
+
+def mark_startup(name: str) -> None:
+    """Record the first time a startup milestone is reached."""
+    if name in startup_marks:
+        return
+    elapsed = time.time() - STARTUP_TIME
+    startup_marks[name] = elapsed
+    logging.warning(f'Startup: {name} after {elapsed:.3f}s')
+
+
 def load_prompt(prompt_path) -> str:
     try:
         with open(prompt_path, 'r') as f:
@@ -26,24 +44,61 @@ def load_prompt(prompt_path) -> str:
         raise e
 
 
+@lru_cache(maxsize=None)
+def get_prompt(prompt_path) -> str:
+    """Load a prompt on first use and keep it for later calls."""
+    return load_prompt(prompt_path)
+
+
 def load_config(config_path: str) -> dict:
     with open(config_path, 'r') as file:
         return yaml.safe_load(file)
 
 
-def setup_logging(log_file: str) -> None:
+def setup_logging(log_file: str, json_format: bool | None = None) -> logging.handlers.QueueListener:
+    """Route all logging through a queue drained by a single writer thread.
+
+    Callers only pay for enqueueing a record; file and console I/O happen on
+    the listener thread. The file rotates daily and whenever it passes
+    LOG_MAX_BYTES. Set LOG_FORMAT=json for structured output.
+    """
     log_dir = os.path.dirname(log_file)
-    if not os.path.exists(log_dir):
+    if log_dir and not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
-    logging.basicConfig(
-        level=logging.WARNING,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
+    if json_format is None:
+        json_format = os.getenv('LOG_FORMAT', '').lower() == 'json'
+    formatter = JsonFormatter() if json_format else logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+
+    file_handler = SizedTimedRotatingFileHandler(
+        log_file,
+        backup_count=int(os.getenv('LOG_BACKUP_COUNT', 14)),
+        max_bytes=int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)),
     )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(StructuredQueueHandler(log_queue))
+    root.setLevel(os.getenv('LOG_LEVEL', 'WARNING').upper())
+
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+
+def _stop_listener(listener: logging.handlers.QueueListener) -> None:
+    # flushes queued records on exit, the listener may already have been stopped
+    try:
+        listener.stop()
+    except AttributeError:
+        pass
 
 
 def is_market_open():
@@ -59,18 +114,25 @@ def is_market_open():
     return False
 
 
+def trading_day():
+    """Today's date in the market's timezone."""
+    return datetime.now(MARKET_TIMEZONE).date()
+
+
+market_state = {'open': None}
+
+
 def state_tracker(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        wrapper.previous_state = getattr(wrapper, 'previous_state', None)
         current_state = is_market_open()
 
-        if wrapper.previous_state != current_state:
+        if market_state['open'] != current_state:
             if current_state:
                 logging.warning('Market is now OPEN. Starting stock price checks.')
             else:
                 logging.warning('Market is now CLOSED. Stopping stock price checks.')
-            wrapper.previous_state = current_state
+            market_state['open'] = current_state
 
         return func(*args, **kwargs)
 
@@ -95,7 +157,7 @@ def heartbeat(url: str, interval: int = 5):
                         try:
                             response = requests.get(url)
                             if response.status_code == 200:
-                                logging.debug(f'Heartbeat sent successfully to {url}')
+                                logging.debug('Heartbeat sent successfully to %s', url)
                             else:
                                 logging.warning(f'Failed to send heartbeat to {url}. Status Code: {response.status_code}')
                         except Exception as e:
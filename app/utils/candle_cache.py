@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from app.helpers.quote_providers import CandlesUnavailable, QuoteProvider
+from app.utils.basic import MARKET_TIMEZONE, trading_day
+
+CANDLE_DTYPE = np.dtype([('t', '<i8'), ('o', '<f8'), ('h', '<f8'), ('l', '<f8'), ('c', '<f8'), ('v', '<f8')])
+REFRESHED_FILE = '_refreshed.json'
+
+
+class CandleCache:
+    """Daily candles per symbol kept on disk as .npy files and read memory-mapped.
+
+    Readers get a read-only view straight onto the file's pages, so looking
+    up years of history costs no copy and no network call. refresh() runs
+    once a day before the open and only asks the provider for the days after
+    the last stored candle; each symbol's file is rewritten and swapped in
+    atomically, and version is bumped so readers can drop derived values.
+    """
+
+    def __init__(self, directory: str = 'candles', history_days: int = 3 * 365):
+        self.directory = directory
+        self.history_days = history_days
+        self.version = 0
+        self._maps: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._refreshed = self._load_refreshed()
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.directory, f'{symbol.replace("/", "_")}.npy')
+
+    def _load_refreshed(self) -> Dict[str, str]:
+        try:
+            with open(os.path.join(self.directory, REFRESHED_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_refreshed(self) -> None:
+        path = os.path.join(self.directory, REFRESHED_FILE)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self._refreshed, f)
+        os.replace(f'{path}.tmp', path)
+
+    def get(self, symbol: str) -> Optional[np.ndarray]:
+        """All stored candles of symbol, oldest first, as a read-only memory map."""
+        with self._lock:
+            candles = self._maps.get(symbol)
+            if candles is None:
+                try:
+                    candles = np.load(self._path(symbol), mmap_mode='r')
+                except (OSError, ValueError):
+                    return None
+                self._maps[symbol] = candles
+            return candles
+
+    def high(self, symbol: str, days: int = 252) -> Optional[float]:
+        candles = self.get(symbol)
+        if candles is None or not len(candles):
+            return None
+        return float(candles['h'][-days:].max())
+
+    def low(self, symbol: str, days: int = 252) -> Optional[float]:
+        candles = self.get(symbol)
+        if candles is None or not len(candles):
+            return None
+        return float(candles['l'][-days:].min())
+
+    def sma(self, symbol: str, days: int = 20) -> Optional[float]:
+        """Average close of the last days sessions, None until that many are stored."""
+        candles = self.get(symbol)
+        if candles is None or len(candles) < days:
+            return None
+        return float(candles['c'][-days:].mean())
+
+    def is_stale(self, symbols: Iterable[str]) -> bool:
+        today = trading_day().isoformat()
+        return any(self._refreshed.get(symbol) != today for symbol in symbols)
+
+    def _fetch(self, provider: QuoteProvider, symbol: str, start: int, end: int) -> np.ndarray:
+        data = provider.candles(symbol, start, end)
+        if not data or data.get('s') != 'ok':
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        fetched = np.empty(len(data['t']), dtype=CANDLE_DTYPE)
+        for field in CANDLE_DTYPE.names:
+            fetched[field] = data[field]
+        return fetched
+
+    def refresh(self, provider: QuoteProvider, symbols: Iterable[str], today: Optional[date] = None) -> dict:
+        """Append the days missing since the last stored candle for each symbol, up to yesterday."""
+        today = today or trading_day()
+        # candles stop before today's session, which would otherwise be stored half formed
+        midnight = MARKET_TIMEZONE.localize(datetime.combine(today, datetime.min.time()))
+        end = int(midnight.timestamp()) - 1
+        stats = {'symbols': 0, 'fetched': 0, 'candles': 0, 'failed': 0}
+
+        for symbol in symbols:
+            if self._refreshed.get(symbol) == today.isoformat():
+                continue
+            stats['symbols'] += 1
+            existing = self.get(symbol)
+            if existing is not None and len(existing):
+                start = int(existing['t'][-1]) + 1
+            else:
+                start = int((midnight - timedelta(days=self.history_days)).timestamp())
+            if start <= end:
+                try:
+                    fetched = self._fetch(provider, symbol, start, end)
+                except CandlesUnavailable as e:
+                    # the same answer is coming for every other symbol, try again on the next run
+                    logging.error(f'Daily candles are not available, skipping the refresh: {e}')
+                    stats['failed'] += 1
+                    break
+                except Exception as e:
+                    logging.error(f'Fetching candles for {symbol} failed: {e}')
+                    stats['failed'] += 1
+                    continue
+                stats['fetched'] += 1
+                if existing is not None:
+                    fetched = fetched[fetched['t'] > (existing['t'][-1] if len(existing) else -1)]
+                if len(fetched):
+                    merged = fetched if existing is None else np.concatenate([existing, fetched])
+                    path = self._path(symbol)
+                    with open(f'{path}.tmp', 'wb') as f:
+                        np.save(f, merged)
+                    with self._lock:
+                        os.replace(f'{path}.tmp', path)
+                        self._maps.pop(symbol, None)
+                    stats['candles'] += len(fetched)
+            self._refreshed[symbol] = today.isoformat()
+
+        self._save_refreshed()
+        self.version += 1
+        logging.warning(f'Candle cache refreshed: {stats}')
+        return stats
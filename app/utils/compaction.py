@@ -0,0 +1,145 @@
+import math
+import re
+from collections import Counter
+from statistics import mean
+from typing import Callable, Dict, List, Optional, Tuple
+
+# rough chars per token for English and CSV-ish text, close enough for budgeting
+CHARS_PER_TOKEN = 4
+# the latest rows are always kept first, whatever their score
+RECENT_ROWS = 5
+_NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def to_float(value) -> Optional[float]:
+    """First number in a sheet cell ("+1.50", "5%", "3-5%"), None when there is none."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value or ''))
+    return float(match.group()) if match else None
+
+
+def _row_line(row: dict) -> str:
+    return ','.join(str(v) for v in row.values())
+
+
+def select_rows(rows: List[dict], score: Callable[[dict], float], budget_tokens: int) -> List[dict]:
+    """The most recent rows, then the highest scoring ones that fit the budget, in their original order."""
+    if not rows:
+        return []
+    header_tokens = estimate_tokens(','.join(rows[0].keys()))
+    remaining = budget_tokens - header_tokens
+    recent = list(range(len(rows) - 1, max(-1, len(rows) - 1 - RECENT_ROWS), -1))
+    ranked = recent + sorted(range(len(rows) - len(recent)), key=lambda i: score(rows[i]), reverse=True)
+
+    chosen = []
+    for i in ranked:
+        cost = estimate_tokens(_row_line(rows[i])) + 1
+        if cost > remaining:
+            continue
+        chosen.append(i)
+        remaining -= cost
+    return [rows[i] for i in sorted(chosen)]
+
+
+def _picks(row: dict, prefix: str, fields: Tuple[str, ...]) -> List[dict]:
+    picks = []
+    for idx in range(1, 6):
+        symbol = row.get(f'{prefix}{idx}')
+        if symbol:
+            picks.append({field: row.get(f'{field}{idx}') for field in fields} | {'symbol': symbol})
+    return picks
+
+
+def daily_stats(rows: List[dict]) -> Dict:
+    averages = [v for v in (to_float(r.get('average_actual_growth')) for r in rows) if v is not None]
+    markets = [v for v in (to_float(r.get('market_growth')) for r in rows) if v is not None]
+    excess = [a - m for a, m in ((to_float(r.get('average_actual_growth')), to_float(r.get('market_growth')))
+                                 for r in rows) if a is not None and m is not None]
+    actuals, gaps = [], []
+    for row in rows:
+        for pick in _picks(row, 'ticker', ('actual_growth', 'predicted_growth')):
+            actual, predicted = to_float(pick['actual_growth']), to_float(pick['predicted_growth'])
+            if actual is not None:
+                actuals.append(actual)
+                if predicted is not None:
+                    gaps.append(actual - predicted)
+
+    return {
+        'days': len(rows),
+        'picks': len(actuals),
+        'avg_pick_growth': round(mean(actuals), 2) if actuals else None,
+        'pick_win_rate': round(sum(a > 0 for a in actuals) / len(actuals), 2) if actuals else None,
+        'avg_day_growth': round(mean(averages), 2) if averages else None,
+        'avg_market_growth': round(mean(markets), 2) if markets else None,
+        'days_beating_market': sum(e > 0 for e in excess),
+        'avg_excess_vs_market': round(mean(excess), 2) if excess else None,
+        'avg_actual_minus_predicted': round(mean(gaps), 2) if gaps else None,
+    }
+
+
+def best_stats(rows: List[dict]) -> Dict:
+    growths, symbols = [], Counter()
+    for row in rows:
+        for pick in _picks(row, 'ticker', ('growth',)):
+            symbols[pick['symbol']] += 1
+            growth = to_float(pick['growth'])
+            if growth is not None:
+                growths.append(growth)
+    return {
+        'days': len(rows),
+        'avg_growth': round(mean(growths), 2) if growths else None,
+        'max_growth': round(max(growths), 2) if growths else None,
+        'repeat_symbols': [s for s, n in symbols.most_common(10) if n > 1],
+    }
+
+
+def _daily_score(row: dict) -> float:
+    # the most informative days are the ones that beat or lagged the market the most
+    average, market = to_float(row.get('average_actual_growth')), to_float(row.get('market_growth'))
+    if average is None:
+        return 0.0
+    return abs(average - (market or 0.0))
+
+
+def _best_score(row: dict) -> float:
+    return max((to_float(p['growth']) or 0.0 for p in _picks(row, 'ticker', ('growth',))), default=0.0)
+
+
+def _render(stats: Dict, rows: List[dict], total: int) -> str:
+    summary = ', '.join(f'{k}={v}' for k, v in stats.items())
+    lines = [f'Aggregates over all {total} rows: {summary}']
+    if rows:
+        lines.append(f'{len(rows)} representative rows:')
+        lines.append(','.join(rows[0].keys()))
+        lines.extend(_row_line(r) for r in rows)
+    return '\n'.join(lines)
+
+
+def compact_history(daily_rows: List[dict], best_rows: List[dict], budget_tokens: int) -> Tuple[str, str, Dict]:
+    """Aggregate statistics plus the most telling rows of each sheet within budget_tokens.
+
+    After the latest few rows, daily rows are ranked by how far the picks
+    were from the market that day and best performer rows by their top gain;
+    the budget is split between the two in proportion to their size.
+    """
+    daily_summary, best_summary = daily_stats(daily_rows), best_stats(best_rows)
+    daily_budget = best_budget = budget_tokens - estimate_tokens(_render(daily_summary, [], 0) +
+                                                                 _render(best_summary, [], 0))
+    total = len(daily_rows) + len(best_rows)
+    if total:
+        daily_budget = max(0, daily_budget) * len(daily_rows) // total
+        best_budget = max(0, best_budget) - daily_budget
+
+    daily_selected = select_rows(daily_rows, _daily_score, daily_budget)
+    best_selected = select_rows(best_rows, _best_score, best_budget)
+    info = {
+        'daily_rows': len(daily_rows), 'daily_rows_used': len(daily_selected),
+        'best_rows': len(best_rows), 'best_rows_used': len(best_selected),
+    }
+    return (_render(daily_summary, daily_selected, len(daily_rows)),
+            _render(best_summary, best_selected, len(best_rows)), info)
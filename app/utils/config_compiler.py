@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from numbers import Real
+from typing import Dict, List, Optional
+
+import yaml
+
+# bump when CompiledConfig changes shape so stale caches are rebuilt
+COMPILER_VERSION = 3
+
+_memo_lock = threading.Lock()
+# config path -> ((mtime_ns, size), CompiledConfig)
+_memo: Dict[str, tuple] = {}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class CompiledConfig:
+    """config.yaml normalized into the indexes the tracker works from.
+
+    tickers       merged ticker entries, one per symbol, in config order
+    thresholds    symbol -> [{'value', 'users'}], one entry per distinct value
+    subscriptions user id -> [(symbol, kind, value)] for thresholds and rules
+    users         user id -> account settings (account_id, email, notify_thresh, is_admin)
+    raw           the parsed YAML, for sections that are not compiled
+    """
+    __slots__ = ('raw', 'tickers', 'thresholds', 'subscriptions', 'users', 'digest')
+
+    def __init__(self, raw: dict, tickers: List[dict], thresholds: Dict[str, List[dict]],
+                 subscriptions: Dict[int, List[tuple]], users: Dict[int, dict], digest: str = ''):
+        self.raw = raw
+        self.tickers = tickers
+        self.thresholds = thresholds
+        self.subscriptions = subscriptions
+        self.users = users
+        self.digest = digest
+
+    @property
+    def user_notify_thresh(self) -> Dict[int, float]:
+        return {user_id: settings['notify_thresh'] for user_id, settings in self.users.items()}
+
+    def to_json(self) -> dict:
+        # user ids are ints, kept as pairs so JSON does not turn them into strings
+        return {
+            'raw': self.raw,
+            'tickers': self.tickers,
+            'subscriptions': [[user_id, subs] for user_id, subs in self.subscriptions.items()],
+            'users': [[user_id, settings] for user_id, settings in self.users.items()],
+            'digest': self.digest,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'CompiledConfig':
+        tickers = data['tickers']
+        # rebuilt so thresholds shares its lists with tickers, as compile_config does
+        thresholds = {entry['symbol']: entry['threshold'] for entry in tickers}
+        subscriptions = {user_id: [tuple(sub) for sub in subs] for user_id, subs in data['subscriptions']}
+        return cls(data['raw'], tickers, thresholds, subscriptions, dict(data['users']), data['digest'])
+
+
+def _merge_users(target: List, users: List) -> None:
+    for user_id in users:
+        if user_id not in target:
+            target.append(user_id)
+
+
+def compile_config(raw: dict) -> CompiledConfig:
+    """Validate and index a parsed config, raising ConfigError listing every problem."""
+    errors = []
+
+    users: Dict[int, dict] = {}
+    for account in (raw.get('alertzy') or {}).get('accounts') or []:
+        user_id = account.get('user_id')
+        if user_id is None:
+            errors.append(f'account without user_id: {account}')
+            continue
+        if user_id in users:
+            errors.append(f'duplicate account for user {user_id}')
+            continue
+        notify_thresh = account.get('notify_thresh')
+        if not isinstance(notify_thresh, Real) or notify_thresh < 0:
+            errors.append(f'user {user_id} needs a non-negative notify_thresh')
+            continue
+        users[user_id] = {
+            'account_id': account.get('account_id'),
+            'email': account.get('email'),
+            'notify_thresh': notify_thresh,
+            'is_admin': bool(account.get('is_admin')),
+        }
+
+    merged: Dict[str, dict] = {}
+    for item in raw.get('tickers') or []:
+        symbol = item.get('symbol')
+        if not isinstance(symbol, str) or not symbol.strip():
+            errors.append(f'ticker without a symbol: {item}')
+            continue
+        symbol = symbol.strip().upper()
+        if symbol in merged:
+            logging.warning(f'Ticker {symbol} is listed more than once in the config, merging entries')
+        entry = merged.setdefault(symbol, {'symbol': symbol, 'threshold': [], 'rules': []})
+
+        by_value = {t['value']: t for t in entry['threshold']}
+        for threshold in item.get('threshold') or []:
+            value = threshold.get('value')
+            if not isinstance(value, Real):
+                errors.append(f'{symbol}: threshold value {value!r} is not a number')
+                continue
+            unknown = [u for u in threshold.get('users') or [] if u not in users]
+            if unknown:
+                logging.warning(f'{symbol}: threshold {value} references unknown users {unknown}')
+            if value in by_value:
+                _merge_users(by_value[value]['users'], threshold.get('users') or [])
+            else:
+                by_value[value] = {'value': value, 'users': list(dict.fromkeys(threshold.get('users') or []))}
+                entry['threshold'].append(by_value[value])
+
+        for rule in item.get('rules') or []:
+            if not rule.get('type'):
+                errors.append(f'{symbol}: rule without a type: {rule}')
+                continue
+            unknown = [u for u in rule.get('users') or [] if u not in users]
+            if unknown:
+                logging.warning(f'{symbol}: rule {rule["type"]} references unknown users {unknown}')
+            entry['rules'].append(dict(rule))
+
+    if errors:
+        raise ConfigError('Invalid config:\n  ' + '\n  '.join(errors))
+
+    tickers = list(merged.values())
+    thresholds = {entry['symbol']: entry['threshold'] for entry in tickers}
+    subscriptions: Dict[int, List[tuple]] = {user_id: [] for user_id in users}
+    for entry in tickers:
+        for threshold in entry['threshold']:
+            for user_id in threshold['users']:
+                subscriptions.setdefault(user_id, []).append((entry['symbol'], 'threshold', threshold['value']))
+        for rule in entry['rules']:
+            for user_id in rule.get('users') or []:
+                subscriptions.setdefault(user_id, []).append((entry['symbol'], rule['type'], rule.get('value')))
+
+    return CompiledConfig(raw, tickers, thresholds, subscriptions, users)
+
+
+def load_compiled_config(path: str = 'config.yaml', cache_path: Optional[str] = None) -> CompiledConfig:
+    """Compiled config for path, reusing the in-process copy or the on-disk cache when the YAML is unchanged.
+
+    The cache is a JSON file keyed by the SHA-256 of the YAML, so startup
+    skips parsing and indexing entirely while the config is untouched.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _memo_lock:
+        memo = _memo.get(path)
+    if memo is not None and memo[0] == signature:
+        return memo[1]
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data + f'v{COMPILER_VERSION}'.encode()).hexdigest()
+    cache_path = cache_path or os.getenv('CONFIG_CACHE_PATH') or f'{os.path.splitext(path)[0]}.compiled.json'
+
+    compiled = None
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get('digest') == digest:
+            compiled = CompiledConfig.from_json(cached)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error(f'Ignoring unreadable compiled config cache {cache_path}: {e}')
+
+    if compiled is None:
+        compiled = compile_config(yaml.safe_load(data) or {})
+        compiled.digest = digest
+        try:
+            with open(f'{cache_path}.tmp', 'w') as f:
+                json.dump(compiled.to_json(), f)
+            os.replace(f'{cache_path}.tmp', cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.error(f'Unable to write compiled config cache {cache_path}: {e}')
+
+    with _memo_lock:
+        _memo[path] = (signature, compiled)
+    return compiled
@@ -1,10 +1,11 @@
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.backends import default_backend
 import base64
 
 
 def decrypt(encrypted_text, key):
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.backends import default_backend
+
     key = key.encode('utf-8')
     encrypted_bytes = base64.b64decode(encrypted_text)
 
@@ -17,4 +18,3 @@ def decrypt(encrypted_text, key):
     decrypted_data = unpadder.update(decrypted_padded) + unpadder.finalize()
 
     return decrypted_data.decode('utf-8')
-
@@ -0,0 +1,235 @@
+import math
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+
+class MonotonicWindow:
+    """Rolling min or max over the last `size` samples of a shared ring.
+
+    Candidate sample numbers live in a preallocated array used as a deque, so
+    pushes are amortised O(1) and never allocate.
+    """
+    __slots__ = ('size', 'seqs', 'head', 'length', 'is_max')
+
+    def __init__(self, size: int, is_max: bool):
+        self.size = size
+        self.seqs = array('q', [0] * size)
+        self.head = 0
+        self.length = 0
+        self.is_max = is_max
+
+    def evict(self, seq: int) -> None:
+        # drop the sample leaving the window before its ring slot is overwritten
+        while self.length and self.seqs[self.head] <= seq - self.size:
+            self.head = (self.head + 1) % self.size
+            self.length -= 1
+
+    def push(self, seq: int, values: array) -> None:
+        price = values[seq % self.size]
+        while self.length:
+            tail = (self.head + self.length - 1) % self.size
+            tail_value = values[self.seqs[tail] % self.size]
+            if (tail_value <= price) if self.is_max else (tail_value >= price):
+                self.length -= 1
+            else:
+                break
+        self.seqs[(self.head + self.length) % self.size] = seq
+        self.length += 1
+
+    def value(self, values: array) -> Optional[float]:
+        if not self.length:
+            return None
+        return values[self.seqs[self.head] % self.size]
+
+    def export(self) -> List[int]:
+        """Candidate sample numbers, oldest first."""
+        return [self.seqs[(self.head + i) % self.size] for i in range(self.length)]
+
+    def restore(self, seqs: List[int]) -> None:
+        self.head = 0
+        self.length = len(seqs)
+        for i, seq in enumerate(seqs):
+            self.seqs[i] = seq
+
+
+class IndicatorState:
+    """Rolling indicators for one symbol, updated in O(1) per quote."""
+    __slots__ = ('window', 'alpha', 'prices', 'weights', 'returns', 'seq',
+                 'sum_pw', 'sum_w', 'sum_r', 'sum_r2', 'ema', 'last_price', 'last_volume',
+                 'mins', 'maxs', 'updated_at')
+
+    def __init__(self, window: int = 60, ema_span: int = 20):
+        self.window = window
+        self.alpha = 2 / (ema_span + 1)
+        self.prices = array('d', [0.0] * window)
+        self.weights = array('d', [0.0] * window)
+        self.returns = array('d', [0.0] * window)
+        self.seq = -1
+        self.sum_pw = 0.0
+        self.sum_w = 0.0
+        self.sum_r = 0.0
+        self.sum_r2 = 0.0
+        self.ema = None
+        self.last_price = None
+        self.last_volume = None
+        self.mins = MonotonicWindow(window, is_max=False)
+        self.maxs = MonotonicWindow(window, is_max=True)
+        self.updated_at = None
+
+    def update(self, price: float, volume: Optional[float] = None, ts: Optional[float] = None) -> None:
+        # quotes carry cumulative day volume when they carry any, so weight by the
+        # volume traded since the previous quote and fall back to equal weights
+        weight = 1.0
+        if volume is not None:
+            if self.last_volume is not None and volume >= self.last_volume:
+                weight = volume - self.last_volume or 1.0
+            self.last_volume = volume
+
+        ret = math.log(price / self.last_price) if self.last_price else 0.0
+
+        self.seq += 1
+        slot = self.seq % self.window
+        if self.seq >= self.window:
+            old_price, old_weight, old_ret = self.prices[slot], self.weights[slot], self.returns[slot]
+            self.sum_pw -= old_price * old_weight
+            self.sum_w -= old_weight
+            self.sum_r -= old_ret
+            self.sum_r2 -= old_ret * old_ret
+
+        self.mins.evict(self.seq)
+        self.maxs.evict(self.seq)
+        self.prices[slot] = price
+        self.weights[slot] = weight
+        self.returns[slot] = ret
+        self.mins.push(self.seq, self.prices)
+        self.maxs.push(self.seq, self.prices)
+
+        self.sum_pw += price * weight
+        self.sum_w += weight
+        self.sum_r += ret
+        self.sum_r2 += ret * ret
+        if slot == self.window - 1:
+            self._resum()
+
+        self.ema = price if self.ema is None else self.ema + self.alpha * (price - self.ema)
+        self.last_price = price
+        self.updated_at = ts if ts is not None else time.time()
+
+    def _resum(self) -> None:
+        # running sums drift with floating point error, rebuild them once per lap
+        self.sum_pw = self.sum_w = self.sum_r = self.sum_r2 = 0.0
+        for i in range(self.window):
+            self.sum_pw += self.prices[i] * self.weights[i]
+            self.sum_w += self.weights[i]
+            self.sum_r += self.returns[i]
+            self.sum_r2 += self.returns[i] * self.returns[i]
+
+    @property
+    def count(self) -> int:
+        return min(self.seq + 1, self.window)
+
+    @property
+    def vwap(self) -> Optional[float]:
+        return self.sum_pw / self.sum_w if self.sum_w else None
+
+    @property
+    def rolling_min(self) -> Optional[float]:
+        return self.mins.value(self.prices)
+
+    @property
+    def rolling_max(self) -> Optional[float]:
+        return self.maxs.value(self.prices)
+
+    @property
+    def volatility(self) -> Optional[float]:
+        """Standard deviation of quote-to-quote log returns over the window, in percent."""
+        n = self.count
+        if n < 2:
+            return None
+        mean = self.sum_r / n
+        variance = max(self.sum_r2 / n - mean * mean, 0.0) * n / (n - 1)
+        return math.sqrt(variance) * 100
+
+    def export(self) -> dict:
+        """Complete state as plain JSON types, see from_export."""
+        return {
+            'window': self.window, 'alpha': self.alpha, 'seq': self.seq,
+            'prices': self.prices.tolist(), 'weights': self.weights.tolist(), 'returns': self.returns.tolist(),
+            'sum_pw': self.sum_pw, 'sum_w': self.sum_w, 'sum_r': self.sum_r, 'sum_r2': self.sum_r2,
+            'ema': self.ema, 'last_price': self.last_price, 'last_volume': self.last_volume,
+            'mins': self.mins.export(), 'maxs': self.maxs.export(), 'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def from_export(cls, data: dict) -> 'IndicatorState':
+        state = cls(data['window'])
+        state.alpha = data['alpha']
+        state.seq = data['seq']
+        state.prices = array('d', data['prices'])
+        state.weights = array('d', data['weights'])
+        state.returns = array('d', data['returns'])
+        if not len(state.prices) == len(state.weights) == len(state.returns) == state.window:
+            raise ValueError('indicator buffers do not match the window size')
+        for name in ('sum_pw', 'sum_w', 'sum_r', 'sum_r2', 'ema', 'last_price', 'last_volume', 'updated_at'):
+            setattr(state, name, data[name])
+        state.mins.restore(data['mins'])
+        state.maxs.restore(data['maxs'])
+        return state
+
+    def to_dict(self) -> dict:
+        return {
+            'price': self.last_price,
+            'samples': self.count,
+            'vwap': self.vwap,
+            'ema': self.ema,
+            'rolling_min': self.rolling_min,
+            'rolling_max': self.rolling_max,
+            'volatility': self.volatility,
+            'updated_at': self.updated_at,
+        }
+
+
+class IndicatorRegistry:
+    def __init__(self, window: int = 60, ema_span: int = 20):
+        self.window = window
+        self.ema_span = ema_span
+        self._states: Dict[str, IndicatorState] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, window: int, ema_span: int) -> None:
+        with self._lock:
+            self.window = window
+            self.ema_span = ema_span
+            self._states.clear()
+
+    def get(self, symbol: str) -> Optional[IndicatorState]:
+        return self._states.get(symbol)
+
+    def update(self, symbol: str, quote: dict) -> Optional[IndicatorState]:
+        price = quote.get('c')
+        if not price:
+            return self._states.get(symbol)
+        state = self._states.get(symbol)
+        if state is None:
+            with self._lock:
+                state = self._states.setdefault(symbol, IndicatorState(self.window, self.ema_span))
+        state.update(price, quote.get('v'))
+        return state
+
+    def export_states(self) -> Dict[str, dict]:
+        return {symbol: state.export() for symbol, state in list(self._states.items())}
+
+    def import_states(self, states: Dict[str, dict]) -> None:
+        with self._lock:
+            for symbol, data in states.items():
+                # a changed window size would make the ring buffers inconsistent
+                if data['window'] == self.window:
+                    self._states[symbol] = IndicatorState.from_export(data)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {symbol: state.to_dict() for symbol, state in list(self._states.items())}
+
+
+indicator_registry = IndicatorRegistry()
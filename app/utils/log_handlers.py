@@ -0,0 +1,89 @@
+import copy
+import json
+import logging
+import os
+from logging.handlers import QueueHandler, TimedRotatingFileHandler
+
+# extra fields callers attach with logging.xxx(..., extra={...}) that JSON output carries
+JSON_EXTRA_FIELDS = ('ticker', 'user', 'users', 'job')
+
+_exception_formatter = logging.Formatter()
+
+
+def _unique_rotation_name(name: str) -> str:
+    # size based rollovers can happen several times in one period, keep them all
+    if not os.path.exists(name):
+        return name
+    index = 1
+    while os.path.exists(f'{name}.{index}'):
+        index += 1
+    return f'{name}.{index}'
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """Rotates at the configured time and whenever the file grows past max_bytes."""
+
+    def __init__(self, filename: str, when: str = 'midnight', backup_count: int = 14,
+                 max_bytes: int = 10 * 1024 * 1024):
+        super().__init__(filename, when=when, backupCount=backup_count, delay=True)
+        self.max_bytes = max_bytes
+        self.namer = _unique_rotation_name
+        # the record shouldRollover just formatted, so emit writes it without formatting it again
+        self._formatted = None
+
+    def format(self, record: logging.LogRecord) -> str:
+        formatted, self._formatted = self._formatted, None
+        if formatted is not None and formatted[0] is record:
+            return formatted[1]
+        return super().format(record)
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if super().shouldRollover(record):
+            return 1
+        if not self.max_bytes:
+            return 0
+        if self.stream is None:
+            self.stream = self._open()
+        text = super().format(record)
+        self._formatted = (record, text)
+        return 1 if self.stream.tell() + len(text) + 1 >= self.max_bytes else 0
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that keeps the traceback apart from the message.
+
+    The stock prepare() formats the traceback into the message and drops
+    exc_info, so the JSON formatter on the listener could not put it in its
+    own field. Here it is formatted into exc_text, which both formatters read.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        # the args may not be picklable or may change before the listener gets to them
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in JSON_EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = list(value) if isinstance(value, (set, tuple)) else value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
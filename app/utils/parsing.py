@@ -25,4 +25,68 @@ def parse_json(text: str) -> Optional[Union[dict, list]]:
 
             return json.loads(repaired_str)
         except json.JSONDecodeError:
-            return None
\ No newline at end of file
+            return None
+
+
+_JSON_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'number': (int, float),
+    'integer': int,
+    'boolean': bool,
+}
+
+
+def validate_schema(data: Any, schema: dict) -> bool:
+    """Check data against the subset of JSON schema used in app.schemas."""
+    expected = schema.get('type')
+    if expected:
+        py_type = _JSON_TYPES.get(expected)
+        if py_type and not isinstance(data, py_type):
+            return False
+        if expected in ('number', 'integer') and isinstance(data, bool):
+            return False
+
+    if isinstance(data, dict):
+        for key in schema.get('required', []):
+            if key not in data:
+                return False
+        for key, sub_schema in schema.get('properties', {}).items():
+            if key in data and not validate_schema(data[key], sub_schema):
+                return False
+
+    if isinstance(data, list):
+        if len(data) < schema.get('minItems', 0):
+            return False
+        if 'maxItems' in schema and len(data) > schema['maxItems']:
+            return False
+        item_schema = schema.get('items')
+        if item_schema and not all(validate_schema(item, item_schema) for item in data):
+            return False
+
+    return True
+
+
+def unwrap_schema_result(data: Any, schema: dict, strict: bool = True) -> Optional[Union[dict, list]]:
+    """Validate an LLM result and return it in the shape callers iterate over.
+
+    Prompts ask for a bare JSON array while the schemas wrap that array in an
+    object with a single required key, so both shapes are accepted and the
+    array is returned. With strict=False the shape is normalised without
+    validating the contents.
+    """
+    required = schema.get('required', [])
+    props = schema.get('properties', {})
+    list_key = None
+    if schema.get('type') == 'object' and len(required) == 1 and props.get(required[0], {}).get('type') == 'array':
+        list_key = required[0]
+
+    if list_key is None:
+        return data if not strict or validate_schema(data, schema) else None
+
+    if isinstance(data, list):
+        data = {list_key: data}
+    if strict and not validate_schema(data, schema):
+        return None
+    return data.get(list_key) if isinstance(data, dict) else None
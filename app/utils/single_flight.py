@@ -0,0 +1,71 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from app.utils.basic import MARKET_TIMEZONE, trading_day
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and keeps its result for the trading day.
+
+    Callers arriving while a call is in flight wait for it and get the same
+    result, marked shared. Non-empty results are then served from memory until the market
+    date changes; empty results and errors are not kept so a retry runs again.
+    """
+
+    def __init__(self, day: Callable = trading_day):
+        self._day = day
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # key -> (trading day, generated at, result)
+        self._results: Dict[str, tuple] = {}
+
+    def run(self, key: str, fn: Callable[[], dict]) -> dict:
+        """fn's result plus when it was generated and whether it was served from the cache or shared."""
+        day = self._day()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == day:
+                return dict(cached[2], generated_at=cached[1], cached=True, shared=False)
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            logging.info(f'{key} is already running, waiting for its result')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return dict(call.result, shared=True)
+
+        try:
+            result = fn() or {}
+            generated_at = datetime.now(MARKET_TIMEZONE).isoformat(timespec='seconds')
+            call.result = dict(result, generated_at=generated_at, cached=False, shared=False)
+            if result:
+                with self._lock:
+                    self._results[key] = (day, generated_at, result)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            if call.waiters:
+                logging.info(f'{key} result shared with {call.waiters} waiting callers')
+            call.done.set()
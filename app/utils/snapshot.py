@@ -0,0 +1,65 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Optional
+
+SNAPSHOT_MAGIC = b'STKS'
+SNAPSHOT_VERSION = 2
+# magic, version, crc32 of payload, payload length, written at (epoch seconds)
+SNAPSHOT_HEADER = struct.Struct('<4sHIQd')
+
+
+def write_snapshot(path: str, state: dict) -> int:
+    """Atomically write state as a checksummed JSON snapshot, returns its size.
+
+    The state must hold only JSON types; loading it never runs code, unlike a pickle.
+    """
+    payload = json.dumps(state, separators=(',', ':')).encode()
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, zlib.crc32(payload), len(payload), time.time())
+
+    snapshot_dir = os.path.dirname(path)
+    if snapshot_dir and not os.path.exists(snapshot_dir):
+        os.makedirs(snapshot_dir)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(header) + len(payload)
+
+
+def read_snapshot(path: str) -> Optional[dict]:
+    """Load a snapshot with a single mapped read, None if missing or corrupt."""
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < SNAPSHOT_HEADER.size:
+                raise ValueError('file is truncated')
+            magic, version, crc, length, written_at = SNAPSHOT_HEADER.unpack_from(mm, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f'unsupported snapshot format {magic!r} v{version}')
+            payload = mm[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length]
+    except (OSError, ValueError) as e:
+        logging.error(f'Unable to read snapshot {path}: {e}')
+        return None
+
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        logging.error(f'Snapshot {path} failed its checksum, ignoring it')
+        return None
+
+    try:
+        state = json.loads(payload)
+    except ValueError as e:
+        logging.error(f'Snapshot {path} is not valid JSON, ignoring it: {e}')
+        return None
+    state['written_at'] = written_at
+    return state
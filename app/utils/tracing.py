@@ -0,0 +1,111 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+
+tracing_state = {'enabled': os.getenv('TRACING_ENABLED', '').lower() in ('1', 'true', 'yes')}
+
+_stats_lock = threading.Lock()
+# span name -> [count, total seconds, max seconds]
+span_stats: dict[str, list] = {}
+recent_spans: deque = deque(maxlen=500)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ('name', 'started_at', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        with _stats_lock:
+            stats = span_stats.get(self.name)
+            if stats is None:
+                span_stats[self.name] = [1, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                if duration > stats[2]:
+                    stats[2] = duration
+            recent_spans.append((self.name, self.started_at, duration, exc_type is not None))
+        return False
+
+
+def span(name: str):
+    """Time a block; a shared no-op when tracing is disabled."""
+    if not tracing_state['enabled']:
+        return NOOP_SPAN
+    return Span(name)
+
+
+def traced(name: str):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracing_state['enabled']:
+                return func(*args, **kwargs)
+            with Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_tracing(enabled: bool) -> None:
+    tracing_state['enabled'] = enabled
+
+
+def get_trace_stats() -> dict:
+    with _stats_lock:
+        spans = {
+            name: {'count': count, 'total': total, 'avg': total / count, 'max': max_}
+            for name, (count, total, max_) in span_stats.items()
+        }
+        recent = [
+            {'name': name, 'started_at': started_at, 'duration': duration, 'error': error}
+            for name, started_at, duration, error in list(recent_spans)[-50:]
+        ]
+    return {'enabled': tracing_state['enabled'], 'spans': spans, 'recent': recent}
+
+
+def sample_profile(seconds: float, interval: float = 0.005) -> str:
+    """Sample every thread's stack and return collapsed stacks for flame graphs."""
+    own_thread = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            frames.append(names.get(thread_id, str(thread_id)))
+            stacks[';'.join(reversed(frames))] += 1
+        time.sleep(interval)
+
+    return '\n'.join(f'{stack} {count}' for stack, count in stacks.most_common())
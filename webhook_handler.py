@@ -1,4 +1,10 @@
+import fcntl
+import json
+import logging
 import subprocess
+import threading
+import time
+from contextlib import contextmanager
 
 from flask import Flask, request, abort
 import hmac
@@ -8,6 +14,54 @@ import os
 app = Flask(__name__)
 
 WEBHOOK_SECRET = os.environ.get('GH_WEBHOOK_SECRET')
+# pushes arriving within this window of each other are deployed once
+DEPLOY_DEBOUNCE_SECONDS = float(os.environ.get('DEPLOY_DEBOUNCE_SECONDS', 10))
+
+# shared by every gunicorn worker process, each process only runs its own debounce thread
+DEPLOY_STATE_PATH = os.environ.get('DEPLOY_STATE_PATH', 'deploy_state.json')
+# held while deploying so two processes never pull and build at once
+DEPLOY_LOCK_PATH = os.environ.get('DEPLOY_LOCK_PATH', 'deploy.lock')
+
+EMPTY_DEPLOY_STATE = {'pending': False, 'running': False, 'requested_at': None, 'last_started': None,
+                      'last_finished': None, 'last_commit': None, 'last_error': None}
+_deploy_requested = threading.Event()
+_worker_lock = threading.Lock()
+_worker = None
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock across processes, released when the block exits."""
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_state():
+    try:
+        with open(DEPLOY_STATE_PATH) as f:
+            return dict(EMPTY_DEPLOY_STATE, **json.load(f))
+    except (OSError, ValueError):
+        return dict(EMPTY_DEPLOY_STATE)
+
+
+def update_state(**fields):
+    """Apply fields to the shared deploy state and return the result."""
+    with file_lock(f'{DEPLOY_STATE_PATH}.lock'):
+        state = _read_state()
+        state.update(fields)
+        with open(f'{DEPLOY_STATE_PATH}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{DEPLOY_STATE_PATH}.tmp', DEPLOY_STATE_PATH)
+        return state
+
+
+def read_state():
+    with file_lock(f'{DEPLOY_STATE_PATH}.lock'):
+        return _read_state()
 
 
 def is_valid_signature(payload_body, signature):
@@ -19,6 +73,54 @@ def is_valid_signature(payload_body, signature):
     return hmac.compare_digest(f'sha256={expected_signature}', signature)
 
 
+def deploy():
+    subprocess.run(['git', 'pull', 'origin', 'main'], check=True)
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True,
+                            capture_output=True, text=True).stdout.strip()
+    # build while the old container keeps serving, then only swap containers
+    subprocess.run(['docker-compose', 'build'], check=True)
+    subprocess.run(['docker-compose', 'up', '-d', '--remove-orphans'], check=True)
+    return commit
+
+
+def deploy_worker():
+    while True:
+        _deploy_requested.wait()
+        _deploy_requested.clear()
+        # wait for the burst of pushes to settle, pushes to any process count
+        while True:
+            quiet_for = time.time() - (read_state()['requested_at'] or 0)
+            if quiet_for >= DEPLOY_DEBOUNCE_SECONDS:
+                break
+            time.sleep(DEPLOY_DEBOUNCE_SECONDS - quiet_for)
+
+        with file_lock(DEPLOY_LOCK_PATH):
+            # another process may have deployed these pushes while we waited for the lock
+            if not read_state()['pending']:
+                continue
+            update_state(pending=False, running=True, last_started=time.time())
+            try:
+                commit = deploy()
+                logging.warning(f'Deployed {commit}')
+                update_state(last_commit=commit, last_error=None)
+            except Exception as e:
+                logging.error(f'Deploy failed: {e}')
+                update_state(last_error=str(e))
+            finally:
+                update_state(running=False, last_finished=time.time())
+
+
+def request_deploy():
+    global _worker
+    update_state(pending=True, requested_at=time.time())
+    with _worker_lock:
+        # started lazily so each gunicorn worker process owns its thread after fork
+        if _worker is None:
+            _worker = threading.Thread(target=deploy_worker, name='deploy-worker', daemon=True)
+            _worker.start()
+    _deploy_requested.set()
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     signature = request.headers.get('X-Hub-Signature-256')
@@ -29,14 +131,20 @@ def webhook():
         abort(401, 'Invalid signature')
 
     if request.json['ref'] == 'refs/heads/main':
-        subprocess.run(['git', 'pull', 'origin', 'main'], check=True)
-        subprocess.run(['docker-compose', 'stop'], check=True)
-        subprocess.run(['docker-compose', 'up', '--build', '-d'], check=True)
-        return 'OK', 200
+        request_deploy()
+        return 'Deploy queued', 202
 
     return 'Not main branch', 200
 
 
+@app.route('/deploy', methods=['GET'])
+def deploy_status():
+    token = request.headers.get('Authorization', '')
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, f'Bearer {WEBHOOK_SECRET}'):
+        abort(401, 'Invalid token')
+    return read_state(), 200
+
+
 @app.route('/health', methods=['GET'])
 def health():
     return {'status': 'OK'}, 200